@@ -0,0 +1,13 @@
+from .engine import BroadcastPayload, BroadcastProgress, BroadcastStream, TokenBucket
+from .jobs import BroadcastJobs, download_media, job_markup, job_status_text
+
+__all__ = [
+    "BroadcastJobs",
+    "BroadcastPayload",
+    "BroadcastProgress",
+    "BroadcastStream",
+    "TokenBucket",
+    "download_media",
+    "job_markup",
+    "job_status_text",
+]
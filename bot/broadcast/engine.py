@@ -0,0 +1,360 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+    TelegramUnauthorizedError,
+)
+from aiogram.types import ContentType, InlineKeyboardButton, InlineKeyboardMarkup, InputFile, Message
+
+logger = logging.getLogger(__name__)
+
+# Content type -> (state key of the file id, Bot method, method argument)
+MEDIA_METHODS = {
+    ContentType.PHOTO: ("photo_id", "send_photo", "photo"),
+    ContentType.VIDEO: ("video_id", "send_video", "video"),
+    ContentType.DOCUMENT: ("document_id", "send_document", "document"),
+    ContentType.AUDIO: ("audio_id", "send_audio", "audio"),
+    ContentType.ANIMATION: ("animation_id", "send_animation", "animation"),
+}
+
+
+class TokenBucket:
+    """Async token bucket: at most rate acquisitions per second, bursts up to capacity.
+
+    pause() stops all acquisitions for a while, e.g. after Telegram answered
+    with RetryAfter, since flood limits apply to the whole bot.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0) -> None:
+        """Initialize with tokens per second and bucket size."""
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for the next seconds."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self) -> None:
+        """Wait for a token, waiters are served in order."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    self._updated = time.monotonic()
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class BroadcastProgress:
+    """Delivery counters of one broadcast stream."""
+
+    def __init__(self, total: int = 0) -> None:
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0  # bot blocked or chat gone, counted in failed as well
+        self.retried = 0
+        self.uploads = 0
+        self.stopped: Optional[str] = None  # why the stream gave up early
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed
+
+    @property
+    def percent(self) -> int:
+        return round(self.processed / self.total * 100) if self.total else 100
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the broadcast started."""
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rate(self) -> float:
+        """Messages handled per second so far."""
+        return self.processed / self.elapsed if self.elapsed > 0 else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "blocked": self.blocked,
+            "retried": self.retried,
+            "uploads": self.uploads,
+            "rate": round(self.rate, 2),
+            "stopped": self.stopped,
+        }
+
+
+class BroadcastPayload:
+    """The message of a broadcast, built from the admin panel's FSM data."""
+
+    def __init__(
+        self,
+        content_type: str,
+        text: Optional[str] = None,
+        caption: Optional[str] = None,
+        file_id: Optional[str] = None,
+        parse_mode: Optional[str] = "HTML",
+        buttons: Optional[List[Dict[str, str]]] = None,
+    ) -> None:
+        self.content_type = content_type
+        self.text = text
+        self.caption = caption
+        self.file_id = file_id
+        self.parse_mode = parse_mode
+        self.buttons = buttons
+        self.keyboard = None
+        if buttons:
+            self.keyboard = InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text=button["text"], url=button["url"])] for button in buttons
+            ])
+
+    @classmethod
+    def from_state(cls, data: Dict[str, Any]) -> "BroadcastPayload":
+        """Build the payload from the data collected by BroadcastForm."""
+        content_type = data["content_type"]
+        file_key = MEDIA_METHODS[content_type][0] if content_type in MEDIA_METHODS else None
+        return cls(
+            content_type=content_type,
+            text=data.get("text"),
+            caption=data.get("caption"),
+            file_id=data.get(file_key) if file_key else None,
+            parse_mode=data.get("parse_mode", "HTML"),
+            buttons=data.get("buttons"),
+        )
+
+    def to_state(self) -> Dict[str, Any]:
+        """Return the payload as BroadcastForm data, the inverse of from_state()."""
+        data = {
+            "content_type": self.content_type,
+            "text": self.text,
+            "caption": self.caption,
+            "parse_mode": self.parse_mode,
+            "buttons": self.buttons,
+        }
+        if self.is_media:
+            data[MEDIA_METHODS[self.content_type][0]] = self.file_id
+        return data
+
+    @property
+    def is_media(self) -> bool:
+        return self.content_type in MEDIA_METHODS
+
+    def file_id_from(self, message: Message) -> Optional[str]:
+        """Return the file id Telegram assigned to the media of a sent payload."""
+        _, _, argument = MEDIA_METHODS[self.content_type]
+        media = getattr(message, argument, None)
+        if isinstance(media, list):  # photo sizes
+            media = media[-1] if media else None
+        return media.file_id if media is not None else None
+
+    async def send(self, bot: Bot, chat_id: int, media: Union[str, InputFile, None] = None) -> Message:
+        """Send the payload to one chat, media is a file id or an upload."""
+        if not self.is_media:
+            return await bot.send_message(
+                chat_id=chat_id, text=self.text, parse_mode=self.parse_mode, reply_markup=self.keyboard
+            )
+        _, method, argument = MEDIA_METHODS[self.content_type]
+        return await getattr(bot, method)(
+            chat_id=chat_id,
+            caption=self.caption,
+            parse_mode=self.parse_mode,
+            reply_markup=self.keyboard,
+            **{argument: media if media is not None else self.file_id},
+        )
+
+
+ProgressCallback = Callable[[BroadcastProgress], Awaitable[Any]]
+OutcomeCallback = Callable[[int, str], Any]  # (chat_id, "sent" / "failed" / "blocked")
+
+
+class BroadcastStream:
+    """Delivers one payload through one bot with a pool of workers.
+
+    Sends are paced by a token bucket at rate messages per second (Telegram
+    allows about 30 per bot); RetryAfter pauses the whole bucket and the
+    chat is retried. Every chat gets a single message, so the per-chat limit
+    is never hit. on_progress is called at most every progress_interval
+    seconds while the stream runs.
+
+    media is the payload's file for this bot: None sends the payload's own
+    file id (valid for the bot it was sent to), a file id is reused as is,
+    and an InputFile is uploaded once - the first successful send's file id
+    is used for every other chat.
+
+    A stream stops on its own when the bot's token is revoked or after
+    max_consecutive_failures errors in a row (blocked chats don't count).
+    Streams of different bots can share a limiter semaphore that bounds
+    the sends in flight across all of them, see BroadcastJobs.
+
+    on_outcome is called with every chat's result, bucket can be passed to
+    keep one budget per bot across several streams of that bot.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        payload: BroadcastPayload,
+        rate: float = 30.0,
+        workers: int = 10,
+        max_retries: int = 3,
+        media: Union[str, InputFile, None] = None,
+        is_cancelled: Optional[Callable[[], bool]] = None,
+        on_progress: Optional[ProgressCallback] = None,
+        progress_interval: float = 3.0,
+        name: Optional[str] = None,
+        limiter: Optional[asyncio.Semaphore] = None,
+        max_consecutive_failures: int = 100,
+        bucket: Optional[TokenBucket] = None,
+        on_outcome: Optional[OutcomeCallback] = None,
+    ) -> None:
+        """Initialize with bot, payload, rate budget, worker count and progress reporting."""
+        self.bot = bot
+        self.name = name or str(bot.id)
+        self.limiter = limiter
+        self.max_consecutive_failures = max_consecutive_failures
+        self._consecutive_failures = 0
+        self._cancelled = False
+        self.payload = payload
+        self.bucket = bucket or TokenBucket(rate)
+        self.on_outcome = on_outcome
+        self.workers = workers
+        self.max_retries = max_retries
+        self.media = media
+        self._is_cancelled = is_cancelled or (lambda: False)
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.progress = BroadcastProgress()
+
+    async def run(self, chat_ids: Iterable[int]) -> BroadcastProgress:
+        """Send to every chat and return the final counters."""
+        chat_ids = list(chat_ids)
+        self.progress.total = len(chat_ids)
+        queue = iter(chat_ids)
+
+        reporter = asyncio.create_task(self._report()) if self.on_progress else None
+        logger.info(f"Broadcast through {self.name} started for {len(chat_ids)} chats")
+        try:
+            if isinstance(self.media, InputFile):
+                await self._upload(queue)
+            await asyncio.gather(*(self._worker(queue) for _ in range(min(self.workers, len(chat_ids)) or 1)))
+        finally:
+            self.progress.finished = time.monotonic()
+            if reporter:
+                reporter.cancel()
+        return self.progress
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """Stop this stream only, chats already being sent finish."""
+        if not self._cancelled:
+            self._cancelled = True
+            self.progress.stopped = reason
+            logger.info(f"Broadcast through {self.name} stopped: {reason}")
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled or self._is_cancelled()
+
+    def _failure(self, chat_id: int, outcome: str = "failed") -> None:
+        self.progress.failed += 1
+        if self.on_outcome:
+            self.on_outcome(chat_id, outcome)
+        if outcome == "blocked":
+            self.progress.blocked += 1
+            return
+        self._consecutive_failures += 1
+        if self.max_consecutive_failures and self._consecutive_failures >= self.max_consecutive_failures:
+            self.cancel(f"{self._consecutive_failures} errors in a row")
+
+    async def _upload(self, queue: Iterator[int]) -> None:
+        """Upload the file with the first deliverable chat and switch to its file id."""
+        for chat_id in queue:
+            if self.is_cancelled():
+                return
+            self.progress.uploads += 1
+            message = await self.deliver(chat_id)
+            file_id = self.payload.file_id_from(message) if message is not None else None
+            if file_id:
+                logger.info(f"Broadcast file uploaded to bot {self.bot.id}, sending by file id")
+                self.media = file_id
+                return
+
+    async def _worker(self, queue: Iterator[int]) -> None:
+        for chat_id in queue:
+            if self.is_cancelled():
+                return
+            await self.deliver(chat_id)
+
+    async def deliver(self, chat_id: int) -> Optional[Message]:
+        """Send to one chat within the rate budget, retrying flood and server errors."""
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                if self.limiter is not None:
+                    async with self.limiter:
+                        message = await self.payload.send(self.bot, chat_id, self.media)
+                else:
+                    message = await self.payload.send(self.bot, chat_id, self.media)
+                self.progress.sent += 1
+                self._consecutive_failures = 0
+                if self.on_outcome:
+                    self.on_outcome(chat_id, "sent")
+                return message
+            except TelegramRetryAfter as e:
+                logger.warning(f"Flood limit for {self.name}, pausing {e.retry_after}s")
+                self.bucket.pause(e.retry_after)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                logger.warning(f"Error sending broadcast to {chat_id} through {self.name}, attempt {attempt + 1}: {e}")
+                await asyncio.sleep(2 ** attempt)
+            except TelegramUnauthorizedError as e:
+                self._failure(chat_id)
+                self.cancel(f"unauthorized: {e}")
+                return None
+            except TelegramForbiddenError as e:
+                self._failure(chat_id, "blocked")
+                logger.debug(f"Broadcast to {chat_id} forbidden: {e}")
+                return None
+            except TelegramBadRequest as e:
+                self._failure(chat_id, "blocked" if "chat not found" in str(e).lower() else "failed")
+                logger.debug(f"Broadcast to {chat_id} rejected: {e}")
+                return None
+            except Exception as e:
+                self._failure(chat_id)
+                logger.error(f"Error sending broadcast to {chat_id} through {self.name}: {e}")
+                return None
+            if attempt < self.max_retries:
+                self.progress.retried += 1
+        self._failure(chat_id)
+        return None
+
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            try:
+                await self.on_progress(self.progress)
+            except Exception as e:
+                logger.error(f"Error reporting broadcast progress: {e}")
+
@@ -0,0 +1,598 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.types import ContentType, FSInputFile, InlineKeyboardButton, InlineKeyboardMarkup
+from sqlalchemy import and_, func, insert, literal, not_, or_, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.webhook import BotPool
+from db import BroadcastDelivery, BroadcastJob, Webhook
+from .engine import BroadcastPayload, BroadcastStream, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("running", "paused")
+OUTCOMES = ("sent", "failed", "blocked")
+FINAL_ACK_ATTEMPTS = 3  # Tries to record a batch's last results before its rows are left to the lease
+
+MEDIA_FILE_NAMES = {
+    ContentType.PHOTO: "photo.jpg",
+    ContentType.VIDEO: "video.mp4",
+    ContentType.DOCUMENT: "document",
+    ContentType.AUDIO: "audio.mp3",
+    ContentType.ANIMATION: "animation.gif",
+}
+
+
+async def download_media(bot: Bot, payload: BroadcastPayload, directory: str) -> str:
+    """Download the broadcast file through the bot it was sent to, return the local path."""
+    os.makedirs(directory, exist_ok=True)
+    file = await bot.get_file(payload.file_id)
+    local_file_path = os.path.join(directory, MEDIA_FILE_NAMES[payload.content_type])
+    await bot.download_file(file.file_path, local_file_path)
+    return local_file_path
+
+
+def job_status_text(job: BroadcastJob) -> str:
+    """Text of the admin's progress message for a job."""
+    title = {
+        "running": f"⏳ <b>Рассылка #{job.id} в процессе...</b>",
+        "paused": f"⏸ <b>Рассылка #{job.id} приостановлена</b>",
+        "cancelled": f"🛑 <b>Рассылка #{job.id} отменена!</b>",
+        "done": f"✅ <b>Рассылка #{job.id} завершена!</b>",
+    }.get(job.status, f"<b>Рассылка #{job.id}</b>")
+    target = "пользователям" if job.target == "users" else "через токены ботов"
+    processed = job.sent + job.failed
+    percent = round(processed / job.total * 100) if job.total else 100
+    return (
+        f"{title}\n\n"
+        f"Отправка {target}, получателей: <b>{job.total}</b>\n"
+        f"Прогресс: <b>{percent}%</b> ({processed}/{job.total})\n"
+        f"✓ Успешно: <b>{job.sent}</b>, ✗ Ошибок: <b>{job.failed}</b>"
+    )
+
+
+def job_markup(job: BroadcastJob) -> Optional[InlineKeyboardMarkup]:
+    """Pause or resume and cancel buttons, None once the job is over."""
+    if job.status not in ACTIVE_STATUSES:
+        return None
+    if job.status == "running":
+        toggle = InlineKeyboardButton(text="⏸ Приостановить", callback_data=f"broadcast_pause:{job.id}")
+    else:
+        toggle = InlineKeyboardButton(text="▶️ Продолжить", callback_data=f"broadcast_resume:{job.id}")
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [toggle],
+        [InlineKeyboardButton(text="❌ Отменить рассылку", callback_data=f"broadcast_stop:{job.id}")],
+    ])
+
+
+class BroadcastJobs:
+    """Broadcast jobs kept in the database and worked on by every process.
+
+    A job's recipients are rows of broadcast_deliveries, one per (bot, user).
+    Each process polls for running jobs and, per bot, claims batches of
+    pending rows with SELECT ... FOR UPDATE SKIP LOCKED, so several processes
+    share a job without sending twice. Results are acknowledged every
+    ack_interval seconds; rows a process claimed but never acknowledged
+    (crash, deploy, a database error on the last acknowledgement) are claimed
+    again after lease seconds, so a job resumes from the last acknowledged
+    recipient. Only unsent rows are handed back early. Pause and cancel are job statuses,
+    every process sees them on its next poll.
+
+    Rate limits are per bot: this process sends at most rate messages per
+    second through one bot, across all jobs, so rate should be the bot's
+    budget divided by the number of processes.
+    """
+
+    def __init__(
+        self,
+        session_pool: async_sessionmaker,
+        bot_pool: BotPool,
+        main_bot: Bot,
+        rate: float = 30.0,
+        workers: int = 10,
+        batch_size: int = 200,
+        lease: float = 300,
+        poll_interval: float = 2.0,
+        ack_interval: float = 1.0,
+        max_streams: int = 20,
+        max_senders: int = 100,
+        progress_interval: float = 3.0,
+        shutdown_timeout: float = 10.0,
+    ) -> None:
+        """Initialize with session and bot pools, per-bot rate, batch size, claim lease and polling."""
+        self._session_pool = session_pool
+        self.bot_pool = bot_pool
+        self.main_bot = main_bot
+        self.rate = rate
+        self.workers = workers
+        self.batch_size = batch_size
+        self.lease = timedelta(seconds=lease)
+        self.poll_interval = poll_interval
+        self.ack_interval = ack_interval
+        self.progress_interval = progress_interval
+        self.shutdown_timeout = shutdown_timeout
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[-64:]
+
+        self._streams = asyncio.Semaphore(max_streams)
+        self.limiter = asyncio.Semaphore(max_senders)  # Sends in flight across all bots
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._statuses: Dict[int, str] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._media: Dict[Tuple[int, int], str] = {}  # (job, bot) -> file id uploaded to that bot
+        self._outcomes: Dict[Tuple[int, int], Dict[int, str]] = {}  # (job, bot) -> results not acknowledged yet
+        self._files: Dict[int, str] = {}  # job -> downloaded media directory
+        self._download_lock = asyncio.Lock()
+        self._reported: Dict[int, float] = {}
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+        # Counters exported through stats()
+        self.claimed = 0
+        self.acknowledged = 0
+        self.released = 0
+        self.finished = 0
+
+    def register(self, app: web.Application) -> None:
+        """Pick up running jobs on startup, hand back unsent claims on shutdown."""
+        app.on_startup.append(self._on_startup)
+        app.on_shutdown.append(self._on_shutdown)
+
+    async def _on_startup(self, app: web.Application) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def _on_shutdown(self, app: web.Application) -> None:
+        self._stopping = True
+        if self._task:
+            self._task.cancel()
+            # A poll cut off mid-query must have closed its session before the release writes
+            await asyncio.gather(self._task, return_exceptions=True)
+        tasks = list(self._tasks.values())
+        if tasks:
+            # Streams see _stopping and return after the sends in flight
+            _, pending = await asyncio.wait(tasks, timeout=self.shutdown_timeout)
+            for task in pending:
+                task.cancel()
+            # A cancelled acknowledgement must be over before its rows are looked at
+            await asyncio.gather(*pending, return_exceptions=True)
+        # Rows sent without a recorded result stay claimed until the lease expires
+        unacknowledged = [
+            and_(BroadcastDelivery.job_id == job_id, BroadcastDelivery.bot_id == bot_id,
+                 BroadcastDelivery.user_id.in_(list(outcomes)))
+            for (job_id, bot_id), outcomes in self._outcomes.items() if outcomes
+        ]
+        try:
+            async with self._session_pool() as session:
+                result = await session.execute(
+                    update(BroadcastDelivery)
+                    .where(BroadcastDelivery.claimed_by == self.worker_id, BroadcastDelivery.status == "claimed")
+                    .where(*(not_(condition) for condition in unacknowledged))
+                    .values(status="pending", claimed_by=None, claimed_at=None)
+                )
+                await session.commit()
+            self.released += result.rowcount
+        except Exception as e:
+            logger.error(f"Error releasing broadcast claims: {e}")
+        for job_id in list(self._files):
+            self._cleanup(job_id)
+
+    async def create(
+        self,
+        admin_id: int,
+        target: str,
+        payload: BroadcastPayload,
+        recipients: Any,
+        status_chat_id: Optional[int] = None,
+        status_message_id: Optional[int] = None,
+    ) -> BroadcastJob:
+        """Create a running job, recipients is a SELECT of (bot_id, user_id) rows."""
+        recipients = recipients.subquery()
+        async with self._session_pool() as session:
+            job = BroadcastJob(
+                admin_id=admin_id,
+                target=target,
+                payload=json.dumps(payload.to_state()),
+                status="running",
+                status_chat_id=status_chat_id,
+                status_message_id=status_message_id,
+            )
+            session.add(job)
+            await session.flush()
+            # Copied inside the database, audiences never pass through the process
+            await session.execute(
+                insert(BroadcastDelivery).from_select(
+                    ["job_id", "bot_id", "user_id", "status"],
+                    select(literal(job.id), recipients.c.bot_id, recipients.c.user_id, literal("pending")),
+                )
+            )
+            job.total = await session.scalar(
+                select(func.count()).select_from(BroadcastDelivery).where(BroadcastDelivery.job_id == job.id)
+            )
+            await session.commit()
+        logger.info(f"Broadcast job {job.id} created for {job.total} deliveries")
+        self._wake.set()
+        return job
+
+    async def get(self, job_id: int) -> Optional[BroadcastJob]:
+        async with self._session_pool() as session:
+            return await session.get(BroadcastJob, job_id)
+
+    async def pause(self, job_id: int) -> bool:
+        return await self._set_status(job_id, "paused", ("running",))
+
+    async def resume(self, job_id: int) -> bool:
+        return await self._set_status(job_id, "running", ("paused",))
+
+    async def cancel(self, job_id: int) -> bool:
+        """Stop a job for good, recipients not reached yet stay pending as a record."""
+        return await self._set_status(job_id, "cancelled", ACTIVE_STATUSES)
+
+    async def _set_status(self, job_id: int, status: str, current: Tuple[str, ...]) -> bool:
+        values: Dict[str, Any] = {"status": status}
+        if status not in ACTIVE_STATUSES:
+            values["finished_at"] = datetime.utcnow()
+        async with self._session_pool() as session:
+            result = await session.execute(
+                update(BroadcastJob).where(BroadcastJob.id == job_id, BroadcastJob.status.in_(current)).values(**values)
+            )
+            await session.commit()
+        if result.rowcount == 0:
+            return False
+        logger.info(f"Broadcast job {job_id} is {status}")
+        self._statuses[job_id] = status
+        self._wake.set()
+        return True
+
+    async def _run(self) -> None:
+        # Checked as well as cancelled, wait_for may swallow a cancellation that races its timeout
+        while not self._stopping:
+            try:
+                await self._poll()
+            except Exception as e:
+                logger.exception(f"Error polling broadcast jobs: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _poll(self) -> None:
+        async with self._session_pool() as session:
+            rows = (await session.execute(
+                select(BroadcastJob.id, BroadcastJob.status).where(
+                    or_(BroadcastJob.status.in_(ACTIVE_STATUSES), BroadcastJob.id.in_(list(self._tasks)))
+                )
+            )).all()
+        self._statuses = {job_id: status for job_id, status in rows}
+
+        for job_id in list(self._files):
+            if self._statuses.get(job_id) not in ACTIVE_STATUSES and job_id not in self._tasks:
+                self._cleanup(job_id)
+        for job_id, status in rows:
+            if status == "running" and job_id not in self._tasks and not self._stopping:
+                self._tasks[job_id] = asyncio.create_task(self._process(job_id))
+                self._tasks[job_id].add_done_callback(lambda task, job_id=job_id: self._tasks.pop(job_id, None))
+
+    def _stopped(self, job_id: int) -> bool:
+        return self._stopping or self._statuses.get(job_id) != "running"
+
+    def _claimable(self, job_id: int):
+        return and_(
+            BroadcastDelivery.job_id == job_id,
+            or_(
+                BroadcastDelivery.status == "pending",
+                and_(
+                    BroadcastDelivery.status == "claimed",
+                    BroadcastDelivery.claimed_at < datetime.utcnow() - self.lease,
+                ),
+            ),
+        )
+
+    async def _process(self, job_id: int) -> None:
+        """Work on a job in this process until it has nothing left to claim or is stopped."""
+        try:
+            job = await self.get(job_id)
+            payload = BroadcastPayload.from_state(json.loads(job.payload))
+            async with self._session_pool() as session:
+                bot_ids = (await session.execute(
+                    select(BroadcastDelivery.bot_id).where(self._claimable(job_id)).distinct()
+                )).scalars().all()
+            bots = await self._bots(bot_ids)
+
+            await asyncio.gather(*(
+                self._deliver_through(job, payload, bot_id, bots.get(bot_id)) for bot_id in bot_ids
+            ))
+            if not self._stopped(job_id):
+                await self._finish(job_id)
+        except Exception as e:
+            logger.exception(f"Error processing broadcast job {job_id}: {e}")
+
+    async def _bots(self, bot_ids: List[int]) -> Dict[int, Bot]:
+        bots = {self.main_bot.id: self.main_bot}
+        mirror_ids = [bot_id for bot_id in bot_ids if bot_id != self.main_bot.id]
+        if mirror_ids:
+            async with self._session_pool() as session:
+                rows = (await session.execute(
+                    select(Webhook.bot_id, Webhook.token).where(Webhook.bot_id.in_(mirror_ids))
+                )).all()
+            for bot_id, token in rows:
+                # Pooled instance, shares the main bot's session
+                bots[bot_id] = self.bot_pool.get(token)
+        return bots
+
+    async def _media_for(self, job: BroadcastJob, payload: BroadcastPayload, bot_id: int) -> Any:
+        """The payload's file for one bot: its own file id, or an upload of the downloaded file."""
+        if not payload.is_media or bot_id == self.main_bot.id:
+            return None
+        file_id = self._media.get((job.id, bot_id))
+        if file_id:
+            return file_id
+        async with self._download_lock:
+            if job.id not in self._files:
+                directory = f"temp_broadcast_job_{job.id}_{os.getpid()}"
+                self._files[job.id] = await download_media(self.main_bot, payload, directory)
+        return FSInputFile(self._files[job.id])
+
+    def _cleanup(self, job_id: int) -> None:
+        path = self._files.pop(job_id, None)
+        if path and os.path.exists(os.path.dirname(path)):
+            shutil.rmtree(os.path.dirname(path))
+        for key in [key for key in self._media if key[0] == job_id]:
+            del self._media[key]
+        self._reported.pop(job_id, None)
+
+    def _bucket(self, bot_id: int) -> TokenBucket:
+        bucket = self._buckets.get(bot_id)
+        if bucket is None:
+            bucket = self._buckets[bot_id] = TokenBucket(self.rate)
+        return bucket
+
+    async def _deliver_through(self, job: BroadcastJob, payload: BroadcastPayload, bot_id: int,
+                               bot: Optional[Bot]) -> None:
+        """Claim and send batches of one bot's recipients."""
+        if bot is None:
+            await self._skip_bot(job.id, bot_id, "bot not found")
+            return
+        async with self._streams:
+            try:
+                media = await self._media_for(job, payload, bot_id)
+                while not self._stopped(job.id):
+                    chat_ids = await self._claim(job.id, bot_id)
+                    if not chat_ids:
+                        # Last try for results a failed acknowledgement left behind, after that
+                        # their rows are sent again once the lease expires
+                        leftover = self._outcomes.get((job.id, bot_id))
+                        if leftover and not await self._ack(job.id, bot_id, leftover):
+                            logger.error(f"Broadcast job {job.id} leaves {len(leftover)} deliveries of bot {bot_id} "
+                                         f"to the lease")
+                        self._outcomes.pop((job.id, bot_id), None)
+                        return
+                    # Results a failed acknowledgement left behind are retried with this batch's
+                    outcomes = self._outcomes.setdefault((job.id, bot_id), {})
+                    stream = BroadcastStream(
+                        bot,
+                        payload,
+                        workers=self.workers,
+                        media=media,
+                        is_cancelled=lambda: self._stopped(job.id),
+                        name=f"{bot_id} (job {job.id})",
+                        limiter=self.limiter,
+                        bucket=self._bucket(bot_id),
+                        on_outcome=outcomes.__setitem__,
+                    )
+                    done = asyncio.Event()
+                    acknowledger = asyncio.create_task(self._acknowledge(job.id, bot_id, outcomes, done))
+                    try:
+                        await stream.run(chat_ids)
+                    finally:
+                        done.set()
+                        await acknowledger
+                        await self._release(job.id, bot_id, unacknowledged=list(outcomes))
+                        if not outcomes:
+                            self._outcomes.pop((job.id, bot_id), None)
+
+                    if isinstance(stream.media, str):
+                        media = self._media[(job.id, bot_id)] = stream.media
+                    if stream.progress.stopped:
+                        # Token revoked or every send failing, the rest of this bot's audience is skipped
+                        await self._skip_bot(job.id, bot_id, stream.progress.stopped)
+                        return
+                    await self._report(job.id)
+            except Exception as e:
+                logger.exception(f"Error broadcasting job {job.id} through bot {bot_id}: {e}")
+
+    def _owned(self, job_id: int, bot_id: int):
+        return and_(
+            BroadcastDelivery.job_id == job_id,
+            BroadcastDelivery.bot_id == bot_id,
+            BroadcastDelivery.status == "claimed",
+            BroadcastDelivery.claimed_by == self.worker_id,
+        )
+
+    async def _claim(self, job_id: int, bot_id: int) -> List[int]:
+        """Claim the next batch of a bot's recipients, in user id order."""
+        async with self._session_pool() as session:
+            candidates = (await session.execute(
+                select(BroadcastDelivery.user_id)
+                .where(self._claimable(job_id), BroadcastDelivery.bot_id == bot_id)
+                .order_by(BroadcastDelivery.user_id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )).scalars().all()
+            if not candidates:
+                return []
+            # The condition is repeated for databases without row locks, where
+            # another process may have claimed some of the candidates meanwhile
+            await session.execute(
+                update(BroadcastDelivery)
+                .where(
+                    self._claimable(job_id),
+                    BroadcastDelivery.bot_id == bot_id,
+                    BroadcastDelivery.user_id.in_(candidates),
+                )
+                .values(status="claimed", claimed_by=self.worker_id, claimed_at=datetime.utcnow())
+            )
+            # Earlier batches of this bot were acknowledged or released, these are the new claims
+            # apart from rows sent whose results are still waiting to be acknowledged
+            owned = self._owned(job_id, bot_id)
+            unacknowledged = list(self._outcomes.get((job_id, bot_id), ()))
+            if unacknowledged:
+                owned = and_(owned, BroadcastDelivery.user_id.not_in(unacknowledged))
+            chat_ids = (await session.execute(
+                select(BroadcastDelivery.user_id)
+                .where(owned)
+                .order_by(BroadcastDelivery.user_id)
+            )).scalars().all()
+            await session.commit()
+        self.claimed += len(chat_ids)
+        return list(chat_ids)
+
+    async def _acknowledge(self, job_id: int, bot_id: int, outcomes: Dict[int, str], done: asyncio.Event) -> None:
+        while not done.is_set():
+            try:
+                await asyncio.wait_for(done.wait(), self.ack_interval)
+            except asyncio.TimeoutError:
+                await self._ack(job_id, bot_id, outcomes)
+        # The batch is over, its last results decide which rows may be handed back
+        for attempt in range(FINAL_ACK_ATTEMPTS):
+            if await self._ack(job_id, bot_id, outcomes):
+                return
+            await asyncio.sleep(self.ack_interval * (attempt + 1))
+        logger.error(
+            f"Broadcast job {job_id} keeps {len(outcomes)} unacknowledged deliveries of bot {bot_id} "
+            f"claimed until the lease expires"
+        )
+
+    async def _ack(self, job_id: int, bot_id: int, outcomes: Dict[int, str]) -> bool:
+        """Record the results collected so far and add them to the job's counters, False if that failed."""
+        if not outcomes:
+            return True
+        # The batch stays in outcomes until it is committed, so it is never released as unsent
+        batch = dict(outcomes)
+        by_outcome: Dict[str, List[int]] = {outcome: [] for outcome in OUTCOMES}
+        for chat_id, outcome in batch.items():
+            by_outcome[outcome].append(chat_id)
+        counts = dict.fromkeys(OUTCOMES, 0)
+        try:
+            async with self._session_pool() as session:
+                for outcome, chat_ids in by_outcome.items():
+                    if chat_ids:
+                        # Only rows still claimed by this process, an expired claim may have moved on
+                        result = await session.execute(
+                            update(BroadcastDelivery)
+                            .where(self._owned(job_id, bot_id), BroadcastDelivery.user_id.in_(chat_ids))
+                            .values(status=outcome)
+                        )
+                        counts[outcome] = result.rowcount
+                # Failed includes blocked, as in BroadcastProgress
+                await session.execute(
+                    update(BroadcastJob)
+                    .where(BroadcastJob.id == job_id)
+                    .values(
+                        sent=BroadcastJob.sent + counts["sent"],
+                        failed=BroadcastJob.failed + counts["failed"] + counts["blocked"],
+                        blocked=BroadcastJob.blocked + counts["blocked"],
+                    )
+                )
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Error acknowledging {len(batch)} broadcast deliveries of job {job_id}: {e}")
+            # Kept for the next attempt, if that never comes the claim expires and the rows are sent again
+            return False
+        for chat_id in batch:
+            outcomes.pop(chat_id, None)
+        self.acknowledged += sum(counts.values())
+        return True
+
+    async def _release(self, job_id: int, bot_id: int, unacknowledged: Sequence[int] = ()) -> None:
+        """Hand back claimed rows this process did not send, e.g. after a pause.
+
+        Rows in unacknowledged were sent but their results are not recorded,
+        they stay claimed so only the lease expiry sends them again.
+        """
+        condition = self._owned(job_id, bot_id)
+        if unacknowledged:
+            condition = and_(condition, BroadcastDelivery.user_id.not_in(unacknowledged))
+        async with self._session_pool() as session:
+            result = await session.execute(
+                update(BroadcastDelivery)
+                .where(condition)
+                .values(status="pending", claimed_by=None, claimed_at=None)
+            )
+            await session.commit()
+        self.released += result.rowcount
+
+    async def _skip_bot(self, job_id: int, bot_id: int, reason: str) -> None:
+        async with self._session_pool() as session:
+            result = await session.execute(
+                update(BroadcastDelivery)
+                .where(
+                    BroadcastDelivery.job_id == job_id,
+                    BroadcastDelivery.bot_id == bot_id,
+                    BroadcastDelivery.status == "pending",
+                )
+                .values(status="failed")
+            )
+            await session.execute(
+                update(BroadcastJob).where(BroadcastJob.id == job_id).values(failed=BroadcastJob.failed + result.rowcount)
+            )
+            await session.commit()
+        logger.warning(f"Broadcast job {job_id} skips {result.rowcount} recipients of bot {bot_id}: {reason}")
+
+    async def _finish(self, job_id: int) -> None:
+        """Mark the job done once no process has anything left to send."""
+        async with self._session_pool() as session:
+            remaining = await session.scalar(
+                select(func.count()).select_from(BroadcastDelivery).where(
+                    BroadcastDelivery.job_id == job_id, BroadcastDelivery.status.in_(("pending", "claimed"))
+                )
+            )
+        if remaining:
+            return
+        # Only one process wins the update and sends the final report
+        if await self._set_status(job_id, "done", ("running",)):
+            self.finished += 1
+            await self._report(job_id, force=True)
+
+    async def _report(self, job_id: int, force: bool = False) -> None:
+        """Update the admin's progress message, at most every progress_interval seconds."""
+        now = time.monotonic()
+        if not force and now - self._reported.get(job_id, 0.0) < self.progress_interval:
+            return
+        self._reported[job_id] = now
+        job = await self.get(job_id)
+        if job is None or job.status_message_id is None:
+            return
+        try:
+            await self.main_bot.edit_message_text(
+                chat_id=job.status_chat_id,
+                message_id=job.status_message_id,
+                text=job_status_text(job),
+                parse_mode="HTML",
+                reply_markup=job_markup(job),
+            )
+        except Exception as e:
+            # Other processes edit the same message, "message is not modified" is expected
+            logger.debug(f"Error updating status of broadcast job {job_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return this process's jobs and delivery counters."""
+        return {
+            "worker": self.worker_id,
+            "jobs": len(self._tasks),
+            "claimed": self.claimed,
+            "acknowledged": self.acknowledged,
+            "released": self.released,
+            "finished": self.finished,
+        }
@@ -21,11 +21,12 @@ from aiogram.types import (
 )
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from sqlalchemy import select
+from sqlalchemy import BigInteger, literal, select, union
 from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.exceptions import TelegramBadRequest
 
-from db import Spyusers, Webhook
+from db import BotAudience, BusinessConnections, Spyusers, Webhook
+from bot.broadcast import BroadcastJobs, BroadcastPayload, job_markup, job_status_text
 from config import ADMIN
 
 
@@ -44,9 +45,6 @@ def board_router() -> Router:
         preview = State()                # Preview message before sending
         confirm = State()                # Confirm sending
 
-    # Storage for cancel flags 
-    cancel_flags = {}
-    
     @router.callback_query(F.data == "board")
     async def start_broadcast(clb: CallbackQuery, state: FSMContext):
         """Start the broadcast creation process."""
@@ -154,13 +152,15 @@ def board_router() -> Router:
             logger.error(f"Error retrieving webhooks from database: {e}")
             return []
 
-    async def get_all_bots(session: AsyncSession) -> List[Tuple[str, str, str]]:
-        """Get all bot tokens and webhook URLs from the database."""
+    async def get_all_bots(session: AsyncSession) -> List[Tuple[int, str, str, str]]:
+        """Get all bot ids, tokens and webhook URLs from the database."""
         try:
             # Query all bots with their tokens and webhook URLs
-            query = select(Webhook.bot_username, Webhook.token, Webhook.webhook_url).where(Webhook.token.isnot(None))
+            query = select(Webhook.bot_id, Webhook.bot_username, Webhook.token, Webhook.webhook_url).where(
+                Webhook.token.isnot(None)
+            )
             result = await session.execute(query)
-            bots = [(row[0], row[1], row[2]) for row in result.fetchall()]
+            bots = [(row[0], row[1], row[2], row[3]) for row in result.fetchall()]
             
             logger.info(f"Retrieved {len(bots)} bots from database")
             if not bots:
@@ -183,11 +183,14 @@ def board_router() -> Router:
             )
         await clb.answer()
 
-    async def get_all_user_ids(session: AsyncSession) -> List[int]:
-        """Get all user IDs from the database."""
-        query = select(Spyusers.user_id)
-        result = await session.execute(query)
-        return [row[0] for row in result.fetchall()]
+    def bot_audience_query(bot_ids: List[int]):
+        """Select (bot_id, user_id) of each bot's users: who started it, plus owners of its business connections."""
+        return union(
+            select(BotAudience.bot_id, BotAudience.user_id).where(BotAudience.bot_id.in_(bot_ids)),
+            select(BusinessConnections.bot_id, BusinessConnections.user_id).where(
+                BusinessConnections.bot_id.in_(bot_ids)
+            ),
+        )
 
     async def auto_format_html(text: str) -> str:
         """Convert markdown-like syntax to HTML."""
@@ -471,377 +474,41 @@ def board_router() -> Router:
         await state.set_state(BroadcastForm.confirm)
 
     @router.callback_query(F.data == "broadcast_confirm", BroadcastForm.confirm)
-    async def confirm_broadcast(clb: CallbackQuery, state: FSMContext, bot: Bot, session: AsyncSession):
-        """Start broadcasting the message with optimized performance."""
-        user_id = clb.from_user.id
-        cancel_flags[user_id] = False
-        
-        # Get broadcast data
+    async def confirm_broadcast(clb: CallbackQuery, state: FSMContext, bot: Bot, session: AsyncSession,
+                                broadcast_jobs: BroadcastJobs):
+        """Start broadcasting as a job, every worker process picks it up and it survives restarts."""
         data = await state.get_data()
+        payload = BroadcastPayload.from_state(data)
         broadcast_type = data.get("broadcast_type", "users")
-        
+
         if broadcast_type == "webhooks":
-            # Send directly to mirror bots using their tokens instead of webhooks
-            await broadcast_to_mirror_bots(clb, state, bot, session)
+            # Send directly through the mirror bots' tokens, each only to its own audience
+            all_bots = await get_all_bots(session)
+            if not all_bots:
+                await clb.message.edit_text("❌ Не найдено ни одного бота для рассылки.")
+                await state.clear()
+                return
+            target = "mirrors"
+            recipients = bot_audience_query([bot_id for bot_id, *_ in all_bots])
         else:
-            # Send to users only through the main bot (default)
-            await broadcast_to_users(clb, state, bot, session)
-        
-        await clb.answer()
-
-    async def broadcast_to_mirror_bots(clb: CallbackQuery, state: FSMContext, main_bot: Bot, session: AsyncSession):
-        user_id = clb.from_user.id
-        cancel_flags[user_id] = False
-        
-        # Get broadcast data
-        data = await state.get_data()
-        
-        # Get all bot tokens from database
-        all_bots = await get_all_bots(session)
-        total_bots = len(all_bots)
-        
-        if total_bots == 0:
-            await clb.message.edit_text("❌ Не найдено ни одного бота для рассылки.")
-            await state.clear()
-            return
-        
-        # Create status message
-        status_message = await clb.message.answer(
-            "⏳ <b>Отправка через токены ботов начата...</b>\n\n"
-            f"Всего ботов: <b>{total_bots}</b>\n"
-            f"Прогресс: <b>0%</b> (0/{total_bots})",
-            parse_mode="HTML",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="❌ Отменить рассылку", callback_data="cancel_broadcast")]
-            ])
-        )
-        
-        # Content type and buttons
-        content_type = data.get("content_type")
-        buttons = data.get("buttons", [])
-        
-        # Prepare keyboard if buttons exist
-        keyboard = None
-        if buttons:
-            keyboard_buttons = []
-            for button in buttons:
-                keyboard_buttons.append([InlineKeyboardButton(
-                    text=button["text"], 
-                    url=button["url"]
-                )])
-            keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
-        
-        # Create temporary folder for media
-        media_path = f"temp_broadcast_{user_id}_{int(time.time())}"
-        local_file_path = None
-
-        try:
-            if content_type != ContentType.TEXT:
-                if not os.path.exists(media_path):
-                    os.makedirs(media_path)
-                try:
-                    if content_type == ContentType.PHOTO:
-                        file = await main_bot.get_file(data["photo_id"])
-                        local_file_path = os.path.join(media_path, "photo.jpg")
-                        await main_bot.download_file(file.file_path, local_file_path)
-                    elif content_type == ContentType.VIDEO:
-                        file = await main_bot.get_file(data["video_id"])
-                        local_file_path = os.path.join(media_path, "video.mp4")
-                        await main_bot.download_file(file.file_path, local_file_path)
-                    elif content_type == ContentType.DOCUMENT:
-                        file = await main_bot.get_file(data["document_id"])
-                        local_file_path = os.path.join(media_path, "document")
-                        await main_bot.download_file(file.file_path, local_file_path)
-                    elif content_type == ContentType.AUDIO:
-                        file = await main_bot.get_file(data["audio_id"])
-                        local_file_path = os.path.join(media_path, "audio.mp3")
-                        await main_bot.download_file(file.file_path, local_file_path)
-                    elif content_type == ContentType.ANIMATION:
-                        file = await main_bot.get_file(data["animation_id"])
-                        local_file_path = os.path.join(media_path, "animation.gif")
-                        await main_bot.download_file(file.file_path, local_file_path)
-
-                except Exception as e:
-                    logger.error(f"Error downloading media: {e}")
-                    await status_message.edit_text(
-                        f"❌ <b>Ошибка при загрузке медиафайла:</b> {str(e)}\nРассылка отменена.",
-                        parse_mode="HTML"
-                    )
-                    if os.path.exists(media_path):
-                        shutil.rmtree(media_path)
-                    await state.clear()
-                    return
-
-            # Start sending through each bot token
-            processed_count = 0
-            successful_count = 0
-            failed_count = 0
-            
-            # Get all user IDs
-            all_user_ids = await get_all_user_ids(session)
-            total_users = len(all_user_ids)
-
-            for bot_username, bot_token, _ in all_bots:
-                # Check if broadcast was canceled
-                if cancel_flags.get(user_id, False):
-                    break
-                
-                try:
-                    # Create bot instance with token
-                    mirror_bot = Bot(token=bot_token, session=main_bot.session)
-                    logger.info(f"Created Bot instance for @{bot_username}")
-                    
-                    # Send message to each user ID
-                    if content_type == ContentType.TEXT:
-                        for uid in all_user_ids:
-                            if cancel_flags.get(user_id, False):
-                                break
-                            try:
-                                await mirror_bot.send_message(
-                                    chat_id=uid,
-                                    text=data["text"],
-                                    parse_mode=data["parse_mode"],
-                                    reply_markup=keyboard
-                                )
-                                successful_count += 1
-                                logger.info(f"Successfully sent message to user {uid} through bot @{bot_username}")
-                            except Exception as e:
-                                failed_count += 1
-                                logger.error(f"Error sending to user {uid} through bot @{bot_username}: {e}")
-                            await asyncio.sleep(1/15)
-                    elif local_file_path and os.path.exists(local_file_path):
-                        # Open the file once per bot
-                        input_file = FSInputFile(local_file_path)
-                        for uid in all_user_ids:
-                            if cancel_flags.get(user_id, False):
-                                break
-                            try:
-                                if content_type == ContentType.PHOTO:
-                                    await mirror_bot.send_photo(
-                                        chat_id=uid,
-                                        photo=input_file,
-                                        caption=data["caption"],
-                                        parse_mode=data["parse_mode"],
-                                        reply_markup=keyboard
-                                    )
-                                elif content_type == ContentType.VIDEO:
-                                    await mirror_bot.send_video(
-                                        chat_id=uid,
-                                        video=input_file,
-                                        caption=data["caption"],
-                                        parse_mode=data["parse_mode"],
-                                        reply_markup=keyboard
-                                    )
-                                elif content_type == ContentType.DOCUMENT:
-                                    await mirror_bot.send_document(
-                                        chat_id=uid,
-                                        document=input_file,
-                                        caption=data["caption"],
-                                        parse_mode=data["parse_mode"],
-                                        reply_markup=keyboard
-                                    )
-                                elif content_type == ContentType.AUDIO:
-                                    await mirror_bot.send_audio(
-                                        chat_id=uid,
-                                        audio=input_file,
-                                        caption=data["caption"],
-                                        parse_mode=data["parse_mode"],
-                                        reply_markup=keyboard
-                                    )
-                                elif content_type == ContentType.ANIMATION:
-                                    await mirror_bot.send_animation(
-                                        chat_id=uid,
-                                        animation=input_file,
-                                        caption=data["caption"],
-                                        parse_mode=data["parse_mode"],
-                                        reply_markup=keyboard
-                                    )
-                                successful_count += 1
-                                logger.info(f"Successfully sent message to user {uid} through bot @{bot_username}")
-                            except Exception as e:
-                                failed_count += 1
-                                logger.error(f"Error sending to user {uid} through bot @{bot_username}: {e}")
-                            await asyncio.sleep(1/15)
-                    
-                    # Clean up the bot instance
-                    await mirror_bot.session.close()
-                    
-                except Exception as e:
-                    failed_count += 1
-                    logger.error(f"Failed to create Bot instance for @{bot_username}: {e}")
-                
-                processed_count += 1
-                
-                # Update progress after each bot
-                percent = round((processed_count / total_bots) * 100)
-                try:
-                    await status_message.edit_text(
-                        f"⏳ <b>Отправка через токены ботов в процессе...</b>\n\n"
-                        f"Всего ботов: <b>{total_bots}</b>\n"
-                        f"Прогресс: <b>{percent}%</b> ({processed_count}/{total_bots})\n"
-                        f"✓ Успешно: <b>{successful_count}</b>, ✗ Ошибок: <b>{failed_count}</b>\n\n"
-                        "<i>Для отмены нажмите кнопку ниже</i>",
-                        parse_mode="HTML",
-                        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                            [InlineKeyboardButton(text="❌ Отменить рассылку", callback_data="cancel_broadcast")]
-                        ])
-                    )
-                except Exception as e:
-                    logger.error(f"Error updating status: {e}")
-            
-            # Final status for the broadcast
-            if not cancel_flags.get(user_id, False):
-                await status_message.edit_text(
-                    "✅ <b>Отправка через токены ботов завершена!</b>\n\n"
-                    f"Всего ботов: <b>{total_bots}</b>\n"
-                    f"✓ Успешно: <b>{successful_count}</b>, ✗ Ошибок: <b>{failed_count}</b>",
-                    parse_mode="HTML"
-                )
-            else:
-                await status_message.edit_text(
-                    "🛑 <b>Отправка через токены ботов отменена!</b>\n\n"
-                    f"Всего ботов: <b>{total_bots}</b>\n"
-                    f"✓ Успешно: <b>{successful_count}</b>, ✗ Ошибок: <b>{failed_count}</b>",
-                    parse_mode="HTML"
-                )
-            
-        finally:
-            if os.path.exists(media_path):
-                shutil.rmtree(media_path)
-            logger.info(f"Cleaned up temporary media directory: {media_path}")
-            del cancel_flags[user_id]
-            await state.clear()
-
-    async def broadcast_to_users(clb: CallbackQuery, state: FSMContext, main_bot: Bot, session: AsyncSession):
-        user_id = clb.from_user.id
-        cancel_flags[user_id] = False
-        data = await state.get_data()
-        content_type = data["content_type"]
-        buttons = data.get("buttons", [])
-        keyboard = None
-        if buttons:
-            keyboard_buttons = [
-                [InlineKeyboardButton(text=btn["text"], url=btn["url"])] 
-                for btn in buttons
-            ]
-            keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
-
-        # Prepare a status message
-        status_message = await clb.message.answer(
-            "⏳ <b>Отправка рассылки пользователям...</b>\n\n"
-            "Прогресс: <b>0%</b>",
-            parse_mode="HTML",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="❌ Отменить рассылку", callback_data="cancel_broadcast")]
-            ])
+            # Send to users only through the main bot (default), its file id is sent as is
+            target = "users"
+            recipients = select(
+                literal(bot.id, BigInteger).label("bot_id"), Spyusers.user_id.label("user_id")
+            ).distinct()
+
+        status_message = await clb.message.answer("⏳ <b>Подготовка рассылки...</b>", parse_mode="HTML")
+        job = await broadcast_jobs.create(
+            clb.from_user.id,
+            target,
+            payload,
+            recipients,
+            status_chat_id=status_message.chat.id,
+            status_message_id=status_message.message_id,
         )
-
-        # Prepare media path
-        media_path = f"temp_broadcast_{user_id}_{int(time.time())}"
-        local_file_path = None
-        try:
-            if content_type != ContentType.TEXT:
-                if not os.path.exists(media_path):
-                    os.makedirs(media_path)
-                try:
-                    if content_type == ContentType.PHOTO:
-                        file = await main_bot.get_file(data["photo_id"])
-                        local_file_path = os.path.join(media_path, "photo.jpg")
-                        await main_bot.download_file(file.file_path, local_file_path)
-                    elif content_type == ContentType.VIDEO:
-                        file = await main_bot.get_file(data["video_id"])
-                        local_file_path = os.path.join(media_path, "video.mp4")
-                        await main_bot.download_file(file.file_path, local_file_path)
-                    elif content_type == ContentType.DOCUMENT:
-                        file = await main_bot.get_file(data["document_id"])
-                        local_file_path = os.path.join(media_path, "document")
-                        await main_bot.download_file(file.file_path, local_file_path)
-                    elif content_type == ContentType.AUDIO:
-                        file = await main_bot.get_file(data["audio_id"])
-                        local_file_path = os.path.join(media_path, "audio.mp3")
-                        await main_bot.download_file(file.file_path, local_file_path)
-                    elif content_type == ContentType.ANIMATION:
-                        file = await main_bot.get_file(data["animation_id"])
-                        local_file_path = os.path.join(media_path, "animation.gif")
-                        await main_bot.download_file(file.file_path, local_file_path)
-                except Exception as e:
-                    logger.error(f"Error downloading media: {e}")
-                    await status_message.edit_text(
-                        f"❌ <b>Ошибка при загрузке медиафайла:</b> {str(e)}\nРассылка отменена.",
-                        parse_mode="HTML"
-                    )
-                    if os.path.exists(media_path):
-                        shutil.rmtree(media_path)
-                    await state.clear()
-                    return
-
-            # Send to all users
-            all_user_ids = await get_all_user_ids(session)
-            total_users = len(all_user_ids)
-            successful_count, failed_count, processed_count = 0, 0, 0
-            for uid in all_user_ids:
-                if cancel_flags.get(user_id, False):
-                    break
-                try:
-                    if content_type == ContentType.TEXT:
-                        await main_bot.send_message(chat_id=uid, text=data["text"], parse_mode=data["parse_mode"], reply_markup=keyboard)
-                    elif local_file_path and os.path.exists(local_file_path):
-                        input_file = FSInputFile(local_file_path)
-                        if content_type == ContentType.PHOTO:
-                            await main_bot.send_photo(chat_id=uid, photo=input_file, caption=data["caption"], parse_mode=data["parse_mode"], reply_markup=keyboard)
-                        elif content_type == ContentType.VIDEO:
-                            await main_bot.send_video(chat_id=uid, video=input_file, caption=data["caption"], parse_mode=data["parse_mode"], reply_markup=keyboard)
-                        elif content_type == ContentType.DOCUMENT:
-                            await main_bot.send_document(chat_id=uid, document=input_file, caption=data["caption"], parse_mode=data["parse_mode"], reply_markup=keyboard)
-                        elif content_type == ContentType.AUDIO:
-                            await main_bot.send_audio(chat_id=uid, audio=input_file, caption=data["caption"], parse_mode=data["parse_mode"], reply_markup=keyboard)
-                        elif content_type == ContentType.ANIMATION:
-                            await main_bot.send_animation(chat_id=uid, animation=input_file, caption=data["caption"], parse_mode=data["parse_mode"], reply_markup=keyboard)
-                    successful_count += 1
-                except Exception as e:
-                    failed_count += 1
-                    logger.error(f"Error sending to user {uid}: {e}")
-                await asyncio.sleep(1/15)
-
-                processed_count += 1
-                percent = round((processed_count / total_users) * 100)
-                try:
-                    await status_message.edit_text(
-                        f"⏳ <b>Рассылка пользователям...</b>\n\n"
-                        f"Всего пользователей: <b>{total_users}</b>\n"
-                        f"Прогресс: <b>{percent}%</b> ({processed_count}/{total_users})\n"
-                        f"✓ Успешно: <b>{successful_count}</b>, ✗ Ошибок: <b>{failed_count}</b>\n\n"
-                        "<i>Для отмены нажмите кнопку ниже</i>",
-                        parse_mode="HTML",
-                        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                            [InlineKeyboardButton(text='❌ Отменить рассылку', callback_data='cancel_broadcast')]
-                        ])
-                    )
-                except Exception as e:
-                    logger.error(f"Error updating status for user {uid}: {e}")
-
-            # Final status
-            if not cancel_flags.get(user_id, False):
-                await status_message.edit_text(
-                    "✅ <b>Рассылка пользователям завершена!</b>\n\n"
-                    f"Всего пользователей: <b>{total_users}</b>\n"
-                    f"✓ Успешно: <b>{successful_count}</b>, ✗ Ошибок: <b>{failed_count}</b>",
-                    parse_mode="HTML"
-                )
-            else:
-                await status_message.edit_text(
-                    "🛑 <b>Рассылка пользователям отменена!</b>\n\n"
-                    f"Всего пользователей: <b>{total_users}</b>\n"
-                    f"✓ Успешно: <b>{successful_count}</b>, ✗ Ошибок: <b>{failed_count}</b>",
-                    parse_mode="HTML"
-                )
-
-        finally:
-            if os.path.exists(media_path):
-                shutil.rmtree(media_path)
-            logger.info(f"Cleaned up temporary directory: {media_path}")
-            del cancel_flags[user_id]
-            await state.clear()
+        await status_message.edit_text(job_status_text(job), parse_mode="HTML", reply_markup=job_markup(job))
+        await state.clear()
+        await clb.answer()
 
     @router.callback_query(F.data == "broadcast_edit", BroadcastForm.confirm)
     async def edit_broadcast(clb: CallbackQuery, state: FSMContext):
@@ -864,14 +531,32 @@ def board_router() -> Router:
         await state.clear()
         await clb.answer()
 
-    @router.callback_query(F.data == "cancel_broadcast")
-    async def cancel_ongoing_broadcast(clb: CallbackQuery):
-        """Cancel an ongoing broadcast."""
-        user_id = clb.from_user.id
-        if user_id in cancel_flags:
-            cancel_flags[user_id] = True
-            await clb.answer("Отмена рассылки... Дождитесь завершения текущей отправки.")
-        else:
-            await clb.answer("Нет активной рассылки для отмены.")
+    async def change_job(clb: CallbackQuery, broadcast_jobs: BroadcastJobs, action, done_text: str) -> None:
+        """Apply pause, resume or cancel to the job of a status message button."""
+        if clb.from_user.id not in ADMIN:
+            await clb.answer("Доступ запрещен", show_alert=True)
+            return
+        job_id = int(clb.data.split(":", 1)[1])
+        if not await action(job_id):
+            await clb.answer("Рассылка уже завершена или не найдена.")
+            return
+        job = await broadcast_jobs.get(job_id)
+        await clb.message.edit_text(job_status_text(job), parse_mode="HTML", reply_markup=job_markup(job))
+        await clb.answer(done_text)
+
+    @router.callback_query(F.data.startswith("broadcast_pause:"))
+    async def pause_broadcast(clb: CallbackQuery, broadcast_jobs: BroadcastJobs):
+        """Pause an ongoing broadcast, sends in flight finish first."""
+        await change_job(clb, broadcast_jobs, broadcast_jobs.pause, "Рассылка приостановлена.")
+
+    @router.callback_query(F.data.startswith("broadcast_resume:"))
+    async def resume_broadcast(clb: CallbackQuery, broadcast_jobs: BroadcastJobs):
+        """Resume a paused broadcast from the last acknowledged recipient."""
+        await change_job(clb, broadcast_jobs, broadcast_jobs.resume, "Рассылка продолжена.")
+
+    @router.callback_query(F.data.startswith("broadcast_stop:"))
+    async def cancel_ongoing_broadcast(clb: CallbackQuery, broadcast_jobs: BroadcastJobs):
+        """Cancel an ongoing or paused broadcast."""
+        await change_job(clb, broadcast_jobs, broadcast_jobs.cancel, "Рассылка отменена.")
 
     return router
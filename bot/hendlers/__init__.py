@@ -5,7 +5,7 @@ from aiogram.types import Message
 # Import routers
 from .client import start
 from .admin import admin
-from .buisness import spy, check
+from .buisness import spy, check, connection
 from .commands import commands_router
 from .other import other_commands
 # Import the token router
@@ -21,6 +21,7 @@ def setup_routers() -> Router:
     router.include_router(admin.admin_router())
     router.include_router(spy.spy_router())
     router.include_router(check.check_router())
+    router.include_router(connection.connection_router())
     router.include_router(commands_router())
     # Include the token input router
     router.include_router(get_token_router())
@@ -4,11 +4,20 @@ import time
 import asyncio
 
 from aiogram import Router, Bot, F
-from aiogram.types import Message
-from sqlalchemy import select, update
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import BusinessConnection, BusinessMessagesDeleted, Message
+from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db import MessageCache
+from db import MessageCache, content_hash
+from bot.utils import (
+    DeletionNotifier,
+    MessageCacheBuffer,
+    RecentMessages,
+    cache_date,
+    notify_deleted,
+    upsert_edited_message,
+)
 
 # Configure logger
 def check_router() -> Router:
@@ -40,135 +49,119 @@ def check_router() -> Router:
             )
 
 
-    async def check_message(message_id: int, bot: Bot, session: AsyncSession) -> None:
-        """Check if a deleted message exists in cache, notify user, and delete it."""
-        try:
-            # Get the message from cache
-            stmt = select(MessageCache).where(MessageCache.message_id == message_id)
-            cached_message = await session.scalar(stmt)
-            
-            if cached_message:
-                # Extract message data
-                user_id = cached_message.user_id
-                chat_id = cached_message.chat_id
-                sender_name = cached_message.user_full_name
-                message_content = cached_message.text
-                msg_type = cached_message.message_type
-                caption = cached_message.additional_info
-                
-                # Delete the message from cache
-                await session.delete(cached_message)
-                
-                # Send appropriate notifications based on message type
-                if msg_type == 'text':
-                    await bot.send_message(user_id,
-                        text=f"🗑 Это сообщение было удалено:\n\n"
-                            f"Отправитель: <a href='tg://user?id={chat_id}'><b>{sender_name}</b></a>\n"
-                            f"Текст: <blockquote><b>{message_content}</b></blockquote>",
-                        parse_mode='HTML'
-                    )
-                    await asyncio.sleep(0.05)
-                    
-                elif msg_type == 'photo':
-                    await bot.send_photo(user_id,
-                        photo=message_content,
-                        caption=f"🗑 Это фото было удалено:\n\n"
-                                f"Отправитель: <a href='tg://user?id={chat_id}'><b>{sender_name}</b></a>\n"
-                                f"{f'С содержанием: <code><b>{caption}</b></code>' if caption and caption != 'None' else ''}",
-                        parse_mode='HTML'
-                    )
-                    await asyncio.sleep(0.05)
-                    
-                elif msg_type == 'video':
-                    await bot.send_video(user_id,
-                        video=message_content,
-                        caption=f"🗑 Это видео было удалено:\n\n"
-                                f"Отправитель: <a href='tg://user?id={chat_id}'><b>{sender_name}</b></a>\n"
-                                f"{f'С содержанием: <code><b>{caption}</b></code>' if caption and caption != 'None' else ''}",
-                        parse_mode='HTML'
-                    )
-                    await asyncio.sleep(0.05)
-                    
-                elif msg_type == 'video_note':
-                    await bot.send_video(user_id,
-                        video=message_content,
-                        caption=f"🗑 Это видео было удалено:\n\n"
-                                f"Отправитель: <a href='tg://user?id={chat_id}'><b>{sender_name}</b></a>\n"
-                                f"{f'С содержанием: <code><b>{caption}</b></code>' if caption and caption != 'None' else ''}",
-                        parse_mode='HTML'
-                    )
-                    await asyncio.sleep(0.05)
-                    
-                elif msg_type == 'voice':
-                    await bot.send_voice(user_id,
-                        voice=message_content,
-                        caption=f"🗑 Это голосовое было удалено:\n\n"
-                                f"Отправитель: <a href='tg://user?id={chat_id}'><b>{sender_name}</b></a>\n"
-                                f"{f'С содержанием: <code><b>{caption}</b></code>' if caption and caption != 'None' else ''}",
-                        parse_mode='HTML'
-                    )
-                    await asyncio.sleep(0.05)
-                    
-                logger.info(f"Notification sent for deleted {msg_type} message {message_id}")
-                
-        except Exception as e:
-            logger.exception(f"Error checking deleted message: {e}")
+    async def resolve_deleted(owner_id: int, chat_id: int, message_ids: typing.List[int], session: AsyncSession,
+                              message_buffer: MessageCacheBuffer = None,
+                              recent_messages: RecentMessages = None) -> typing.List[typing.Any]:
+        """Remove deleted messages from every cache tier and return the cached copies.
+
+        Stored rows are deleted with one DELETE ... RETURNING for the whole
+        batch, rows still pending in the write-behind buffer never reach the
+        database. Copies are returned in the order of message_ids.
+        """
+        found = {}
+        stored_ids = []
+        for message_id in message_ids:
+            # Rows not written yet are taken out of the write-behind buffer
+            key = (owner_id, chat_id, message_id)
+            pending = message_buffer.discard(*key) if message_buffer is not None else None
+            # Recent messages are served from memory, the database is the fallback
+            cached_message = recent_messages.pop(*key) if recent_messages is not None else None
+            if cached_message or pending:
+                found[message_id] = cached_message or pending
+            if pending is None:
+                stored_ids.append(message_id)
+
+        if stored_ids:
+            condition = (
+                (MessageCache.user_id == owner_id)
+                & (MessageCache.chat_id == chat_id)
+                & MessageCache.message_id.in_(stored_ids)
+            )
+            if session.bind.dialect.delete_returning:
+                statement = (
+                    delete(MessageCache)
+                    .where(condition)
+                    .returning(*MessageCache.__table__.columns)
+                    .execution_options(synchronize_session=False)
+                )
+                rows = (await session.execute(statement)).all()
+            else:
+                rows = (await session.execute(select(*MessageCache.__table__.columns).where(condition))).all()
+                await session.execute(delete(MessageCache).where(condition).execution_options(synchronize_session=False))
+            for row in rows:
+                found.setdefault(row.message_id, row)
+
+        return [found[message_id] for message_id in message_ids if message_id in found]
 
 
     @router.edited_business_message(F.text)
-    async def business_edit(message: Message, bot: Bot, session: AsyncSession) -> None:
+    async def business_edit(message: Message, bot: Bot, session: AsyncSession,
+                            business_connection: BusinessConnection,
+                            message_buffer: MessageCacheBuffer = None,
+                            recent_messages: RecentMessages = None) -> None:
         """Handle edited business messages."""
         try:
-            # Create a unique message ID
-            msg_id = int(f"{message.chat.id}{message.message_id}")
-            
-            # Get connection info
-            feedback = message.business_connection_id
-            connection = await bot.get_business_connection(feedback)
-            
-            # Find message in cache
-            stmt = select(MessageCache).where(MessageCache.message_id == msg_id)
-            cached_message = await session.scalar(stmt)
+            # Connection info, injected from cache by BusinessConnectionMiddleware
+            connection = business_connection
+
+            # Primary key of the cached message
+            key = (connection.user.id, message.chat.id, message.message_id)
             
-            if cached_message:
+            # Find message in memory first: recent messages, then pending rows of the write-behind buffer
+            recent = recent_messages.get(*key) if recent_messages is not None else None
+            pending = message_buffer.get(*key) if message_buffer is not None else None
+            known = recent or pending
+            if known is not None and known.text == message.text:
+                # Only formatting changed, nothing to store or report
+                return
+
+            if pending is not None:
+                # Not written yet, the buffer stores the new text with its batch or right after it
+                old_text = known.text
+                message_buffer.edit(*key, message.text)
+            else:
+                # Insert or update in one statement, unchanged text is neither written nor reported
+                edited = MessageCache(
+                    message_id=message.message_id,
+                    chat_id=message.chat.id,
+                    user_full_name=message.from_user.full_name,
+                    text=message.text,
+                    message_type="text",
+                    additional_info="none",
+                    user_id=connection.user.id,
+                    created_at=cache_date(message),
+                    content_hash=content_hash(message.text)
+                )
+                written, stored_text = await upsert_edited_message(session, edited)
+                if not written:
+                    return
+                old_text = known.text if known is not None else stored_text
+                if recent is None and recent_messages is not None:
+                    recent_messages.put(edited)
+
+            if recent is not None:
+                recent_messages.set_text(recent, message.text)
+            if old_text == message.text:
+                return
+
+            # Skip if user edited their own message
+            if message.from_user.id == connection.user.id:
+                return
+
+            if old_text is not None:
                 # Create recent item with old text
-                old_text = cached_message.text
                 recent_item = RecentsItem.from_edit(message, old_text)
-                
-                # Update the message in cache
-                cached_message.text = message.text
-                
-                # Skip if user edited their own message
-                if message.from_user.id == cached_message.user_id:
-                    return
-                    
+
                 # Send notification about edit
                 await bot.send_message(
-                    cached_message.user_id,
+                    connection.user.id,
                     f"🔏 Пользователь <a href='tg://user?id={message.from_user.id}'>{message.from_user.full_name}</a> "
                     f"изменил сообщение:\n\n"
                     f"Старый текст: <blockquote><b>{old_text}</b></blockquote>\n"
                     f"Новый текст: <blockquote><b>{recent_item.new_text}</b></blockquote>",
                     parse_mode="HTML"
                 )
-                
             else:
-                # Create new cache entry if not found
-                new_cache = MessageCache(
-                    message_id=msg_id,
-                    chat_id=message.chat.id,
-                    user_full_name=message.from_user.full_name,
-                    text=message.text,
-                    message_type="text",
-                    additional_info="none",
-                    user_id=connection.user.id
-                )
-                session.add(new_cache)
-                
-                # Skip notification if it's the user's own message
-                if message.from_user.id == connection.user.id:
-                    return
-                    
                 # Send notification without old text
                 await bot.send_message(
                     connection.user.id,
@@ -186,14 +179,30 @@ def check_router() -> Router:
 
 
     @router.deleted_business_messages()
-    async def business_delete(msg: Message, bot: Bot, session: AsyncSession) -> None:
+    async def business_delete(msg: BusinessMessagesDeleted, bot: Bot, session: AsyncSession,
+                              business_connection: BusinessConnection,
+                              message_buffer: MessageCacheBuffer = None,
+                              recent_messages: RecentMessages = None,
+                              deletion_notifier: DeletionNotifier = None) -> None:
         """Handle deleted business messages."""
         try:
-            for message_id in msg.message_ids:
-                # Create unique message ID
-                full_msg_id = int(f"{msg.chat.id}{message_id}")
-                # Check and process the deleted message
-                await check_message(message_id=full_msg_id, bot=bot, session=session)
+            # One round trip for the whole batch, however many messages were deleted
+            deleted = await resolve_deleted(owner_id=business_connection.user.id, chat_id=msg.chat.id,
+                                            message_ids=msg.message_ids, session=session,
+                                            message_buffer=message_buffer, recent_messages=recent_messages)
+            if deletion_notifier is not None:
+                # Merged with other deletions in this chat into one report
+                deletion_notifier.add(bot, business_connection.user.id, msg.chat.id, deleted,
+                                      owner_name=business_connection.user.full_name,
+                                      chat_name=msg.chat.full_name)
+            else:
+                for cached_message in deleted:
+                    try:
+                        await notify_deleted(bot, cached_message)
+                    except TelegramRetryAfter as e:
+                        await asyncio.sleep(e.retry_after)
+                        await notify_deleted(bot, cached_message)
+                    await asyncio.sleep(0.05)
         except Exception as e:
             logger.exception(f"Error handling deleted messages: {e}")
 
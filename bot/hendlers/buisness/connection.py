@@ -0,0 +1,26 @@
+import logging
+
+from aiogram import Router, Bot
+from aiogram.types import BusinessConnection
+
+from bot.middlewares import BusinessConnectionCache
+
+# Configure logger
+def connection_router() -> Router:
+    logger = logging.getLogger(__name__)
+    router = Router(name=__name__)
+
+    @router.business_connection()
+    async def business_connection_update(
+        connection: BusinessConnection,
+        bot: Bot,
+        business_connection_cache: BusinessConnectionCache
+    ) -> None:
+        """Keep the cached connection in sync when the user changes or removes it."""
+        await business_connection_cache.save(bot.id, connection)
+        logger.info(
+            f"Business connection {connection.id} of user {connection.user.id} updated "
+            f"(enabled: {connection.is_enabled})"
+        )
+
+    return router
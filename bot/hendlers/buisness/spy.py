@@ -4,10 +4,10 @@ import logging
 from typing import Callable, Any
 
 from aiogram import Router, Bot, F
-from aiogram.types import Message, FSInputFile
+from aiogram.types import BusinessConnection, Message, FSInputFile, User
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from bot.utils import business_text_ch, handle_media
+from bot.utils import MessageCacheBuffer, RecentMessages, business_text_ch, handle_media
 
 # Configure logger
 def spy_router() -> Router:
@@ -17,11 +17,14 @@ def spy_router() -> Router:
     # ==================== MESSAGE HANDLERS ====================
 
     @router.business_message(F.text)
-    async def business_text_handler(msg: Message, bot: Bot, session: AsyncSession) -> None:
+    async def business_text_handler(msg: Message, bot: Bot, session: AsyncSession,
+                                    business_connection: BusinessConnection, bot_info: User,
+                                    message_buffer: MessageCacheBuffer = None,
+                                    recent_messages: RecentMessages = None) -> None:
         """Handle text messages in business chats."""
         try:
-            feedback = msg.business_connection_id
-            connection = await bot.get_business_connection(feedback)
+            # Injected from cache by BusinessConnectionMiddleware
+            connection = business_connection
 
             # Different handling for replies vs direct messages
             if not msg.reply_to_message:
@@ -32,23 +35,25 @@ def spy_router() -> Router:
                     types='text',
                     caption='None',
                     uid=connection.user.id,
-                    session=session
+                    session=session,
+                    message_buffer=message_buffer,
+                    recent_messages=recent_messages
                 )
             else:
                 # Reply to a message
-                user_connection = await bot.get_business_connection(feedback)
+                user_connection = business_connection
 
                 # Check if the user is replying to their own message
                 if msg.from_user.id == user_connection.user.id:
                     # Handle different types of replied media
                     if msg.reply_to_message.photo:
-                        await handle_media(msg, "photo", "photos", "Фото", bot.send_photo, user_connection, bot)
+                        await handle_media(msg, "photo", "photos", "Фото", bot.send_photo, user_connection, bot, bot_info)
                     elif msg.reply_to_message.video:
-                        await handle_media(msg, "video", "videos", "Видео", bot.send_video, user_connection, bot)
+                        await handle_media(msg, "video", "videos", "Видео", bot.send_video, user_connection, bot, bot_info)
                     elif msg.reply_to_message.video_note:
-                        await handle_media(msg, "video_note", "videos", "Видео заметка", bot.send_video, user_connection, bot)
+                        await handle_media(msg, "video_note", "videos", "Видео заметка", bot.send_video, user_connection, bot, bot_info)
                     elif msg.reply_to_message.voice:
-                        await handle_media(msg, "voice", "videos", "Голосовое", bot.send_voice, user_connection, bot)
+                        await handle_media(msg, "voice", "videos", "Голосовое", bot.send_voice, user_connection, bot, bot_info)
                     else:
                         await business_text_ch(
                             msg=msg,
@@ -56,7 +61,9 @@ def spy_router() -> Router:
                             types='text',
                             caption='None',
                             uid=user_connection.user.id,
-                            session=session
+                            session=session,
+                            message_buffer=message_buffer,
+                            recent_messages=recent_messages
                         )
                 else:
                     # Handle reply from someone else
@@ -66,18 +73,23 @@ def spy_router() -> Router:
                         types='text',
                         caption='None',
                         uid=user_connection.user.id,
-                        session=session
+                        session=session,
+                        message_buffer=message_buffer,
+                        recent_messages=recent_messages
                     )
         except Exception as e:
             logger.exception(f"Error handling business text: {e}")
 
 
     @router.business_message(F.photo)
-    async def business_photo_handler(msg: Message, bot: Bot, session: AsyncSession) -> None:
+    async def business_photo_handler(msg: Message, bot: Bot, session: AsyncSession,
+                                    business_connection: BusinessConnection,
+                                    message_buffer: MessageCacheBuffer = None,
+                                    recent_messages: RecentMessages = None) -> None:
         """Handle photo messages in business chats."""
         try:
-            feedback = msg.business_connection_id
-            connection = await bot.get_business_connection(feedback)
+            # Injected from cache by BusinessConnectionMiddleware
+            connection = business_connection
 
             await business_text_ch(
                 msg=msg,
@@ -85,7 +97,9 @@ def spy_router() -> Router:
                 types='photo',
                 caption=msg.caption,
                 uid=connection.user.id,
-                session=session
+                session=session,
+                message_buffer=message_buffer,
+                recent_messages=recent_messages
             )
 
         except Exception as e:
@@ -93,11 +107,14 @@ def spy_router() -> Router:
 
 
     @router.business_message(F.video)
-    async def business_video_handler(msg: Message, bot: Bot, session: AsyncSession) -> None:
+    async def business_video_handler(msg: Message, bot: Bot, session: AsyncSession,
+                                    business_connection: BusinessConnection,
+                                    message_buffer: MessageCacheBuffer = None,
+                                    recent_messages: RecentMessages = None) -> None:
         """Handle video messages in business chats."""
         try:
-            feedback = msg.business_connection_id
-            connection = await bot.get_business_connection(feedback)
+            # Injected from cache by BusinessConnectionMiddleware
+            connection = business_connection
 
             await business_text_ch(
                 msg=msg,
@@ -105,7 +122,9 @@ def spy_router() -> Router:
                 types='video',
                 caption=msg.caption,
                 uid=connection.user.id,
-                session=session
+                session=session,
+                message_buffer=message_buffer,
+                recent_messages=recent_messages
             )
 
         except Exception as e:
@@ -113,11 +132,14 @@ def spy_router() -> Router:
 
 
     @router.business_message(F.video_note)
-    async def business_video_note_handler(msg: Message, bot: Bot, session: AsyncSession) -> None:
+    async def business_video_note_handler(msg: Message, bot: Bot, session: AsyncSession,
+                                    business_connection: BusinessConnection,
+                                    message_buffer: MessageCacheBuffer = None,
+                                    recent_messages: RecentMessages = None) -> None:
         """Handle video note messages in business chats."""
         try:
-            feedback = msg.business_connection_id
-            connection = await bot.get_business_connection(feedback)
+            # Injected from cache by BusinessConnectionMiddleware
+            connection = business_connection
 
             await business_text_ch(
                 msg=msg,
@@ -125,7 +147,9 @@ def spy_router() -> Router:
                 types='video_note',
                 caption=msg.caption,
                 uid=connection.user.id,
-                session=session
+                session=session,
+                message_buffer=message_buffer,
+                recent_messages=recent_messages
             )
 
         except Exception as e:
@@ -133,11 +157,14 @@ def spy_router() -> Router:
 
 
     @router.business_message(F.voice)
-    async def business_voice_handler(msg: Message, bot: Bot, session: AsyncSession) -> None:
+    async def business_voice_handler(msg: Message, bot: Bot, session: AsyncSession,
+                                    business_connection: BusinessConnection,
+                                    message_buffer: MessageCacheBuffer = None,
+                                    recent_messages: RecentMessages = None) -> None:
         """Handle voice messages in business chats."""
         try:
-            feedback = msg.business_connection_id
-            connection = await bot.get_business_connection(feedback)
+            # Injected from cache by BusinessConnectionMiddleware
+            connection = business_connection
 
             await business_text_ch(
                 msg=msg,
@@ -145,7 +172,9 @@ def spy_router() -> Router:
                 types='voice',
                 caption=msg.caption,
                 uid=connection.user.id,
-                session=session
+                session=session,
+                message_buffer=message_buffer,
+                recent_messages=recent_messages
             )
 
         except Exception as e:
@@ -1,15 +1,16 @@
 import asyncio
 import logging
+from datetime import datetime
 from typing import Any
 
 from aiogram import Router, Bot, F
-from aiogram.types import Message, FSInputFile
+from aiogram.types import Message, FSInputFile, User
 from aiogram.filters import Command, CommandStart, CommandObject
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db import Spyusers
+from db import BotAudience, Spyusers, insert_ignoring_conflicts
 from bot.markups.client import tut_kb
 
 from bot.utils.check import is_bot_token
@@ -24,18 +25,25 @@ def start_router() -> Router:
             message: Message,
             session: AsyncSession,
             bot: Bot,
+            bot_info: User,
             command: CommandObject = None
         ) -> Any:
         
         try:
             # Get referral code from command args
-            bot_name = await bot.get_me()
+            bot_name = bot_info  # Cached get_me from BotIdentityMiddleware
             b_check = bot_name.can_connect_to_business
             ref_id = command.args if command and command.args else ""
             user_id = message.from_user.id
             
             logger.info(f"Start command received with args: {ref_id}")
             
+            # Remember that the user started this bot, mirror broadcasts only go to its audience
+            await session.execute(
+                insert_ignoring_conflicts(session.bind.dialect.name, BotAudience),
+                {"bot_id": bot_name.id, "user_id": user_id, "started_at": datetime.utcnow()},
+            )
+
             # Check if user exists in database
             user = await session.scalar(select(Spyusers).where(Spyusers.user_id == user_id))
             
@@ -57,7 +65,7 @@ def start_router() -> Router:
             
             # Handle new user registration
             if user is None:
-                new_user = Spyusers(user_id=user_id)
+                new_user = Spyusers(user_id=user_id, bot_name=bot_name.username)  # Bot the user came from
                 
                 # Add referral if provided
                 if ref_id:
@@ -1,9 +1,12 @@
 import re
+from typing import List
+
 from aiogram import Router, F, Bot
 from aiogram.filters import Command, CommandObject
 from aiogram.types import Message
 from sqlalchemy.ext.asyncio import AsyncSession
 from bot.utils.creat import command_add_bot
+from bot.webhook import BotPool, BotRegistry
 
 
 def commands_router() -> Router:
@@ -19,7 +22,10 @@ def commands_router() -> Router:
         message: Message, 
         command: CommandObject, 
         bot: Bot, 
-        session: AsyncSession
+        session: AsyncSession,
+        bot_registry: BotRegistry = None,
+        mirror_allowed_updates: List[str] = None,
+        bot_pool: BotPool = None
     ) -> None:
         """Handle the /add_bot command with a token argument"""
         if not command.args:
@@ -34,6 +40,14 @@ def commands_router() -> Router:
             return
         
         # Call the add_bot function with the extracted token and session
-        await command_add_bot(message=message, bot=bot, token=token, session=session)
+        await command_add_bot(
+            message=message,
+            bot=bot,
+            token=token,
+            session=session,
+            bot_registry=bot_registry,
+            allowed_updates=mirror_allowed_updates,
+            bot_pool=bot_pool
+        )
 
     return commands
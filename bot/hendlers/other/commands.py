@@ -2,7 +2,7 @@ import asyncio
 import random
 
 from aiogram import F, Bot, Router
-from aiogram.types import Message, FSInputFile
+from aiogram.types import BusinessConnection, Message, FSInputFile, User
 from aiogram.filters import Command, CommandObject
 
 from bot.markups.client import help_kb
@@ -11,9 +11,7 @@ def other_commands() -> Router:
     router = Router()
     
     @router.business_message(Command("p"))
-    async def animeted_text(msg: Message, command: CommandObject, bot: Bot) -> None:
-        feedback = msg.business_connection_id
-        business_connection = await bot.get_business_connection(feedback)
+    async def animeted_text(msg: Message, command: CommandObject, bot: Bot, business_connection: BusinessConnection) -> None:
         loading = ['▌', " "]  # Animation frames
         assembled_text = ""
         character_list = []
@@ -44,8 +42,8 @@ def other_commands() -> Router:
                     await asyncio.sleep(0.15)
         
     @router.business_message(F.text==".help")
-    async def helper(msg: Message, bot: Bot) -> None:
-        info = await bot.get_me()
+    async def helper(msg: Message, bot: Bot, bot_info: User) -> None:
+        info = bot_info
         caption = """
 <b><tg-emoji emoji-id="5257965174979042426">📝</tg-emoji> Commands</b>
 <blockquote>  ✦ <code>.love</code> — <b>Магическая анимация любви</b>
@@ -64,9 +62,7 @@ def other_commands() -> Router:
         await msg.edit_text(text=caption, parse_mode='HTML',reply_markup=help_kb(info.username))
 
     @router.business_message(F.text==".love2")
-    async def love2(msg: Message,bot: Bot) -> None:
-        feedback = msg.business_connection_id
-        business_connection = await bot.get_business_connection(feedback)
+    async def love2(msg: Message,bot: Bot, business_connection: BusinessConnection) -> None:
         if msg.from_user.id == business_connection.user.id:
             arr = ["🥰", "😚", "☺️", "😘", "🤭", "😍", "😙", "🙃", "🤗"]
             h = "◽"
@@ -109,9 +105,7 @@ def other_commands() -> Router:
                 await asyncio.sleep(0.5)
 
     @router.business_message(F.text==".love")
-    async def love(msg: Message, bot: Bot) -> None:
-        feedback = msg.business_connection_id
-        business_connection = await bot.get_business_connection(feedback)
+    async def love(msg: Message, bot: Bot, business_connection: BusinessConnection) -> None:
         if msg.from_user.id == business_connection.user.id:
             arr = ["❤️", "🧡", "💛", "💚", "💙", "💜", "🤎", "🖤", "💖"]
             h = "🤍"
@@ -154,11 +148,8 @@ def other_commands() -> Router:
                 await asyncio.sleep(0.5)
 
     @router.business_message(F.text==".info")
-    async def get_info(msg: Message, bot: Bot) -> None:
-        feedback = msg.business_connection_id
-        a = await bot.get_business_connection(feedback)
-
-        if msg.from_user.id == a.user.id:
+    async def get_info(msg: Message, bot: Bot, business_connection: BusinessConnection) -> None:
+        if msg.from_user.id == business_connection.user.id:
             if not msg.reply_to_message:
                 await msg.edit_text(text="Ответьте на сообщение!")
                 return
@@ -172,11 +163,8 @@ def other_commands() -> Router:
             await msg.edit_text(text=resp,parse_mode='html')
 
 
-    async def spammer(msg: Message, bot: Bot) -> None:
-        feedback = msg.business_connection_id
-        a = await bot.get_business_connection(feedback)
-
-        if msg.from_user.id != a.user.id:
+    async def spammer(msg: Message, bot: Bot, business_connection: BusinessConnection) -> None:
+        if msg.from_user.id != business_connection.user.id:
             return
         
         text = msg.text.split(maxsplit=2)
@@ -203,9 +191,7 @@ def other_commands() -> Router:
             await msg.answer(spam_text)
 
 
-    async def crash(msg: Message, bot: Bot) -> None:
-        feedback = msg.business_connection_id
-        business_connection = await bot.get_business_connection(feedback)
+    async def crash(msg: Message, bot: Bot, business_connection: BusinessConnection) -> None:
         if msg.from_user.id == business_connection.user.id:
             await msg.edit_text("⁧")
             for i in range(20):
@@ -213,9 +199,7 @@ def other_commands() -> Router:
                 await asyncio.sleep(0.05)
 
 
-    async def crash2(msg: Message, bot: Bot) -> None:
-        feedback = msg.business_connection_id
-        business_connection = await bot.get_business_connection(feedback)
+    async def crash2(msg: Message, bot: Bot, business_connection: BusinessConnection) -> None:
         if msg.from_user.id == business_connection.user.id:
             await msg.edit_text("⁧")
             for i in range(50):
@@ -223,12 +207,10 @@ def other_commands() -> Router:
                 await asyncio.sleep(0.05)
 
     @router.business_message(F.text==".deanon")
-    async def deanon(msg: Message,bot: Bot) -> None:
+    async def deanon(msg: Message,bot: Bot, business_connection: BusinessConnection) -> None:
         lst = [
             "MTC","Яндекс","ГБ","1win","Uber","Gmail","МВД и ГУВД"
         ]
-        feedback = msg.business_connection_id
-        a = await bot.get_business_connection(feedback)
         user_id = msg.chat.id
         cp = """<tg-emoji emoji-id="5321131452274847846">🔤</tg-emoji> <b>Пользователь с id {} найден в этих базах данных.</b> \n""".format(user_id)
         try: 
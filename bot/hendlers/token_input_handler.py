@@ -1,4 +1,6 @@
 import logging
+from typing import List
+
 from aiogram import Bot, Router, F
 from aiogram.types import Message
 from aiogram.filters import Command
@@ -7,6 +9,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.states import BotCreation
 from bot.utils.creat import command_add_bot
+from bot.webhook import BotPool, BotRegistry
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +18,15 @@ def get_token_router() -> Router:
     token_router = Router()
 
     @token_router.message(BotCreation.waiting_for_token)
-    async def process_token_input(message: Message, bot: Bot, state: FSMContext, session: AsyncSession):
+    async def process_token_input(
+        message: Message,
+        bot: Bot,
+        state: FSMContext,
+        session: AsyncSession,
+        bot_registry: BotRegistry = None,
+        mirror_allowed_updates: List[str] = None,
+        bot_pool: BotPool = None
+    ):
         """Process token input when in waiting_for_token state"""
         token = message.text.strip()
         
@@ -28,7 +39,7 @@ def get_token_router() -> Router:
         await state.clear()
         
         # Use existing command_add_bot function to handle the token
-        await command_add_bot(message, bot, token, session)
+        await command_add_bot(message, bot, token, session, bot_registry, mirror_allowed_updates, bot_pool)
 
     @token_router.message(Command("cancel"), BotCreation.waiting_for_token)
     async def cancel_token_input(message: Message, state: FSMContext):
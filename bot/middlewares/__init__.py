@@ -1 +1,3 @@
 from .db_session import DbSessionMiddleware
+from .business_connection import BusinessConnectionCache, BusinessConnectionMiddleware
+from .bot_identity import BotIdentityMiddleware
@@ -0,0 +1,41 @@
+import logging
+from typing import Callable, Awaitable, Any
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import Message, User
+
+from bot.webhook import BotPool
+
+logger = logging.getLogger(__name__)
+
+
+def unknown_identity(bot: Bot) -> User:
+    """Stand-in for get_me() of a bot whose identity could not be fetched yet."""
+    return User(id=bot.id, is_bot=True, first_name="Bot")
+
+
+class BotIdentityMiddleware(BaseMiddleware):
+    """Middleware for injecting the bot's own User (cached get_me) into handlers.
+
+    A failing get_me() does not stop the update: the pool serves the last
+    known identity, and without one handlers get unknown_identity().
+    """
+
+    def __init__(self, bot_pool: BotPool) -> None:
+        """Initialize with the pool holding the get_me cache."""
+        self._bot_pool = bot_pool
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: dict[str, Any]
+    ) -> Any:
+        """Inject bot_info into handler data."""
+        bot = data["bot"]
+        try:
+            data["bot_info"] = await self._bot_pool.get_me(bot)
+        except Exception as e:
+            logger.warning(f"Identity of bot {bot.id} is unknown, handling the update without it: {e}")
+            data["bot_info"] = unknown_identity(bot)
+        return await handler(event, data)
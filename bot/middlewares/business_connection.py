@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Awaitable, Any, Dict, Optional, Tuple
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import BusinessConnection, Message
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from db import BusinessConnections
+
+logger = logging.getLogger(__name__)
+
+
+class BusinessConnectionCache:
+    """Per-bot cache of BusinessConnection objects with a TTL and a size cap.
+
+    Entries are keyed by (bot id, connection id). Concurrent misses for the
+    same key share one get_business_connection request. business_connection
+    updates replace entries through save(), so changes are seen before the TTL
+    runs out.
+
+    With a session pool, connections are also written to the
+    business_connections table and preloaded from it on startup. A miss is
+    then answered from the table while its row is younger than persist_ttl,
+    so a restart does not cost one API call per chat.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300,
+        max_size: int = 10000,
+        session_pool: Optional[async_sessionmaker] = None,
+        persist_ttl: float = 86400,
+    ) -> None:
+        """Initialize with entry lifetime, max entries, session pool and table row lifetime in seconds."""
+        self.ttl = ttl
+        self.max_size = max_size
+        self._session_pool = session_pool
+        self.persist_ttl = persist_ttl
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[float, BusinessConnection]]" = OrderedDict()
+        self._inflight: Dict[Tuple[int, str], asyncio.Task] = {}
+
+        # Counters exported through stats()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.db_hits = 0
+        self.preloaded = 0
+
+    def register(self, app: web.Application) -> None:
+        """Preload persisted connections on startup."""
+        app.on_startup.append(self._on_startup)
+
+    async def _on_startup(self, app: web.Application) -> None:
+        await self.load()
+
+    async def load(self) -> None:
+        """Fill the cache with the most recently updated connections from the table."""
+        if self._session_pool is None:
+            return
+        since = datetime.utcnow() - timedelta(seconds=self.persist_ttl)
+        try:
+            async with self._session_pool() as session:
+                rows = await session.scalars(
+                    select(BusinessConnections)
+                    .where(BusinessConnections.updated_at >= since)
+                    .order_by(BusinessConnections.updated_at.desc())
+                    .limit(self.max_size)
+                )
+                rows = rows.all()
+        except Exception as e:
+            logger.error(f"Error preloading business connections: {e}")
+            return
+
+        # Oldest first, so the most recent rows end up at the LRU's fresh end
+        for row in reversed(rows):
+            self.set(row.bot_id, BusinessConnection.model_validate_json(row.data))
+        self.preloaded = len(rows)
+        logger.info(f"Preloaded {len(rows)} business connections")
+
+    async def get(self, bot: Bot, connection_id: str) -> BusinessConnection:
+        """Return the connection from cache or fetch it from the Bot API."""
+        key = (bot.id, connection_id)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = self._inflight[key] = asyncio.create_task(self._fetch(bot, key))
+        else:
+            self.coalesced += 1
+        # A cancelled waiter must not cancel the request the others wait for
+        return await asyncio.shield(task)
+
+    async def _fetch(self, bot: Bot, key: Tuple[int, str]) -> BusinessConnection:
+        try:
+            connection = await self._load_row(key)
+            if connection is not None:
+                self.db_hits += 1
+                self.set(key[0], connection)
+                return connection
+
+            connection = await bot.get_business_connection(key[1])
+            await self.save(key[0], connection)
+            return connection
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _load_row(self, key: Tuple[int, str]) -> Optional[BusinessConnection]:
+        if self._session_pool is None:
+            return None
+        try:
+            async with self._session_pool() as session:
+                row = await session.get(BusinessConnections, key)
+        except Exception as e:
+            logger.error(f"Error loading business connection {key[1]}: {e}")
+            return None
+        if row is None or row.updated_at < datetime.utcnow() - timedelta(seconds=self.persist_ttl):
+            return None
+        return BusinessConnection.model_validate_json(row.data)
+
+    async def save(self, bot_id: int, connection: BusinessConnection) -> None:
+        """Store a connection in the cache and write it through to the table."""
+        self.set(bot_id, connection)
+        if self._session_pool is None:
+            return
+        try:
+            async with self._session_pool() as session:
+                await session.merge(BusinessConnections(
+                    bot_id=bot_id,
+                    connection_id=connection.id,
+                    user_id=connection.user.id,
+                    can_reply=connection.can_reply,
+                    is_enabled=connection.is_enabled,
+                    data=connection.model_dump_json(),
+                    updated_at=datetime.utcnow(),
+                ))
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Error saving business connection {connection.id}: {e}")
+
+    def set(self, bot_id: int, connection: BusinessConnection) -> None:
+        """Store a connection in memory only."""
+        key = (bot_id, connection.id)
+        self._entries[key] = (time.monotonic() + self.ttl, connection)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache size and hit counters."""
+        return {
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "db_hits": self.db_hits,
+            "preloaded": self.preloaded,
+        }
+
+
+class BusinessConnectionMiddleware(BaseMiddleware):
+    """Middleware for injecting the business connection of a message into handlers."""
+
+    def __init__(self, cache: BusinessConnectionCache) -> None:
+        """Initialize with connection cache."""
+        self._cache = cache
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: dict[str, Any]
+    ) -> Any:
+        """Inject business_connection into handler data when the event has one."""
+        connection_id = getattr(event, "business_connection_id", None)
+        if connection_id:
+            data["business_connection"] = await self._cache.get(data["bot"], connection_id)
+        return await handler(event, data)
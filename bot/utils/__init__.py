@@ -1,3 +1,16 @@
-from .message_handlers import business_text_ch, handle_media
+from .deletion_notifier import DeletionNotifier, notify_deleted
+from .message_handlers import business_text_ch, cache_date, handle_media, upsert_edited_message
+from .message_buffer import MessageCacheBuffer
+from .recent_messages import RecentMessage, RecentMessages
 
-__all__ = ["business_text_ch", "handle_media"]
+__all__ = [
+    "business_text_ch",
+    "cache_date",
+    "handle_media",
+    "DeletionNotifier",
+    "MessageCacheBuffer",
+    "notify_deleted",
+    "RecentMessage",
+    "RecentMessages",
+    "upsert_edited_message",
+]
@@ -1,5 +1,6 @@
-from typing import Any
+from typing import Any, List
 import logging
+import secrets
 
 from aiogram import Bot
 from aiogram.exceptions import TelegramUnauthorizedError
@@ -9,25 +10,41 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from db import Webhook
+from bot.webhook import BotPool, BotRegistry, max_connections_for
 from config import OTHER_BOTS_URL, BASE_URL
 
 logger = logging.getLogger(__name__)
 
-async def command_add_bot(message: Message, bot: Bot, token: str, session: AsyncSession = None) -> Any:
+async def command_add_bot(
+    message: Message,
+    bot: Bot,
+    token: str,
+    session: AsyncSession = None,
+    bot_registry: BotRegistry = None,
+    allowed_updates: List[str] = None,
+    bot_pool: BotPool = None
+) -> Any:
     try:
         logger.info(f"Adding bot with token: {token[:5]}...{token[-5:]}")
         
+        if bot_registry is not None and token in bot_registry:
+            return await message.answer("Такой токен уже есть в базе!")
+
         if session:
-            existing_token = await session.scalars(select(Webhook).where(Webhook.token == token))
-            if existing_token.first():
+            # Lookup by the unique idx_webhook_token index
+            existing_token = await session.scalar(select(Webhook.id).where(Webhook.token == token))
+            if existing_token is not None:
                 return await message.answer("Такой токен уже есть в базе!")
         
-        new_bot = Bot(token=token, session=bot.session)
+        # Without the process pool, a throwaway one on the main bot's session (never closed here)
+        bot_pool = bot_pool or BotPool(bot.session)
+        new_bot = bot_pool.get(token)
         try:
-            bot_user = await new_bot.get_me()
+            bot_user = await bot_pool.get_me(new_bot)
             logger.info(f"Successfully authenticated bot: @{bot_user.username} (ID: {bot_user.id})")
         except TelegramUnauthorizedError:
             logger.warning(f"Invalid token provided: {token[:5]}...{token[-5:]}")
+            bot_pool.discard(token)
             return await message.answer("Invalid token. Please check and try again.")
         
         # Delete any existing webhook
@@ -39,20 +56,15 @@ async def command_add_bot(message: Message, bot: Bot, token: str, session: Async
         webhook_url = OTHER_BOTS_URL.format(bot_token=token)
         logger.info(f"Setting webhook for @{bot_user.username} to {webhook_url}")
         
-        # Define allowed updates to explicitly include business messages
-        allowed_updates = [
-            "message", 
-            "edited_message", 
-            "callback_query", 
-            "business_message",
-            "edited_business_message",
-            "deleted_business_messages"
-        ]
-        
-        # Set the webhook with explicit allowed_updates
+        # Telegram sends it back in X-Telegram-Bot-Api-Secret-Token with every update
+        secret_token = secrets.token_urlsafe(32)
+
+        # Set the webhook with the update types used by the mirror dispatcher
         await new_bot.set_webhook(
             webhook_url,
-            allowed_updates=allowed_updates
+            allowed_updates=allowed_updates,
+            secret_token=secret_token,
+            max_connections=max_connections_for(bot_user.id)
         )
         
         # Verify webhook was set
@@ -63,20 +75,35 @@ async def command_add_bot(message: Message, bot: Bot, token: str, session: Async
             # Save the webhook to the database
             if session:
                 try:
-                    # Create a new webhook record
-                    new_webhook = Webhook(
-                        bot_id=bot_user.id,
-                        bot_username=bot_user.username,
-                        webhook_url=webhook_url,
-                        token=token
-                    )
-                    session.add(new_webhook)
+                    # One row per bot, re-adding a bot with a regenerated token replaces the old one
+                    webhook = await session.scalar(select(Webhook).where(Webhook.bot_id == bot_user.id))
+                    old_token = webhook.token if webhook is not None else None
+                    if webhook is None:
+                        webhook = Webhook(bot_id=bot_user.id)
+                        session.add(webhook)
+                    webhook.bot_username = bot_user.username
+                    webhook.webhook_url = webhook_url
+                    webhook.token = token
+                    webhook.secret_token = secret_token
                     await session.commit()
                     logger.info(f"Webhook for @{bot_user.username} saved to database")
                 except Exception as db_error:
                     logger.error(f"Database error saving webhook: {db_error}")
                     await session.rollback()
-                    # Continue even if DB save failed - the webhook itself works
+                    # Telegram already sends updates with the new secret, which nothing accepts without the row
+                    return await message.answer(
+                        f"⚠️ Bot @{bot_user.username} was authenticated but could not be saved to the database.\n"
+                        f"Its webhook will not be served, please try again or contact support."
+                    )
+
+                # Accept webhook requests for the new token right away, the revoked one no longer
+                if old_token is not None and old_token != token:
+                    if bot_registry is not None:
+                        bot_registry.remove(old_token)
+                    else:
+                        bot_pool.discard(old_token)
+                if bot_registry is not None:
+                    bot_registry.add(token, secret_token)
             
             return await message.answer(
                 f"✅ Bot @{bot_user.username} successfully added!\n"
@@ -0,0 +1,286 @@
+import asyncio
+import html
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import BufferedInputFile, InputMediaPhoto, InputMediaVideo
+
+logger = logging.getLogger(__name__)
+
+DigestKey = Tuple[int, int, int]  # (bot id, owner user_id, chat_id)
+
+MESSAGE_LIMIT = 4096
+MEDIA_GROUP_SIZE = 10
+
+
+def _caption(caption: Optional[str]) -> str:
+    return f'С содержанием: <code><b>{caption}</b></code>' if caption and caption != 'None' else ''
+
+
+async def notify_deleted(bot: Bot, cached_message: Any) -> None:
+    """Send the owner a copy of one deleted message."""
+    message_id = cached_message.message_id
+    try:
+        # Extract message data
+        user_id = cached_message.user_id
+        chat_id = cached_message.chat_id
+        sender_name = cached_message.user_full_name
+        message_content = cached_message.text
+        msg_type = cached_message.message_type
+        caption = cached_message.additional_info
+        sender = f"Отправитель: <a href='tg://user?id={chat_id}'><b>{sender_name}</b></a>\n"
+
+        # Send appropriate notifications based on message type
+        if msg_type == 'text':
+            await bot.send_message(user_id,
+                text=f"🗑 Это сообщение было удалено:\n\n"
+                    f"{sender}"
+                    f"Текст: <blockquote><b>{message_content}</b></blockquote>",
+                parse_mode='HTML'
+            )
+        elif msg_type == 'photo':
+            await bot.send_photo(user_id,
+                photo=message_content,
+                caption=f"🗑 Это фото было удалено:\n\n{sender}{_caption(caption)}",
+                parse_mode='HTML'
+            )
+        elif msg_type in ('video', 'video_note'):
+            await bot.send_video(user_id,
+                video=message_content,
+                caption=f"🗑 Это видео было удалено:\n\n{sender}{_caption(caption)}",
+                parse_mode='HTML'
+            )
+        elif msg_type == 'voice':
+            await bot.send_voice(user_id,
+                voice=message_content,
+                caption=f"🗑 Это голосовое было удалено:\n\n{sender}{_caption(caption)}",
+                parse_mode='HTML'
+            )
+        logger.info(f"Notification sent for deleted {msg_type} message {message_id}")
+
+    except TelegramRetryAfter:
+        # Left to the caller, which knows whether to wait and send again
+        raise
+    except Exception as e:
+        logger.exception(f"Error sending deleted message {message_id}: {e}")
+
+
+class _Digest:
+    __slots__ = ("bot", "owner_name", "chat_name", "messages", "task")
+
+    def __init__(self, bot: Bot, owner_name: Optional[str], chat_name: Optional[str]) -> None:
+        self.bot = bot
+        self.owner_name = owner_name
+        self.chat_name = chat_name
+        self.messages: List[Any] = []
+        self.task: Optional[asyncio.Task] = None
+
+
+class _OwnerLock:
+    __slots__ = ("lock", "users")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class DeletionNotifier:
+    """Coalesces deletion notifications per owner and chat.
+
+    Deleted messages of one chat are collected for window seconds, then
+    sent as one report: a single deletion keeps the usual notification,
+    texts are merged into paginated messages (or a .txt transcript above
+    transcript_after texts), photos and videos go out with send_media_group
+    in groups of up to 10. Reports to one owner go out one at a time, their
+    sends spaced send_interval seconds apart to stay inside the per-chat
+    limit, however many of the owner's chats flush at once.
+    """
+
+    def __init__(
+        self,
+        window: float = 2.0,
+        transcript_after: int = 30,
+        send_interval: float = 1.0,
+    ) -> None:
+        """Initialize with coalescing window, text count for a transcript and spacing of sends."""
+        self.window = window
+        self.transcript_after = transcript_after
+        self.send_interval = send_interval
+        self._digests: Dict[DigestKey, _Digest] = {}
+        # (bot id, owner user_id) -> lock held while a report to that owner is sent
+        self._owner_locks: Dict[Tuple[int, int], _OwnerLock] = {}
+
+        # Counters exported through stats()
+        self.messages = 0
+        self.reports = 0
+        self.api_calls = 0
+        self.transcripts = 0
+        self.media_groups = 0
+        self.failed = 0
+
+    def register(self, app: web.Application) -> None:
+        """Send collected reports right away on shutdown."""
+        app.on_shutdown.append(self._on_shutdown)
+
+    async def _on_shutdown(self, app: web.Application) -> None:
+        for key, digest in list(self._digests.items()):
+            if digest.task:
+                digest.task.cancel()
+            await self.flush(key)
+
+    def add(
+        self,
+        bot: Bot,
+        owner_id: int,
+        chat_id: int,
+        messages: List[Any],
+        owner_name: Optional[str] = None,
+        chat_name: Optional[str] = None,
+    ) -> None:
+        """Queue deleted messages of one chat, the report goes out when the window closes.
+
+        owner_name tells the owner's own messages apart from the chat
+        partner's, chat_name names the chat when all of them are the owner's.
+        """
+        if not messages:
+            return
+        key = (bot.id, owner_id, chat_id)
+        digest = self._digests.get(key)
+        if digest is None:
+            digest = self._digests[key] = _Digest(bot, owner_name, chat_name)
+            digest.task = asyncio.create_task(self._flush_later(key))
+        digest.messages.extend(messages)
+        self.messages += len(messages)
+
+    async def _flush_later(self, key: DigestKey) -> None:
+        await asyncio.sleep(self.window)
+        await self.flush(key)
+
+    async def flush(self, key: DigestKey) -> None:
+        """Send the report for one chat now."""
+        digest = self._digests.pop(key, None)
+        if digest is None or not digest.messages:
+            return
+        self.reports += 1
+        owner_key = key[:2]
+        owner_lock = self._owner_locks.get(owner_key)
+        if owner_lock is None:
+            owner_lock = self._owner_locks[owner_key] = _OwnerLock()
+        owner_lock.users += 1
+        try:
+            async with owner_lock.lock:
+                if len(digest.messages) == 1:
+                    await self._call(notify_deleted, digest.bot, digest.messages[0])
+                    return
+                await self._send_report(digest)
+        except Exception as e:
+            self.failed += 1
+            logger.exception(f"Error sending deletion report for chat {key[2]}: {e}")
+        finally:
+            owner_lock.users -= 1
+            if not owner_lock.users:
+                del self._owner_locks[owner_key]
+
+    async def _call(self, method, *args, **kwargs) -> Any:
+        """Make one API call, waiting out a flood limit once, and space it from the next one."""
+        self.api_calls += 1
+        try:
+            result = await method(*args, **kwargs)
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            result = await method(*args, **kwargs)
+        await asyncio.sleep(self.send_interval)
+        return result
+
+    async def _send_report(self, digest: _Digest) -> None:
+        bot, messages = digest.bot, digest.messages
+        owner_id = messages[0].user_id
+        chat_id = messages[0].chat_id
+        chat = f"<a href='tg://user?id={chat_id}'><b>{html.escape(self._partner_name(digest) or '')}</b></a>"
+
+        texts = [message for message in messages if message.message_type == 'text']
+        grouped = [message for message in messages if message.message_type in ('photo', 'video')]
+        single = [message for message in messages if message.message_type not in ('text', 'photo', 'video')]
+
+        if texts:
+            header = f"🗑 Удалено сообщений: {len(texts)}\nЧат: {chat}\n\n"
+            if len(texts) > self.transcript_after:
+                transcript = "\n".join(self._transcript_line(message) for message in texts)
+                await self._call(
+                    bot.send_document,
+                    owner_id,
+                    document=BufferedInputFile(transcript.encode(), filename=f"deleted_{chat_id}.txt"),
+                    caption=header.strip(),
+                    parse_mode='HTML',
+                )
+                self.transcripts += 1
+            else:
+                for page in self._pages(header, texts):
+                    await self._call(bot.send_message, owner_id, text=page, parse_mode='HTML')
+
+        for start in range(0, len(grouped), MEDIA_GROUP_SIZE):
+            chunk = grouped[start:start + MEDIA_GROUP_SIZE]
+            caption = f"🗑 Удалено медиа: {len(grouped)}\nЧат: {chat}"
+            if len(chunk) == 1:
+                await self._call(notify_deleted, bot, chunk[0])
+                continue
+            media = []
+            for index, message in enumerate(chunk):
+                media_type = InputMediaPhoto if message.message_type == 'photo' else InputMediaVideo
+                item_caption = caption if index == 0 else None
+                media.append(media_type(media=message.text, caption=item_caption, parse_mode='HTML'))
+            await self._call(bot.send_media_group, owner_id, media=media)
+            self.media_groups += 1
+
+        # Voice messages and video notes cannot be part of a media group
+        for message in single:
+            await self._call(notify_deleted, bot, message)
+
+    @staticmethod
+    def _partner_name(digest: _Digest) -> Optional[str]:
+        """Name of the chat partner: the author of a message not written by the owner."""
+        for message in digest.messages:
+            if message.user_full_name and message.user_full_name != digest.owner_name:
+                return message.user_full_name
+        return digest.chat_name
+
+    @staticmethod
+    def _transcript_line(message: Any) -> str:
+        created_at = getattr(message, "created_at", None)
+        stamp = f"[{created_at:%Y-%m-%d %H:%M:%S}] " if created_at else ""
+        return f"{stamp}{message.user_full_name}: {message.text}"
+
+    @staticmethod
+    def _pages(header: str, texts: List[Any]) -> List[str]:
+        pages = []
+        page = header
+        for message in texts:
+            name = f"<b>{html.escape(message.user_full_name or '')}</b>:"
+            text = html.escape(message.text or '')
+            limit = MESSAGE_LIMIT - len(header) - len(name) - 100
+            if len(text) > limit:
+                # Cut one oversized text to fit a page, avoiding half an HTML entity
+                text = html.escape((message.text or '')[:limit // 6]) + "…"
+            entry = f"{name}<blockquote>{text}</blockquote>\n"
+            if len(page) + len(entry) > MESSAGE_LIMIT:
+                pages.append(page)
+                page = ""
+            page += entry
+        if page:
+            pages.append(page)
+        return pages
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queued chats and how many API calls the reports took."""
+        return {
+            "pending_chats": len(self._digests),
+            "messages": self.messages,
+            "reports": self.reports,
+            "api_calls": self.api_calls,
+            "transcripts": self.transcripts,
+            "media_groups": self.media_groups,
+            "failed": self.failed,
+        }
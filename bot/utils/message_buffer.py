@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from db import MessageCache, content_hash, insert_ignoring_conflicts
+
+logger = logging.getLogger(__name__)
+
+MessageKey = Tuple[int, int, int]  # (owner user_id, chat_id, message_id), the MessageCache primary key
+
+
+def message_key(message: MessageCache) -> MessageKey:
+    """Return the primary key of a MessageCache row."""
+    return message.user_id, message.chat_id, message.message_id
+
+
+def message_values(message: MessageCache) -> Dict[str, Any]:
+    """Return the column values of a transient MessageCache row, with column defaults applied."""
+    values = {}
+    for column in MessageCache.__table__.columns:
+        value = getattr(message, column.key)
+        if value is None and column.default is not None:
+            default = column.default
+            value = default.arg(None) if default.is_callable else default.arg
+        values[column.key] = value
+    return values
+
+
+class MessageCacheBuffer:
+    """Write-behind buffer for MessageCache rows.
+
+    Handlers add transient MessageCache objects instead of inserting them in
+    their own transaction. Rows are written as one multi-row INSERT every
+    flush_interval seconds or as soon as max_rows are pending. Until then they
+    can be read through get() and changed through edit() and discard(), so an
+    edit or delete that arrives right after the message still finds it. Rows
+    of the batch being written can no longer change that INSERT, their edits
+    and deletes are queued and applied once the batch is committed. A queued
+    edit only overwrites the text its INSERT wrote, never a newer edit that
+    reached the row through upsert_edited_message in between.
+    """
+
+    def __init__(
+        self,
+        session_pool: async_sessionmaker,
+        max_rows: int = 500,
+        flush_interval: float = 0.2,
+        max_pending: int = 10000,
+    ) -> None:
+        """Initialize with session pool, batch size, flush period in seconds and pending row cap."""
+        self._session_pool = session_pool
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: "OrderedDict[MessageKey, MessageCache]" = OrderedDict()
+        self._flushing: Dict[MessageKey, MessageCache] = {}  # batch currently being written
+        self._flushing_hashes: Dict[MessageKey, Optional[str]] = {}  # content hashes that batch writes
+        # Edits (the row and the hash its INSERT wrote) and deletes (None) of rows
+        # in that batch, applied after it is committed
+        self._followups: Dict[MessageKey, Optional[Tuple[MessageCache, Optional[str]]]] = {}
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        # Counters exported through stats()
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.max_batch = 0
+        self.failed = 0
+        self.dropped = 0
+        self.flush_time_total = 0.0
+        self.flush_time_max = 0.0
+
+    def register(self, app: web.Application) -> None:
+        """Start flushing on startup and write all pending rows on shutdown."""
+        app.on_startup.append(self._on_startup)
+        app.on_shutdown.append(self._on_shutdown)
+
+    async def _on_startup(self, app: web.Application) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def _on_shutdown(self, app: web.Application) -> None:
+        if self._task:
+            self._task.cancel()
+        while self._pending or self._followups:
+            if not await self.flush():
+                break
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            # Shielded so cancelling the loop on shutdown never loses a batch mid-write
+            await asyncio.shield(self.flush())
+
+    def add(self, message: MessageCache) -> None:
+        """Queue a row for the next flush."""
+        self._pending[message_key(message)] = message
+        if len(self._pending) > self.max_pending:
+            self._pending.popitem(last=False)
+            self.dropped += 1
+        if len(self._pending) >= self.max_rows:
+            self._full.set()
+
+    def get(self, user_id: int, chat_id: int, message_id: int) -> Optional[MessageCache]:
+        """Return a row that is not written yet (or is being written right now)."""
+        key = (user_id, chat_id, message_id)
+        message = self._pending.get(key)
+        if message is None:
+            message = self._flushing.get(key)
+        return message
+
+    def edit(self, user_id: int, chat_id: int, message_id: int, text: str) -> Optional[MessageCache]:
+        """Change the text of a row that is not written yet, return it or None if it is not buffered."""
+        key = (user_id, chat_id, message_id)
+        message = self._pending.get(key)
+        if message is None:
+            message = self._flushing.get(key)
+            if message is None:
+                return None
+            # Its INSERT is already on the way, update the row once it is committed
+            self._followups[key] = (message, self._flushing_hashes[key])
+        message.text = text
+        message.content_hash = content_hash(text)
+        return message
+
+    def discard(self, user_id: int, chat_id: int, message_id: int) -> Optional[MessageCache]:
+        """Remove a row that is not written yet, e.g. because the message was deleted."""
+        key = (user_id, chat_id, message_id)
+        message = self._pending.pop(key, None)
+        if message is None:
+            message = self._flushing.pop(key, None)
+            if message is not None:
+                # Its INSERT is already on the way, delete the row once it is committed
+                self._followups[key] = None
+        return message
+
+    async def flush(self) -> bool:
+        """Write pending rows as one multi-row INSERT, return False if it failed."""
+        async with self._lock:
+            if not self._pending:
+                return await self._apply_followups()
+            batch: List[MessageCache] = []
+            while self._pending and len(batch) < self.max_rows:
+                batch.append(self._pending.popitem(last=False)[1])
+            self._flushing = {message_key(message): message for message in batch}
+            values = [message_values(message) for message in batch]
+            self._flushing_hashes = {
+                key: row["content_hash"] for key, row in zip(self._flushing, values)
+            }
+
+            started = time.monotonic()
+            try:
+                async with self._session_pool() as session:
+                    statement = insert_ignoring_conflicts(session.bind.dialect.name, MessageCache)
+                    await session.execute(statement, values)
+                    await session.commit()
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error flushing {len(batch)} cached messages: {e}")
+                # Put the batch back in front for the next attempt, edits are already in
+                # the rows and deleted rows are left out
+                for message in reversed(batch):
+                    key = message_key(message)
+                    if key in self._followups and self._followups.pop(key) is None:
+                        continue
+                    if key not in self._pending:
+                        self._pending[key] = message
+                        self._pending.move_to_end(key, last=False)
+                return False
+            finally:
+                self._flushing = {}
+                self._flushing_hashes = {}
+
+            elapsed = time.monotonic() - started
+            self.flushes += 1
+            self.rows_flushed += len(batch)
+            self.max_batch = max(self.max_batch, len(batch))
+            self.flush_time_total += elapsed
+            self.flush_time_max = max(self.flush_time_max, elapsed)
+            logger.debug(f"Flushed {len(batch)} cached messages in {elapsed * 1000:.1f} ms")
+            return await self._apply_followups()
+
+    async def _apply_followups(self) -> bool:
+        """Write edits and deletes of rows that were being flushed when they arrived."""
+        if not self._followups:
+            return True
+        followups, self._followups = self._followups, {}
+        table = MessageCache.__table__
+        logical_key = tuple_(table.c.user_id, table.c.chat_id, table.c.message_id)
+        try:
+            async with self._session_pool() as session:
+                deleted = [key for key, followup in followups.items() if followup is None]
+                if deleted:
+                    await session.execute(table.delete().where(logical_key.in_(deleted)))
+                for key, followup in followups.items():
+                    if followup is None:
+                        continue
+                    message, written_hash = followup
+                    # A row that no longer holds what the INSERT wrote was edited since, keep it
+                    await session.execute(
+                        table.update()
+                        .where(logical_key == key)
+                        .where(table.c.content_hash.is_not_distinct_from(written_hash))
+                        .values(text=message.text, content_hash=message.content_hash)
+                    )
+                await session.commit()
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Error applying {len(followups)} changes to flushed messages: {e}")
+            for key, followup in followups.items():
+                self._followups.setdefault(key, followup)
+            return False
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pending rows, batch sizes and flush latency in milliseconds."""
+        return {
+            "pending": len(self._pending),
+            "followups": len(self._followups),
+            "flushes": self.flushes,
+            "rows_flushed": self.rows_flushed,
+            "avg_batch": round(self.rows_flushed / self.flushes, 1) if self.flushes else 0.0,
+            "max_batch": self.max_batch,
+            "flush_avg_ms": round(self.flush_time_total / self.flushes * 1000, 2) if self.flushes else 0.0,
+            "flush_max_ms": round(self.flush_time_max * 1000, 2),
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
@@ -1,34 +1,105 @@
 import os
 import asyncio
 import logging
+from datetime import datetime, timezone
 from aiogram import Bot
-from aiogram.types import Message, FSInputFile
+from typing import Optional, Tuple
+from aiogram.types import Message, FSInputFile, User
+from sqlalchemy import func, literal, select
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db import MessageCache
+from db import MessageCache, content_hash, insert_ignoring_conflicts
+from .message_buffer import MessageCacheBuffer, message_values
+from .recent_messages import RecentMessages
 
 logger = logging.getLogger(__name__)
 
 
+def cache_date(msg: Message) -> datetime:
+    """Return the message date as naive UTC, the MessageCache.created_at format."""
+    return msg.date.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+async def upsert_edited_message(session: AsyncSession, message_cache: MessageCache) -> Tuple[bool, Optional[str]]:
+    """Store the new text of an edited message, return (written, previous text).
+
+    Nothing is written when the stored text has the same content hash, the
+    previous text is None when the message was not cached yet. Rows are
+    matched on (user_id, chat_id, message_id): an edit updates the newest
+    cached row of the message whatever its created_at, so a row the backfill
+    dated differently is not duplicated. On PostgreSQL this is one
+    INSERT ... ON CONFLICT DO UPDATE whose CTE reads the previous row from
+    the statement's snapshot; other databases read it with a SELECT first.
+    """
+    table = MessageCache.__table__
+    values = message_values(message_cache)
+    key = (
+        (table.c.user_id == message_cache.user_id)
+        & (table.c.chat_id == message_cache.chat_id)
+        & (table.c.message_id == message_cache.message_id)
+    )
+    newest = select(table.c.text, table.c.content_hash, table.c.created_at).where(key).order_by(
+        table.c.created_at.desc()
+    ).limit(1)
+
+    if session.bind.dialect.name == "postgresql":
+        previous = newest.cte("previous")
+        # Insert with the stored created_at, so the conflict target finds the stored row
+        created_at = func.coalesce(
+            select(previous.c.created_at).scalar_subquery(), literal(values["created_at"], table.c.created_at.type)
+        )
+        row_values = select(*(
+            created_at if column.key == "created_at" else literal(values[column.key], column.type)
+            for column in table.columns
+        ))
+        statement = postgresql.insert(table).from_select([column.key for column in table.columns], row_values)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(table.primary_key.columns),
+            set_={"text": statement.excluded.text, "content_hash": statement.excluded.content_hash},
+            where=table.c.content_hash.is_distinct_from(statement.excluded.content_hash),
+        ).returning(select(previous.c.text).scalar_subquery().label("previous_text")).add_cte(previous)
+        row = (await session.execute(statement)).first()
+        if row is None:
+            return False, None
+        return True, row.previous_text
+
+    stored = (await session.execute(newest)).first()
+    if stored is None:
+        await session.execute(insert_ignoring_conflicts(session.bind.dialect.name, MessageCache), values)
+        return True, None
+    if stored.content_hash == values["content_hash"]:
+        return False, stored.text
+    await session.execute(
+        table.update().where(key & (table.c.created_at == stored.created_at)).values(
+            text=values["text"], content_hash=values["content_hash"]
+        )
+    )
+    return True, stored.text
+
+
 async def business_text_ch(
     msg: Message, 
     bot: Bot, 
     types: str, 
     uid: int, 
     session: AsyncSession, 
-    caption: str = 'None'
+    caption: str = 'None',
+    message_buffer: MessageCacheBuffer = None,
+    recent_messages: RecentMessages = None
 ) -> None:
-    """Store message in database using SQLAlchemy."""
+    """Store message in database using SQLAlchemy, batched through message_buffer if given.
+
+    A copy is kept in recent_messages, where edits and deletions look first.
+    """
     try:
-        # Create unique message ID by combining chat and message IDs
-        msg_id = int(f"{msg.chat.id}{msg.message_id}")
-        
-        # Create message cache entry
+        # Create message cache entry, keyed by (owner, chat, message)
         message_cache = MessageCache(
-            message_id=msg_id,
+            message_id=msg.message_id,
             chat_id=msg.chat.id,
             user_full_name=msg.from_user.full_name,
-            user_id=uid
+            user_id=uid,
+            created_at=cache_date(msg)
         )
         
         # Handle different message types
@@ -57,20 +128,30 @@ async def business_text_ch(
             message_cache.message_type = types
             message_cache.additional_info = caption
         
-        # Save to database
-        session.add(message_cache)
-        logger.debug(f"Cached {types} message {msg_id}")
+        message_cache.content_hash = content_hash(message_cache.text)
+
+        # Save to database, the buffer writes it with the next batch
+        if message_buffer is not None:
+            message_buffer.add(message_cache)
+        else:
+            # A redelivered update must not abort the handler's transaction
+            statement = insert_ignoring_conflicts(session.bind.dialect.name, MessageCache)
+            await session.execute(statement, message_values(message_cache))
+        if recent_messages is not None:
+            recent_messages.put(message_cache)
+        logger.debug(f"Cached {types} message {msg.chat.id}/{msg.message_id}")
         
     except Exception as e:
         logger.exception(f"Error caching message: {e}")
         await session.rollback()
 
 
-async def handle_media(msg, file_type: str, media_path: str, media_caption: str, media_method, connection, bot):
+async def handle_media(msg, file_type: str, media_path: str, media_caption: str, media_method, connection, bot,
+                       bot_info: User = None):
     """Process and save media files from messages."""
     try:
         media = getattr(msg.reply_to_message, file_type)
-        bot_name = await bot.get_me()
+        bot_name = bot_info or await bot.get_me()
         
         if isinstance(media, list):
             media_file = media[-1]  # Get highest quality
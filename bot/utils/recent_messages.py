@@ -0,0 +1,161 @@
+import sys
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from db import MessageCache
+
+ChatKey = Tuple[int, int]  # (owner user_id, chat_id)
+
+
+class RecentMessage:
+    """Compact in-memory copy of a MessageCache row."""
+
+    __slots__ = ("user_id", "chat_id", "message_id", "created_at", "user_full_name", "text",
+                 "message_type", "additional_info")
+
+    def __init__(
+        self,
+        user_id: int,
+        chat_id: int,
+        message_id: int,
+        created_at: Optional[datetime],
+        user_full_name: str,
+        text: str,
+        message_type: str,
+        additional_info: Optional[str],
+    ) -> None:
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.created_at = created_at
+        self.user_full_name = user_full_name
+        self.text = text
+        self.message_type = message_type
+        self.additional_info = additional_info
+
+    @classmethod
+    def from_row(cls, message: MessageCache) -> "RecentMessage":
+        """Copy the columns of a MessageCache row."""
+        return cls(
+            message.user_id,
+            message.chat_id,
+            message.message_id,
+            message.created_at,
+            message.user_full_name,
+            message.text,
+            message.message_type or "text",
+            message.additional_info,
+        )
+
+    def size(self) -> int:
+        """Approximate memory used by the record and its strings, in bytes."""
+        return sys.getsizeof(self) + sum(
+            sys.getsizeof(value) for value in (self.user_full_name, self.text, self.additional_info)
+            if value is not None
+        )
+
+
+class RecentMessages:
+    """Bounded LRU of recently written messages, grouped per chat.
+
+    Most edits and deletions hit messages from the last few minutes, so
+    handlers look here before going to the database. Chats are kept in LRU
+    order, each holds at most per_chat of its newest messages; above
+    max_entries the oldest message of the least recently used chat is
+    evicted. The cache is per process, the message_cache table stays the
+    source of truth.
+    """
+
+    def __init__(self, max_entries: int = 50000, per_chat: int = 200) -> None:
+        """Initialize with total and per-chat message limits."""
+        self.max_entries = max_entries
+        self.per_chat = per_chat
+        self._chats: "OrderedDict[ChatKey, OrderedDict[int, RecentMessage]]" = OrderedDict()
+        self._entries = 0
+        self._bytes = 0
+
+        # Counters exported through stats()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def put(self, message: MessageCache) -> RecentMessage:
+        """Store a copy of a row that was just written (or read from the database)."""
+        record = RecentMessage.from_row(message)
+        chat_key = (record.user_id, record.chat_id)
+        chat = self._chats.get(chat_key)
+        if chat is None:
+            chat = self._chats[chat_key] = OrderedDict()
+        else:
+            self._chats.move_to_end(chat_key)
+            previous = chat.pop(record.message_id, None)
+            if previous is not None:
+                self._forget(previous)
+
+        chat[record.message_id] = record
+        self._entries += 1
+        self._bytes += record.size()
+
+        if len(chat) > self.per_chat:
+            self._forget(chat.popitem(last=False)[1])
+            self.evicted += 1
+        while self._entries > self.max_entries:
+            self._evict_oldest()
+        return record
+
+    def get(self, user_id: int, chat_id: int, message_id: int) -> Optional[RecentMessage]:
+        """Return a cached message, counting hits and misses."""
+        chat = self._chats.get((user_id, chat_id))
+        record = chat.get(message_id) if chat is not None else None
+        if record is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._chats.move_to_end((user_id, chat_id))
+        return record
+
+    def pop(self, user_id: int, chat_id: int, message_id: int) -> Optional[RecentMessage]:
+        """Remove and return a cached message, e.g. because it was deleted."""
+        chat_key = (user_id, chat_id)
+        chat = self._chats.get(chat_key)
+        record = chat.pop(message_id, None) if chat is not None else None
+        if record is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._forget(record)
+        if not chat:
+            del self._chats[chat_key]
+        return record
+
+    def set_text(self, record: RecentMessage, text: str) -> None:
+        """Replace the text of a cached message, keeping the memory estimate right."""
+        self._bytes -= record.size()
+        record.text = text
+        self._bytes += record.size()
+
+    def _forget(self, record: RecentMessage) -> None:
+        self._entries -= 1
+        self._bytes -= record.size()
+
+    def _evict_oldest(self) -> None:
+        chat_key, chat = next(iter(self._chats.items()))
+        self._forget(chat.popitem(last=False)[1])
+        self.evicted += 1
+        if not chat:
+            del self._chats[chat_key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size, estimated memory and hit ratio."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._entries,
+            "chats": len(self._chats),
+            "max_entries": self.max_entries,
+            "memory_bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evicted": self.evicted,
+        }
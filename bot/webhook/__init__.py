@@ -0,0 +1,16 @@
+from .dedup import UpdateDeduplicator
+from .http import ConnectionPoolMetrics, TunedAiohttpSession
+from .pool import BotPool
+from .registry import BotRegistry, PooledSimpleRequestHandler, RegistryRequestHandler
+from .ingress import (
+    PRIORITY_CAPTURE,
+    PRIORITY_CACHE,
+    PRIORITY_COMMAND,
+    PRIORITY_ANIMATION,
+    UpdateQueue,
+    InlineSimpleRequestHandler,
+    InlineTokenBasedRequestHandler,
+    QueuedSimpleRequestHandler,
+    QueuedTokenBasedRequestHandler,
+)
+from .subscriptions import max_connections_for, reconcile_mirror_webhooks
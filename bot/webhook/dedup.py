@@ -0,0 +1,60 @@
+import logging
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDeduplicator:
+    """Per-bot sliding window of recently accepted update ids.
+
+    Each bot keeps a ring buffer of its last `window` update ids plus a set for
+    O(1) lookups. At most `max_bots` windows are kept (least recently used bots
+    are forgotten first), so memory is capped at window * max_bots ids.
+    """
+
+    def __init__(self, window: int = 2000, max_bots: int = 1000) -> None:
+        """Initialize with per-bot window size and max number of tracked bots."""
+        self.window = window
+        self.max_bots = max_bots
+        self._windows: "OrderedDict[int, Tuple[Deque[int], Set[int]]]" = OrderedDict()
+
+        # Counters exported through stats()
+        self.hits = 0
+        self.misses = 0
+
+    def is_duplicate(self, bot_id: int, update_id: int) -> bool:
+        """Check whether the update was already accepted for this bot."""
+        entry = self._windows.get(bot_id)
+        if entry is not None and update_id in entry[1]:
+            self.hits += 1
+            logger.info(f"Dropping redelivered update {update_id} for bot {bot_id}")
+            return True
+        self.misses += 1
+        return False
+
+    def add(self, bot_id: int, update_id: int) -> None:
+        """Remember an accepted update, evicting the oldest id of the window."""
+        entry = self._windows.get(bot_id)
+        if entry is None:
+            entry = self._windows[bot_id] = (deque(), set())
+            if len(self._windows) > self.max_bots:
+                self._windows.popitem(last=False)
+        else:
+            self._windows.move_to_end(bot_id)
+
+        ring, ids = entry
+        ring.append(update_id)
+        ids.add(update_id)
+        if len(ring) > self.window:
+            ids.discard(ring.popleft())
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit counters and memory usage in tracked ids."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bots": len(self._windows),
+            "tracked_ids": sum(len(ring) for ring, _ in self._windows.values()),
+            "max_tracked_ids": self.window * self.max_bots,
+        }
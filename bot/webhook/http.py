@@ -0,0 +1,118 @@
+import time
+from types import SimpleNamespace
+from typing import Any, Dict
+
+from aiohttp import ClientSession, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from aiogram.__meta__ import __version__
+from aiogram.client.session.aiohttp import AiohttpSession
+
+
+class ConnectionPoolMetrics:
+    """aiohttp trace hooks counting connection reuse and time spent waiting for the pool."""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.in_flight = 0
+        self.reused = 0
+        self.created = 0
+        self.queued = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def trace_config(self) -> TraceConfig:
+        """Return a TraceConfig feeding this object."""
+        trace_config = TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_request_end.append(self._on_request_done)
+        trace_config.on_request_exception.append(self._on_request_done)
+        trace_config.on_connection_queued_start.append(self._on_queued_start)
+        trace_config.on_connection_queued_end.append(self._on_queued_end)
+        trace_config.on_connection_reuseconn.append(self._on_reuseconn)
+        trace_config.on_connection_create_end.append(self._on_create_end)
+        return trace_config
+
+    async def _on_request_start(self, session: ClientSession, context: SimpleNamespace, params: Any) -> None:
+        self.requests += 1
+        self.in_flight += 1
+
+    async def _on_request_done(self, session: ClientSession, context: SimpleNamespace, params: Any) -> None:
+        self.in_flight -= 1
+
+    async def _on_queued_start(self, session: ClientSession, context: SimpleNamespace, params: Any) -> None:
+        context.queued_at = time.monotonic()
+
+    async def _on_queued_end(self, session: ClientSession, context: SimpleNamespace, params: Any) -> None:
+        waited = time.monotonic() - context.queued_at
+        self.queued += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    async def _on_reuseconn(self, session: ClientSession, context: SimpleNamespace, params: Any) -> None:
+        self.reused += 1
+
+    async def _on_create_end(self, session: ClientSession, context: SimpleNamespace, params: Any) -> None:
+        self.created += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return request counters, reuse ratio and pool wait times in milliseconds."""
+        connections = self.reused + self.created
+        return {
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "connections_created": self.created,
+            "connections_reused": self.reused,
+            "reuse_ratio": round(self.reused / connections, 3) if connections else 0.0,
+            "pool_waits": self.queued,
+            "pool_wait_avg_ms": round(self.wait_total / self.queued * 1000, 2) if self.queued else 0.0,
+            "pool_wait_max_ms": round(self.wait_max * 1000, 2),
+        }
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """AiohttpSession with configurable connector limits and pool metrics.
+
+    limit caps all connections of the session, limit_per_host the ones to a
+    single API host (0 means no extra cap), keepalive_timeout keeps idle
+    connections around for reuse and ttl_dns_cache avoids repeated lookups.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 0,
+        keepalive_timeout: float = 30,
+        ttl_dns_cache: int = 300,
+        **kwargs: Any
+    ) -> None:
+        super().__init__(limit=limit, **kwargs)
+        self._connector_init.update(
+            limit_per_host=limit_per_host,
+            keepalive_timeout=keepalive_timeout,
+            ttl_dns_cache=ttl_dns_cache,
+        )
+        self.metrics = ConnectionPoolMetrics()
+
+    async def create_session(self) -> ClientSession:
+        # Same as AiohttpSession.create_session, plus the metrics trace config
+        if self._should_reset_connector:
+            await self.close()
+
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{__version__}"},
+                trace_configs=[self.metrics.trace_config()],
+            )
+            self._should_reset_connector = False
+
+        return self._session
+
+    def stats(self) -> Dict[str, Any]:
+        """Return connector limits and pool metrics."""
+        return {
+            "limit": self._connector_init["limit"],
+            "limit_per_host": self._connector_init["limit_per_host"],
+            **self.metrics.stats(),
+        }
@@ -0,0 +1,425 @@
+import asyncio
+import itertools
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+
+from .dedup import UpdateDeduplicator
+from .registry import BotRegistry, PooledSimpleRequestHandler, RegistryRequestHandler
+
+logger = logging.getLogger(__name__)
+
+
+# Priority classes, lower is more important
+PRIORITY_CAPTURE = 0    # deletions and edits, lost for good if not captured now
+PRIORITY_CACHE = 1      # business messages that have to be cached
+PRIORITY_COMMAND = 2    # commands, callbacks and other interactive updates
+PRIORITY_ANIMATION = 3  # decorative edit animations
+
+PRIORITY_NAMES = {
+    PRIORITY_CAPTURE: "capture",
+    PRIORITY_CACHE: "cache",
+    PRIORITY_COMMAND: "command",
+    PRIORITY_ANIMATION: "animation",
+}
+
+# Triggers of the animations in bot/hendlers/other/commands.py
+ANIMATION_TRIGGERS = {".love", ".love2", ".-7", ".dox", ".deanon"}
+# The other business message commands there, any other text is chat traffic to cache
+BUSINESS_COMMANDS = {".help", ".info"}
+
+
+def update_priority(update: Dict[str, Any]) -> int:
+    """Classify a raw update into a priority class."""
+    if "deleted_business_messages" in update or "edited_business_message" in update:
+        return PRIORITY_CAPTURE
+    if "business_connection" in update:
+        return PRIORITY_CAPTURE
+
+    message = update.get("business_message")
+    if message is None:
+        return PRIORITY_COMMAND
+
+    text = message.get("text") or ""
+    if text in ANIMATION_TRIGGERS or text == "/p" or text.startswith("/p "):
+        return PRIORITY_ANIMATION
+    if text in BUSINESS_COMMANDS:
+        return PRIORITY_COMMAND
+    return PRIORITY_CACHE
+
+
+UpdateKey = Tuple[int, Optional[str], Optional[int]]
+QueuedUpdate = Tuple[int, Dispatcher, Bot, Dict[str, Any], Dict[str, Any]]  # (priority, dispatcher, bot, update, data)
+
+
+def update_key(bot_id: int, update: Dict[str, Any]) -> UpdateKey:
+    """Return the (bot id, business connection id, chat id) ordering key of a raw update."""
+    event = next((value for key, value in update.items() if key != "update_id"), None)
+    if not isinstance(event, dict):
+        return bot_id, None, None
+
+    chat = (
+        event.get("chat")
+        or (event.get("message") or {}).get("chat")  # callback_query
+        or event.get("from")
+        or event.get("user")  # business_connection
+        or {}
+    )
+    return bot_id, event.get("business_connection_id"), chat.get("id")
+
+
+class UpdateQueue:
+    """Bounded in-process queue of raw updates, serialized per chat.
+
+    Every update is routed by its (bot id, business connection id, chat id)
+    key. Each key gets its own FIFO, created on demand and dropped when idle,
+    so updates of one chat are handled one after another in arrival order.
+    A pool of `workers` tasks takes ready keys, most important first, and
+    handles one update per turn, so a slow handler only holds its own chat
+    and one worker. Animations run for tens of seconds and don't need to be
+    ordered; they run as separate tasks (at most `background_limit`) outside
+    the pool.
+
+    Under load, updates of a shed priority class are parked in a deferred
+    queue (at most `deferred_size`) and moved to their chats once the depth
+    drops below the class's threshold, so capture updates are handled first
+    and the webhook still answers 200.
+    """
+
+    def __init__(self, maxsize: int = 1000, workers: int = 16,
+                 shed_thresholds: Optional[Dict[int, int]] = None,
+                 background_limit: int = 100, deferred_size: Optional[int] = None) -> None:
+        """Initialize with total queue capacity, worker count, load shedding thresholds and animation limit.
+
+        shed_thresholds maps a priority class to the queue depth from which its
+        updates are no longer admitted. Deferred classes need a positive one,
+        their updates only move on below it.
+        """
+        for priority, threshold in (shed_thresholds or {}).items():
+            if priority != PRIORITY_ANIMATION and threshold <= 0:
+                raise ValueError(f"Shed threshold of {PRIORITY_NAMES[priority]} updates must be positive")
+        self.maxsize = maxsize
+        self.workers = workers
+        self.shed_thresholds = shed_thresholds or {}
+        self.background_limit = background_limit
+        self.deferred_size = maxsize if deferred_size is None else deferred_size
+        self._deferred: Deque[Tuple[UpdateKey, QueuedUpdate]] = deque()
+        self._deferred_keys: Dict[UpdateKey, int] = {}  # deferred updates per chat, to keep their order
+        self._chats: Dict[UpdateKey, Deque[QueuedUpdate]] = {}
+        self._ready: "asyncio.PriorityQueue[Tuple[int, int, UpdateKey]]" = asyncio.PriorityQueue()
+        self._sequence = itertools.count()
+        self._depth = 0
+        self._busy = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks: List[asyncio.Task] = []
+        self._background: Set[asyncio.Task] = set()
+
+        # Counters exported through stats()
+        self.enqueued = 0
+        self.dropped = 0
+        self.processed = 0
+        self.failed = 0
+        self.deferred = 0
+        self.shed = {priority: 0 for priority in PRIORITY_NAMES}
+
+    def register(self, app: web.Application) -> None:
+        """Start workers with the app and drain them on shutdown.
+
+        Must be registered before the request handlers so the queue is drained
+        before their bot sessions are closed.
+        """
+        app.on_startup.append(self._on_startup)
+        app.on_shutdown.append(self._on_shutdown)
+
+    async def _on_startup(self, app: web.Application) -> None:
+        await self.start()
+
+    async def _on_shutdown(self, app: web.Application) -> None:
+        await self.stop()
+
+    async def start(self) -> None:
+        """Spawn the worker pool."""
+        for index in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(index)))
+        logger.info(f"Update queue started: {self.workers} workers, capacity {self.maxsize}")
+
+    async def stop(self, timeout: float = 30) -> None:
+        """Wait for queued updates to be handled, then cancel the workers."""
+        self._drain_deferred(force=True)
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Update queue not drained in {timeout}s, {self.depth} updates lost")
+        for task in self._tasks:
+            task.cancel()
+        for task in self._background:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._background, return_exceptions=True)
+        self._tasks.clear()
+        logger.info("Update queue stopped")
+
+    @property
+    def depth(self) -> int:
+        """Number of updates waiting or being handled."""
+        return self._depth
+
+    def admit(self, priority: int) -> bool:
+        """Check whether an update of this priority class is accepted at the current depth."""
+        threshold = self.shed_thresholds.get(priority)
+        if threshold is not None and self.depth >= threshold:
+            self.shed[priority] += 1
+            return False
+        return True
+
+    def offer(self, dispatcher: Dispatcher, bot: Bot, update: Dict[str, Any], data: Dict[str, Any]) -> bool:
+        """Accept an update, shedding or deferring it under load. Returns False if there is no room for it."""
+        priority = update_priority(update)
+        key = update_key(bot.id, update)
+        if not self.admit(priority):
+            if priority == PRIORITY_ANIMATION:
+                return True  # Dropped, not worth a redelivery
+            return self._defer(key, (priority, dispatcher, bot, update, data))
+        if key in self._deferred_keys:
+            # Older updates of this chat are deferred, this one has to wait behind them
+            return self._defer(key, (priority, dispatcher, bot, update, data))
+        return self.put(dispatcher, bot, update, data, priority)
+
+    def _defer(self, key: UpdateKey, item: QueuedUpdate) -> bool:
+        if len(self._deferred) >= self.deferred_size:
+            # Refused like a full queue, so Telegram redelivers it instead of it being lost
+            self.dropped += 1
+            logger.warning(f"Deferred updates full, refusing update {item[3].get('update_id')} for bot {item[2].id}")
+            return False
+        self._deferred.append((key, item))
+        self._deferred_keys[key] = self._deferred_keys.get(key, 0) + 1
+        self.deferred += 1
+        return True
+
+    def _drain_deferred(self, force: bool = False) -> None:
+        """Move deferred updates to their chats while the depth allows their priority.
+
+        Entries whose threshold is not met are skipped, and so are later
+        entries of their chat to keep its order; other chats move on.
+        """
+        if not self._deferred:
+            return
+        waiting: Deque[Tuple[UpdateKey, QueuedUpdate]] = deque()
+        held: Set[UpdateKey] = set()
+        while self._deferred:
+            if not force and self.depth >= self.maxsize:
+                waiting.extend(self._deferred)
+                self._deferred.clear()
+                break
+            key, item = self._deferred.popleft()
+            threshold = self.shed_thresholds.get(item[0])
+            if not force and (key in held or (threshold is not None and self.depth >= threshold)):
+                held.add(key)
+                waiting.append((key, item))
+                continue
+            count = self._deferred_keys[key] - 1
+            if count:
+                self._deferred_keys[key] = count
+            else:
+                del self._deferred_keys[key]
+            self._enqueue(key, item)
+        self._deferred = waiting
+
+    def put(self, dispatcher: Dispatcher, bot: Bot, update: Dict[str, Any], data: Dict[str, Any],
+            priority: Optional[int] = None) -> bool:
+        """Enqueue an update without waiting. Returns False if the queue is full."""
+        if priority is None:
+            priority = update_priority(update)
+        if priority == PRIORITY_ANIMATION:
+            return self._run_in_background(dispatcher, bot, update, data)
+        if self._depth >= self.maxsize:
+            self.dropped += 1
+            logger.warning(f"Update queue full, dropping update {update.get('update_id')} for bot {bot.id}")
+            return False
+
+        self._enqueue(update_key(bot.id, update), (priority, dispatcher, bot, update, data))
+        return True
+
+    def _enqueue(self, key: UpdateKey, item: QueuedUpdate) -> None:
+        chat = self._chats.get(key)
+        if chat is None:
+            # No worker owns this chat right now, schedule it
+            self._chats[key] = deque([item])
+            self._ready.put_nowait((item[0], next(self._sequence), key))
+        else:
+            chat.append(item)
+        self._depth += 1
+        self._idle.clear()
+        self.enqueued += 1
+
+    def _run_in_background(self, dispatcher: Dispatcher, bot: Bot, update: Dict[str, Any],
+                           data: Dict[str, Any]) -> bool:
+        if len(self._background) >= self.background_limit:
+            self.dropped += 1
+            logger.warning(f"Too many animations running, dropping update {update.get('update_id')}")
+            return True  # Not worth a redelivery
+        task = asyncio.create_task(self._handle(dispatcher, bot, update, data))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        self.enqueued += 1
+        return True
+
+    async def _handle(self, dispatcher: Dispatcher, bot: Bot, update: Dict[str, Any], data: Dict[str, Any]) -> None:
+        try:
+            result = await dispatcher.feed_raw_update(bot=bot, update=update, **data)
+            if isinstance(result, TelegramMethod):
+                await dispatcher.silent_call_request(bot=bot, result=result)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.exception(f"Failed to process update {update.get('update_id')}: {e}")
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            _, _, key = await self._ready.get()
+            chat = self._chats[key]
+            _, dispatcher, bot, update, data = chat.popleft()
+            self._busy += 1
+            try:
+                await self._handle(dispatcher, bot, update, data)
+            finally:
+                self._busy -= 1
+                self._depth -= 1
+                if chat:
+                    # One update per turn, the chat goes back behind the other ready chats
+                    self._ready.put_nowait((chat[0][0], next(self._sequence), key))
+                else:
+                    del self._chats[key]
+                self._drain_deferred()
+                if self._depth == 0:
+                    self._idle.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and counters."""
+        return {
+            "depth": self.depth,
+            "deferred_depth": len(self._deferred),
+            "capacity": self.maxsize,
+            "chats": len(self._chats),
+            "max_chat_depth": max((len(chat) for chat in self._chats.values()), default=0),
+            "workers": self.workers,
+            "busy_workers": self._busy,
+            "animations": len(self._background),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "deferred": self.deferred,
+            "processed": self.processed,
+            "failed": self.failed,
+            "shed": {PRIORITY_NAMES[priority]: count for priority, count in self.shed.items()},
+        }
+
+
+async def read_update(bot: Bot, request: web.Request) -> Optional[Dict[str, Any]]:
+    """Return the raw update of a webhook request, None if the body is not one."""
+    try:
+        update = await request.json(loads=bot.session.json_loads)
+    except ValueError:
+        return None
+    if not isinstance(update, dict) or "update_id" not in update:
+        return None
+    return update
+
+
+class QueuedRequestHandlerMixin:
+    """Acknowledge webhook requests immediately and hand the update to an UpdateQueue."""
+
+    update_queue: UpdateQueue
+    deduplicator: Optional[UpdateDeduplicator] = None
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await read_update(bot, request)
+        if update is None:
+            return web.Response(body="Bad Request", status=400)
+
+        # Telegram redelivers updates it considers unanswered, handle each one once
+        if self.deduplicator and self.deduplicator.is_duplicate(bot.id, update["update_id"]):
+            return web.json_response({}, dumps=bot.session.json_dumps)
+
+        # Under load keep capacity for data capture: animations are dropped, other
+        # shed classes are deferred in process. Answering them non-2xx would make
+        # Telegram back off the whole webhook, capture updates included
+        if not self.update_queue.offer(self.dispatcher, bot, update, self.data):
+            # Queue full: non-2xx makes Telegram redeliver the update later instead of losing it
+            return web.Response(body="Service Unavailable", status=503, headers={"Retry-After": "1"})
+
+        if self.deduplicator:
+            self.deduplicator.add(bot.id, update["update_id"])
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+
+class QueuedSimpleRequestHandler(QueuedRequestHandlerMixin, PooledSimpleRequestHandler):
+    """PooledSimpleRequestHandler that feeds updates through an UpdateQueue."""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, update_queue: UpdateQueue,
+                 deduplicator: Optional[UpdateDeduplicator] = None,
+                 secret_token: Optional[str] = None, **data: Any) -> None:
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True,
+                         secret_token=secret_token, **data)
+        self.update_queue = update_queue
+        self.deduplicator = deduplicator
+
+
+class QueuedTokenBasedRequestHandler(QueuedRequestHandlerMixin, RegistryRequestHandler):
+    """RegistryRequestHandler that feeds updates through an UpdateQueue."""
+
+    def __init__(self, dispatcher: Dispatcher, update_queue: UpdateQueue,
+                 bot_registry: BotRegistry, deduplicator: Optional[UpdateDeduplicator] = None,
+                 **data: Any) -> None:
+        super().__init__(dispatcher=dispatcher, bot_registry=bot_registry,
+                         handle_in_background=True, **data)
+        self.update_queue = update_queue
+        self.deduplicator = deduplicator
+
+
+class InlineRequestHandlerMixin:
+    """Handle each webhook update in its own task, as aiogram does, dropping redeliveries.
+
+    Without a queue nothing bounds concurrency, but a redelivered update is
+    still handled only once.
+    """
+
+    deduplicator: Optional[UpdateDeduplicator] = None
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await read_update(bot, request)
+        if update is None:
+            return web.Response(body="Bad Request", status=400)
+
+        if self.deduplicator:
+            if self.deduplicator.is_duplicate(bot.id, update["update_id"]):
+                return web.json_response({}, dumps=bot.session.json_dumps)
+            self.deduplicator.add(bot.id, update["update_id"])
+
+        feed_update_task = asyncio.create_task(self._background_feed_update(bot=bot, update=update))
+        self._background_feed_update_tasks.add(feed_update_task)
+        feed_update_task.add_done_callback(self._background_feed_update_tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+
+class InlineSimpleRequestHandler(InlineRequestHandlerMixin, PooledSimpleRequestHandler):
+    """PooledSimpleRequestHandler that drops redelivered updates."""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, deduplicator: Optional[UpdateDeduplicator] = None,
+                 secret_token: Optional[str] = None, **data: Any) -> None:
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True,
+                         secret_token=secret_token, **data)
+        self.deduplicator = deduplicator
+
+
+class InlineTokenBasedRequestHandler(InlineRequestHandlerMixin, RegistryRequestHandler):
+    """RegistryRequestHandler that drops redelivered updates."""
+
+    def __init__(self, dispatcher: Dispatcher, bot_registry: BotRegistry,
+                 deduplicator: Optional[UpdateDeduplicator] = None, **data: Any) -> None:
+        super().__init__(dispatcher=dispatcher, bot_registry=bot_registry,
+                         handle_in_background=True, **data)
+        self.deduplicator = deduplicator
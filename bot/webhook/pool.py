@@ -0,0 +1,159 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.types import User
+from aiogram.utils.token import extract_bot_id
+
+from .http import TunedAiohttpSession
+
+logger = logging.getLogger(__name__)
+
+
+class BotPool:
+    """Process-wide Bot instances keyed by token.
+
+    Webhook handling, broadcasts and onboarding all take their Bot from here,
+    so every token has one instance sharing the pool's HTTP session. Bots are
+    kept in a size-capped LRU; pinned bots (the main bot) are never evicted.
+    The pool owns the sessions: Bots taken from it must not close them.
+
+    Bots listed in dedicated_bot_ids get their own session from
+    dedicated_session_factory, so their traffic (e.g. a broadcast) cannot
+    use up the connections of the shared session.
+
+    get_me() results are cached per token and refreshed after identity_ttl
+    seconds, so handlers can read the bot's username without an API call.
+    While a refresh fails the expired identity is served and retried after
+    identity_retry seconds.
+    """
+
+    def __init__(
+        self,
+        session: BaseSession,
+        max_bots: int = 500,
+        dedicated_session_factory: Optional[Callable[[], BaseSession]] = None,
+        dedicated_bot_ids: Iterable[int] = (),
+        identity_ttl: float = 3600,
+        identity_retry: float = 60,
+        **bot_kwargs: Any
+    ) -> None:
+        """Initialize with the shared session, LRU size, sub-pool settings, get_me lifetime and extra Bot kwargs."""
+        self.session = session
+        self.max_bots = max_bots
+        self.identity_ttl = identity_ttl
+        self.identity_retry = identity_retry
+        self.dedicated_session_factory = dedicated_session_factory
+        self.dedicated_bot_ids = set(dedicated_bot_ids)
+        self.bot_kwargs = bot_kwargs
+        self._sessions: Dict[int, BaseSession] = {}  # bot id -> dedicated session
+        self._bots: "OrderedDict[str, Bot]" = OrderedDict()
+        self._pinned: Dict[str, Bot] = {}
+        self._me: Dict[str, Tuple[float, User]] = {}  # token -> (expires at, get_me result)
+
+        # Counters exported through stats()
+        self.created = 0
+        self.evicted = 0
+        self.identity_hits = 0
+        self.identity_misses = 0
+        self.identity_errors = 0
+
+    def register(self, app: web.Application) -> None:
+        """Close the pool's session once the app has shut down."""
+        app.on_cleanup.append(self._on_cleanup)
+
+    async def _on_cleanup(self, app: web.Application) -> None:
+        await self.close()
+
+    def session_for(self, token: str) -> BaseSession:
+        """Return the bot's dedicated session if it has one, else the shared session."""
+        bot_id = extract_bot_id(token)
+        if bot_id not in self.dedicated_bot_ids or self.dedicated_session_factory is None:
+            return self.session
+        session = self._sessions.get(bot_id)
+        if session is None:
+            session = self._sessions[bot_id] = self.dedicated_session_factory()
+        return session
+
+    def pin(self, bot: Bot) -> None:
+        """Add a long-lived Bot (the main bot) that is never evicted."""
+        self._pinned[bot.token] = bot
+
+    def get(self, token: str) -> Bot:
+        """Return the Bot for a token, creating it on first use."""
+        bot = self._pinned.get(token)
+        if bot is not None:
+            return bot
+
+        bot = self._bots.get(token)
+        if bot is not None:
+            self._bots.move_to_end(token)
+            return bot
+
+        bot = Bot(token=token, session=self.session_for(token), **self.bot_kwargs)
+        self._bots[token] = bot
+        self.created += 1
+        if len(self._bots) > self.max_bots:
+            evicted_token, _ = self._bots.popitem(last=False)
+            self._me.pop(evicted_token, None)
+            self.evicted += 1
+        return bot
+
+    def discard(self, token: str) -> None:
+        """Forget a Bot, e.g. after its token turned out to be invalid."""
+        self._bots.pop(token, None)
+        self._me.pop(token, None)
+
+    async def get_me(self, bot: Bot) -> User:
+        """Return the cached get_me() result of a Bot, refreshing it once it expired."""
+        entry = self._me.get(bot.token)
+        if entry is not None and entry[0] > time.monotonic():
+            self.identity_hits += 1
+            return entry[1]
+        self.identity_misses += 1
+        try:
+            me = await bot.get_me()
+        except Exception as e:
+            if entry is None:
+                raise
+            self.identity_errors += 1
+            logger.warning(f"Refreshing the identity of bot {bot.id} failed, keeping @{entry[1].username}: {e}")
+            self._me[bot.token] = (time.monotonic() + self.identity_retry, entry[1])
+            return entry[1]
+        self._me[bot.token] = (time.monotonic() + self.identity_ttl, me)
+        return me
+
+    async def close(self) -> None:
+        """Close the shared and dedicated sessions."""
+        await self.session.close()
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+        self._bots.clear()
+        self._me.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return pool size and counters."""
+        return {
+            "bots": len(self._bots) + len(self._pinned),
+            "max_bots": self.max_bots,
+            "created": self.created,
+            "evicted": self.evicted,
+            "identities": len(self._me),
+            "identity_hits": self.identity_hits,
+            "identity_misses": self.identity_misses,
+            "identity_errors": self.identity_errors,
+        }
+
+    def http_stats(self) -> Dict[str, Any]:
+        """Return connection pool metrics of the shared and dedicated sessions."""
+        sessions = {"shared": self.session, **{str(bot_id): s for bot_id, s in self._sessions.items()}}
+        return {
+            name: session.stats()
+            for name, session in sessions.items()
+            if isinstance(session, TunedAiohttpSession)
+        }
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import secrets
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, TokenBasedRequestHandler
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from db import Webhook
+from .pool import BotPool
+
+logger = logging.getLogger(__name__)
+
+
+class BotRegistry:
+    """Allowlist of mirror bot tokens loaded from the webhooks table.
+
+    Token lookups are a dict membership test, Bot instances come from the
+    shared BotPool so unused mirrors do not stay in memory forever.
+    """
+
+    def __init__(
+        self,
+        session_pool: async_sessionmaker,
+        bot_pool: BotPool,
+        refresh_interval: float = 60,
+    ) -> None:
+        """Initialize with session pool, Bot pool and refresh period in seconds."""
+        self._session_pool = session_pool
+        self.bot_pool = bot_pool
+        self.refresh_interval = refresh_interval
+        self._tokens: Dict[str, Optional[str]] = {}  # token -> webhook secret
+        self._refresh_task: Optional[asyncio.Task] = None
+
+        # Counters exported through stats()
+        self.rejected = 0
+        self.unauthorized = 0
+
+    def register(self, app: web.Application) -> None:
+        """Load tokens on startup and keep them fresh while the app runs."""
+        app.on_startup.append(self._on_startup)
+        app.on_shutdown.append(self._on_shutdown)
+
+    async def _on_startup(self, app: web.Application) -> None:
+        await self.load()
+        self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def _on_shutdown(self, app: web.Application) -> None:
+        if self._refresh_task:
+            self._refresh_task.cancel()
+
+    async def _refresh_loop(self) -> None:
+        # Picks up bots added or removed by other worker processes
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.load()
+
+    async def load(self) -> None:
+        """Replace the allowlist with the tokens currently stored in the database."""
+        try:
+            async with self._session_pool() as session:
+                result = await session.execute(select(Webhook.token, Webhook.secret_token))
+                tokens = {token: secret for token, secret in result.all()}
+        except Exception as e:
+            logger.error(f"Error loading mirror bot tokens: {e}")
+            return
+
+        for token in self._tokens.keys() - tokens.keys():
+            self.bot_pool.discard(token)
+        self._tokens = tokens
+        logger.info(f"Loaded {len(tokens)} mirror bot tokens")
+
+    def add(self, token: str, secret_token: Optional[str] = None) -> None:
+        """Allow a token right after it was saved to the database."""
+        self._tokens[token] = secret_token
+
+    def remove(self, token: str) -> None:
+        """Forget a token and its cached Bot instance."""
+        self._tokens.pop(token, None)
+        self.bot_pool.discard(token)
+
+    def verify_secret(self, token: str, secret_token: str) -> bool:
+        """Compare the secret header of a request with the one stored for the bot."""
+        expected = self._tokens.get(token)
+        if expected is None:
+            # Bots added before secrets were introduced
+            return True
+        if secrets.compare_digest(secret_token, expected):
+            return True
+        self.unauthorized += 1
+        return False
+
+    def __contains__(self, token: str) -> bool:
+        return token in self._tokens
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def get_bot(self, token: str) -> Bot:
+        """Return the pooled Bot for an allowed token."""
+        return self.bot_pool.get(token)
+
+    def stats(self) -> Dict[str, int]:
+        """Return allowlist size and rejection counters."""
+        return {
+            "tokens": len(self._tokens),
+            "rejected": self.rejected,
+            "unauthorized": self.unauthorized,
+        }
+
+
+class PooledSimpleRequestHandler(SimpleRequestHandler):
+    """SimpleRequestHandler for a Bot taken from the BotPool, which owns the Bot's session."""
+
+    async def close(self) -> None:
+        # The pool's shared session is closed on app cleanup, after every handler is done
+        pass
+
+
+class RegistryRequestHandler(TokenBasedRequestHandler):
+    """TokenBasedRequestHandler that only serves tokens known to a BotRegistry.
+
+    Unknown tokens are rejected in resolve_bot and wrong secret tokens in
+    verify_secret, both before the request body is read.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot_registry: BotRegistry,
+                 handle_in_background: bool = True, **data: Any) -> None:
+        super().__init__(dispatcher=dispatcher, handle_in_background=handle_in_background, **data)
+        self.bot_registry = bot_registry
+
+    def verify_secret(self, telegram_secret_token: str, bot: Bot) -> bool:
+        return self.bot_registry.verify_secret(bot.token, telegram_secret_token)
+
+    async def close(self) -> None:
+        # Sessions belong to the BotPool and are closed on app cleanup
+        pass
+
+    async def resolve_bot(self, request: web.Request) -> Bot:
+        token = request.match_info["bot_token"]
+        if token not in self.bot_registry:
+            self.bot_registry.rejected += 1
+            raise web.HTTPNotFound()
+        return self.bot_registry.get_bot(token)
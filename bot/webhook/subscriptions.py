@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import secrets
+from typing import Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from db import Webhook
+from config import WEBHOOK_MAX_CONNECTIONS, WEBHOOK_MAX_CONNECTIONS_PER_BOT
+from .pool import BotPool
+
+logger = logging.getLogger(__name__)
+
+
+def max_connections_for(bot_id: int) -> int:
+    """Return the set_webhook max_connections configured for a bot."""
+    return WEBHOOK_MAX_CONNECTIONS_PER_BOT.get(bot_id, WEBHOOK_MAX_CONNECTIONS)
+
+
+async def reconcile_mirror_webhooks(
+    session_pool: async_sessionmaker,
+    bot_pool: BotPool,
+    allowed_updates: List[str],
+    concurrency: int = 5
+) -> Dict[str, int]:
+    """Re-apply allowed updates, secret token and max_connections to every mirror bot.
+
+    Rows created before webhook secrets existed get a new secret saved.
+    Pending updates are kept, the webhook URL does not change.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    counters = {"updated": 0, "failed": 0}
+
+    async with session_pool() as db_session:
+        webhooks = (await db_session.scalars(select(Webhook))).all()
+
+        async def reconcile(webhook: Webhook) -> None:
+            secret_token = webhook.secret_token or secrets.token_urlsafe(32)
+            mirror_bot = bot_pool.get(webhook.token)
+            async with semaphore:
+                try:
+                    await mirror_bot.set_webhook(
+                        webhook.webhook_url,
+                        allowed_updates=allowed_updates,
+                        secret_token=secret_token,
+                        max_connections=max_connections_for(webhook.bot_id)
+                    )
+                except Exception as e:
+                    counters["failed"] += 1
+                    logger.error(f"Error reconciling webhook for @{webhook.bot_username}: {e}")
+                    return
+            webhook.secret_token = secret_token
+            counters["updated"] += 1
+
+        await asyncio.gather(*(reconcile(webhook) for webhook in webhooks))
+        await db_session.commit()
+
+    logger.info(
+        f"Reconciled {counters['updated']} mirror webhooks ({counters['failed']} failed), "
+        f"allowed updates: {allowed_updates}"
+    )
+    return counters
@@ -1,4 +1,5 @@
 import os
+import hashlib
 from dotenv import load_dotenv
 
 # Load environment variables from the .env file in the current directory
@@ -13,11 +14,100 @@ WEB_SERVER_PORT = int(os.getenv("WEB_SERVER_PORT"))  # Convert to integer
 MAIN_BOT_PATH = os.getenv("MAIN_BOT_PATH")
 OTHER_BOTS_PATH = os.getenv("OTHER_BOTS_PATH")
 OTHER_BOTS_URL = f"{BASE_URL}{OTHER_BOTS_PATH}"
+# Secret Telegram sends in X-Telegram-Bot-Api-Secret-Token for the main bot,
+# derived from the token when not set so every worker process agrees on it
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or hashlib.sha256(f"webhook:{os.getenv('TOKEN')}".encode()).hexdigest()
 ADMIN = [2003019116,61444003,6973491393,7218613643,6438938979]
 
+# Webhook ingress: "queue" acknowledges updates immediately and processes them
+# on a pool of INGRESS_WORKERS, in order within each chat, "inline" keeps the
+# aiogram default of one task per update. Both drop redelivered updates
+INGRESS_MODE = os.getenv("INGRESS_MODE", "queue")
+# FSM storage shared by server processes (redis://...), required with --workers > 1
+REDIS_URL = os.getenv("REDIS_URL")
+INGRESS_QUEUE_SIZE = int(os.getenv("INGRESS_QUEUE_SIZE", 1000))
+INGRESS_WORKERS = int(os.getenv("INGRESS_WORKERS", 16))
+# Animations running at once, outside the worker pool
+INGRESS_ANIMATIONS_LIMIT = int(os.getenv("INGRESS_ANIMATIONS_LIMIT", 100))
+# Queue depth from which animations are dropped and commands are deferred
+INGRESS_SHED_ANIMATIONS_AT = int(os.getenv("INGRESS_SHED_ANIMATIONS_AT", INGRESS_QUEUE_SIZE // 2))
+INGRESS_SHED_COMMANDS_AT = int(os.getenv("INGRESS_SHED_COMMANDS_AT", INGRESS_QUEUE_SIZE * 4 // 5))
+
+# Redelivered update ids remembered per bot, and max number of bots tracked
+DEDUP_WINDOW = int(os.getenv("DEDUP_WINDOW", 2000))
+DEDUP_MAX_BOTS = int(os.getenv("DEDUP_MAX_BOTS", 1000))
+
+# set_webhook max_connections, default and per bot id overrides ("bot_id:limit,...")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 40))
+WEBHOOK_MAX_CONNECTIONS_PER_BOT = {
+    int(bot_id): int(limit)
+    for bot_id, limit in (
+        item.split(":") for item in os.getenv("WEBHOOK_MAX_CONNECTIONS_PER_BOT", "").split(",") if item
+    )
+}
+# Re-apply allowed updates, secrets and max_connections to all mirror bots on startup
+RECONCILE_WEBHOOKS_ON_STARTUP = os.getenv("RECONCILE_WEBHOOKS_ON_STARTUP", "1") == "1"
+
+# Mirror bots: max Bot instances kept in memory and allowlist refresh period (seconds)
+MIRROR_BOTS_CACHE_SIZE = int(os.getenv("MIRROR_BOTS_CACHE_SIZE", 500))
+MIRROR_BOTS_REFRESH_INTERVAL = int(os.getenv("MIRROR_BOTS_REFRESH_INTERVAL", 60))
+
+# Telegram API connection pool: total and per-host connection limits (0 = no
+# per-host cap), idle keep-alive and DNS cache TTL in seconds
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", 100))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", 0))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 30))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", 300))
+# Bot ids with their own sub-pool of HTTP_DEDICATED_POOL_LIMIT connections ("id,id,...")
+HTTP_DEDICATED_BOT_IDS = {int(bot_id) for bot_id in os.getenv("HTTP_DEDICATED_BOT_IDS", "").split(",") if bot_id}
+HTTP_DEDICATED_POOL_LIMIT = int(os.getenv("HTTP_DEDICATED_POOL_LIMIT", 20))
+
+# Cached business connections: lifetime in seconds and max entries per process
+BUSINESS_CONNECTION_TTL = int(os.getenv("BUSINESS_CONNECTION_TTL", 300))
+BUSINESS_CONNECTION_CACHE_SIZE = int(os.getenv("BUSINESS_CONNECTION_CACHE_SIZE", 10000))
+# Age in seconds after which a stored business_connections row is fetched again from the API
+BUSINESS_CONNECTION_PERSIST_TTL = int(os.getenv("BUSINESS_CONNECTION_PERSIST_TTL", 86400))
+
+# Seconds a bot's cached get_me result is used before it is fetched again
+BOT_IDENTITY_TTL = int(os.getenv("BOT_IDENTITY_TTL", 3600))
+
+# Write-behind MessageCache inserts: rows per batch and max seconds a row waits
+MESSAGE_CACHE_BATCH_SIZE = int(os.getenv("MESSAGE_CACHE_BATCH_SIZE", 500))
+MESSAGE_CACHE_FLUSH_INTERVAL = float(os.getenv("MESSAGE_CACHE_FLUSH_INTERVAL", 0.2))
+# Rows per transaction when moving message_cache rows from the old concatenated key
+MESSAGE_CACHE_BACKFILL_BATCH = int(os.getenv("MESSAGE_CACHE_BACKFILL_BATCH", 1000))
+# In-memory tier of recent messages for edit/delete lookups: total and per-chat limits
+RECENT_MESSAGES_SIZE = int(os.getenv("RECENT_MESSAGES_SIZE", 50000))
+RECENT_MESSAGES_PER_CHAT = int(os.getenv("RECENT_MESSAGES_PER_CHAT", 200))
+# Seconds deleted messages of one chat are collected into one report, and texts above which it becomes a .txt file
+DELETION_DIGEST_WINDOW = float(os.getenv("DELETION_DIGEST_WINDOW", 2.0))
+DELETION_TRANSCRIPT_AFTER = int(os.getenv("DELETION_TRANSCRIPT_AFTER", 30))
+# Broadcasts: messages per second per bot (Telegram allows about 30), concurrent sends per bot
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 30))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", 10))
+# Mirror bots broadcasting at the same time, and sends in flight across all of them
+BROADCAST_MAX_STREAMS = int(os.getenv("BROADCAST_MAX_STREAMS", 20))
+BROADCAST_MAX_SENDERS = int(os.getenv("BROADCAST_MAX_SENDERS", 100))
+# Broadcast jobs: recipients claimed per batch, seconds before an unacknowledged claim is retried, job polling
+BROADCAST_JOB_BATCH_SIZE = int(os.getenv("BROADCAST_JOB_BATCH_SIZE", 200))
+BROADCAST_JOB_LEASE = float(os.getenv("BROADCAST_JOB_LEASE", 300))
+BROADCAST_JOB_POLL_INTERVAL = float(os.getenv("BROADCAST_JOB_POLL_INTERVAL", 2))
+# Seconds between progress updates of the admin's status message
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", 3))
+# Days cached messages are kept, partition size ("day" or "week") and partitions created ahead (PostgreSQL)
+MESSAGE_CACHE_RETENTION_DAYS = float(os.getenv("MESSAGE_CACHE_RETENTION_DAYS", 30))
+MESSAGE_CACHE_PARTITION_PERIOD = os.getenv("MESSAGE_CACHE_PARTITION_PERIOD", "day")
+MESSAGE_CACHE_PARTITIONS_AHEAD = int(os.getenv("MESSAGE_CACHE_PARTITIONS_AHEAD", 3))
+# Seconds between retention runs
+MESSAGE_CACHE_RETENTION_INTERVAL = int(os.getenv("MESSAGE_CACHE_RETENTION_INTERVAL", 3600))
+
 if TOKEN is None:
     raise ValueError("TOKEN is not set in the .env file.")
 
+if INGRESS_SHED_COMMANDS_AT <= 0:
+    # Deferred commands are only moved on below this depth, at 0 they would never be
+    raise ValueError("INGRESS_SHED_COMMANDS_AT must be positive.")
+
 if DATABASE_URL is None:
     raise ValueError("DATABASE_URL is not set in the .env file.")
 
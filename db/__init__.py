@@ -1,2 +1,4 @@
-from .base import Base
+from .base import Base, add_missing_columns, content_hash, create_missing_indexes, insert_ignoring_conflicts
 from .model import *
+from .migrations import backfill_message_cache, dedupe_message_cache, dedupe_webhooks, prepare_message_cache_migration
+from .partitions import MessageCacheRetention, ensure_message_cache_partitions
@@ -1,4 +1,53 @@
+import hashlib
+import logging
+from typing import Optional
+
+from sqlalchemy import Insert, insert, inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.ext.asyncio import AsyncAttrs
 
+logger = logging.getLogger(__name__)
+
 class Base(DeclarativeBase, AsyncAttrs): ...
+
+
+def create_missing_indexes(connection) -> None:
+    """Create declared indexes that create_all skipped because their table already existed."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def add_missing_columns(connection) -> None:
+    """Add nullable columns declared on models to tables created before the columns existed."""
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable:
+                logger.error(f"Column {table.name}.{column.name} is NOT NULL and has to be added manually")
+                continue
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            logger.info(f"Added column {table.name}.{column.name}")
+
+
+def content_hash(text: Optional[str]) -> Optional[str]:
+    """Short digest of a message text, used to skip edits that did not change it."""
+    if text is None:
+        return None
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def insert_ignoring_conflicts(dialect_name: str, model) -> Insert:
+    """INSERT that skips rows whose primary key already exists, where the dialect supports it."""
+    if dialect_name == "postgresql":
+        return postgresql.insert(model).on_conflict_do_nothing()
+    if dialect_name == "sqlite":
+        return sqlite.insert(model).on_conflict_do_nothing()
+    return insert(model)
@@ -0,0 +1,214 @@
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import bindparam, inspect, select, text, tuple_
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from .base import insert_ignoring_conflicts
+from .model import MessageCache, Webhook
+
+logger = logging.getLogger(__name__)
+
+LEGACY_MESSAGE_CACHE = "message_cache_legacy"
+
+
+def _is_partitioned(connection, table: str) -> bool:
+    return connection.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+             "WHERE c.relname = :table)"),
+        {"table": table},
+    ).scalar()
+
+
+def prepare_message_cache_migration(connection) -> None:
+    """Rename a message_cache table with an outdated layout, run before create_all.
+
+    Outdated are tables keyed by the old concatenated id, tables without
+    created_at and (on PostgreSQL) tables that are not partitioned. create_all
+    then creates the current table and backfill_message_cache moves the old
+    rows over in batches.
+    """
+    inspector = inspect(connection)
+    table = MessageCache.__tablename__
+    if not inspector.has_table(table):
+        return
+    primary_key = inspector.get_pk_constraint(table)
+    columns = {column["name"] for column in inspector.get_columns(table)}
+    outdated = (
+        primary_key["constrained_columns"] == ["message_id"]
+        or "created_at" not in columns
+        or (connection.dialect.name == "postgresql" and not _is_partitioned(connection, table))
+    )
+    if not outdated:
+        return
+    if inspector.has_table(LEGACY_MESSAGE_CACHE):
+        logger.error(f"Both message_cache and {LEGACY_MESSAGE_CACHE} have an outdated layout, migrate manually")
+        return
+
+    connection.execute(text(f"ALTER TABLE {MessageCache.__tablename__} RENAME TO {LEGACY_MESSAGE_CACHE}"))
+    if connection.dialect.name == "postgresql" and primary_key.get("name"):
+        # Index names are global in PostgreSQL, the new table needs message_cache_pkey
+        connection.execute(text(f'ALTER INDEX "{primary_key["name"]}" RENAME TO {LEGACY_MESSAGE_CACHE}_pkey'))
+    logger.info(f"Renamed message_cache to {LEGACY_MESSAGE_CACHE}, rows will be backfilled")
+
+
+def delete_superseded_messages(connection, table: str = MessageCache.__tablename__) -> int:
+    """Delete all but the newest row of every (user_id, chat_id, message_id) in table.
+
+    Run before a unique index on that key is created, the table may be a
+    message_cache partition.
+    """
+    result = connection.execute(text(
+        f"DELETE FROM {table} WHERE EXISTS ("
+        f"SELECT 1 FROM {table} newer WHERE newer.user_id = {table}.user_id "
+        f"AND newer.chat_id = {table}.chat_id AND newer.message_id = {table}.message_id "
+        f"AND newer.created_at > {table}.created_at)"
+    ))
+    if result.rowcount:
+        logger.info(f"Deleted {result.rowcount} superseded rows from {table}")
+    return result.rowcount
+
+
+def dedupe_message_cache(connection) -> None:
+    """Delete duplicate messages before create_missing_indexes adds idx_message_cache_message.
+
+    PostgreSQL keeps the key unique per partition instead, see
+    ensure_message_cache_partitions.
+    """
+    if connection.dialect.name == "postgresql":
+        return
+    inspector = inspect(connection)
+    table = MessageCache.__tablename__
+    if not inspector.has_table(table):
+        return
+    if any(index["name"] == "idx_message_cache_message" for index in inspector.get_indexes(table)):
+        return
+    delete_superseded_messages(connection, table)
+
+
+def dedupe_webhooks(connection) -> None:
+    """Delete duplicate webhooks before create_missing_indexes adds the unique token and bot_id indexes.
+
+    Of several rows with the same bot_id or token the newest (highest id)
+    is kept, it holds the token and secret Telegram was given last.
+    """
+    inspector = inspect(connection)
+    table = Webhook.__tablename__
+    if not inspector.has_table(table):
+        return
+    indexes = {index["name"] for index in inspector.get_indexes(table)}
+    if {"idx_webhook_token", "idx_webhook_bot_id"} <= indexes:
+        return
+    result = connection.execute(text(
+        f"DELETE FROM {table} WHERE EXISTS ("
+        f"SELECT 1 FROM {table} newer WHERE newer.id > {table}.id "
+        f"AND (newer.bot_id = {table}.bot_id OR newer.token = {table}.token))"
+    ))
+    if result.rowcount:
+        logger.info(f"Deleted {result.rowcount} duplicate webhooks")
+
+
+def decode_legacy_message_id(key: int, chat_id: int) -> Optional[int]:
+    """Recover the Telegram message id from an int(f"{chat_id}{message_id}") key."""
+    key_digits, chat_digits = str(key), str(chat_id)
+    if len(key_digits) <= len(chat_digits) or not key_digits.startswith(chat_digits):
+        return None
+    return int(key_digits[len(chat_digits):])
+
+
+async def _existing_message_keys(session, keys: list) -> set:
+    """Return which (user_id, chat_id, message_id) keys message_cache already holds."""
+    if not keys:
+        return set()
+    table = MessageCache.__table__
+    logical_key = tuple_(table.c.user_id, table.c.chat_id, table.c.message_id)
+    rows = await session.execute(select(*logical_key.clauses).where(logical_key.in_(keys)))
+    return {tuple(row) for row in rows}
+
+
+async def backfill_message_cache(session_pool: async_sessionmaker, batch_size: int = 1000) -> int:
+    """Move rows from the legacy table to message_cache in batches, then drop it.
+
+    Message ids of tables with the old concatenated key are decoded, rows
+    without created_at get the time of the backfill; messages that were cached
+    again since the rename keep the newer row. Each batch is copied and
+    deleted in one transaction, so the backfill can be interrupted and
+    resumed, and several processes may run it at once.
+    """
+    def inspect_legacy(sync_connection):
+        inspector = inspect(sync_connection)
+        if not inspector.has_table(LEGACY_MESSAGE_CACHE):
+            return None
+        primary_key = inspector.get_pk_constraint(LEGACY_MESSAGE_CACHE)["constrained_columns"]
+        columns = {column["name"] for column in inspector.get_columns(LEGACY_MESSAGE_CACHE)}
+        return primary_key, columns
+
+    async with session_pool() as session:
+        connection = await session.connection()
+        legacy = await connection.run_sync(inspect_legacy)
+        if legacy is None:
+            return 0
+        dialect = connection.dialect.name
+    primary_key, columns = legacy
+    concatenated_key = primary_key == ["message_id"]
+    key_columns = ", ".join(primary_key)
+
+    lock = " FOR UPDATE SKIP LOCKED" if dialect == "postgresql" else ""
+    created_at = "created_at" if "created_at" in columns else "NULL AS created_at"
+    select_batch = text(
+        f"SELECT message_id, chat_id, user_full_name, text, message_type, additional_info, user_id, {created_at} "
+        f"FROM {LEGACY_MESSAGE_CACHE} ORDER BY {key_columns} LIMIT :limit{lock}"
+    )
+    delete_batch = text(
+        f"DELETE FROM {LEGACY_MESSAGE_CACHE} WHERE ({key_columns}) IN :keys"
+    ).bindparams(bindparam("keys", expanding=True))
+
+    moved = 0
+    skipped = 0
+    while True:
+        async with session_pool() as session:
+            async with session.begin():
+                rows = (await session.execute(select_batch, {"limit": batch_size})).all()
+                if not rows:
+                    break
+
+                latest = {}
+                now = datetime.utcnow()
+                for row in rows:
+                    if concatenated_key:
+                        message_id = decode_legacy_message_id(row.message_id, row.chat_id)
+                    else:
+                        message_id = row.message_id
+                    if message_id is None:
+                        skipped += 1
+                        continue
+                    key = (row.user_id, row.chat_id, message_id)
+                    if key in latest and (row.created_at or now) <= latest[key]["created_at"]:
+                        continue
+                    latest[key] = {
+                        "user_id": row.user_id,
+                        "chat_id": row.chat_id,
+                        "message_id": message_id,
+                        "created_at": row.created_at or now,
+                        "user_full_name": row.user_full_name,
+                        "text": row.text,
+                        "message_type": row.message_type,
+                        "additional_info": row.additional_info,
+                    }
+                # created_at is part of the primary key, so a message cached since
+                # the rename would not conflict with its backfilled copy
+                existing = await _existing_message_keys(session, list(latest))
+                values = [value for key, value in latest.items() if key not in existing]
+                if values:
+                    await session.execute(insert_ignoring_conflicts(dialect, MessageCache), values)
+                keys = [tuple(getattr(row, column) for column in primary_key) for row in rows]
+                await session.execute(delete_batch, {"keys": keys})
+        moved += len(values)
+        logger.info(f"Backfilled {moved} cached messages")
+
+    async with session_pool() as session:
+        async with session.begin():
+            await session.execute(text(f"DROP TABLE IF EXISTS {LEGACY_MESSAGE_CACHE}"))
+    logger.info(f"Message cache backfill finished: {moved} rows moved, {skipped} undecodable rows dropped")
+    return moved
@@ -18,17 +18,56 @@ class Spyusers(Base):
     )
 
 
+class BotAudience(Base):
+    """Users who started a bot, so broadcasts through it only go to them."""
+    __tablename__ = "bot_audience"
+
+    bot_id = mapped_column(BigInteger, primary_key=True)
+    user_id = mapped_column(BigInteger, primary_key=True)
+    started_at = mapped_column(DateTime, nullable=False, default=datetime.utcnow)  # First /start, UTC
+
+    # The primary key serves per-bot scans, this one the bots of a user
+    __table_args__ = (
+        Index('idx_bot_audience_user_id', 'user_id'),
+    )
+
+
 class MessageCache(Base):
-    """Table for storing cached messages."""
+    """Table for storing cached messages.
+
+    Keyed by (owner, chat, message): message ids are only unique within one
+    business account's chat. The primary key index also serves per-owner and
+    per-chat scans.
+
+    On PostgreSQL the table is range-partitioned by created_at (the message
+    date), so retention drops whole partitions, see db/partitions.py. The
+    partition key has to be part of the table's primary key, the ORM identity
+    stays (user_id, chat_id, message_id). That logical key is kept unique by
+    idx_message_cache_message on other databases and by a unique index on
+    every partition on PostgreSQL, where a unique index on the partitioned
+    table would have to include created_at.
+    """
     __tablename__ = "message_cache"
 
-    message_id = mapped_column(BigInteger, primary_key=True)  # Changed from Integer to BigInteger
-    chat_id = mapped_column(BigInteger, nullable=False)
+    user_id = mapped_column(BigInteger, primary_key=True)  # Owner of the business account
+    chat_id = mapped_column(BigInteger, primary_key=True)
+    message_id = mapped_column(BigInteger, primary_key=True)  # Telegram message id within the chat
+    created_at = mapped_column(DateTime, primary_key=True, default=datetime.utcnow)  # Message date, UTC
     user_full_name = mapped_column(String(255), nullable=False)
     text = mapped_column(Text, nullable=False)
     message_type = mapped_column(String(50), nullable=False, default="text")
     additional_info = mapped_column(Text, nullable=True)
-    user_id = mapped_column(BigInteger, nullable=False)
+    content_hash = mapped_column(String(32), nullable=True)  # Digest of text, see db.base.content_hash
+
+    __table_args__ = (
+        Index('idx_message_cache_message', 'user_id', 'chat_id', 'message_id', unique=True).ddl_if(
+            callable_=lambda ddl, target, bind, dialect, **kw: dialect.name != "postgresql"
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    __mapper_args__ = {
+        "primary_key": [user_id, chat_id, message_id],
+    }
 
 
 class Webhook(Base):
@@ -39,8 +78,73 @@ class Webhook(Base):
     bot_username = mapped_column(String(255), nullable=False)  # ✅ Должно быть
     token = mapped_column(String(255), nullable=False)  # ✅ Должно быть
     webhook_url = mapped_column(String(255), nullable=False)
+    secret_token = mapped_column(String(256), nullable=True)  # X-Telegram-Bot-Api-Secret-Token
 
     __table_args__ = (
         Index('idx_webhook_url', 'webhook_url'),
+        Index('idx_webhook_token', 'token', unique=True),
+        Index('idx_webhook_bot_id', 'bot_id', unique=True),
     )
 
+
+
+class BusinessConnections(Base):
+    """Business connections of all bots, kept for cold starts."""
+    __tablename__ = "business_connections"
+
+    bot_id = mapped_column(BigInteger, primary_key=True)
+    connection_id = mapped_column(String(255), primary_key=True)
+    user_id = mapped_column(BigInteger, nullable=False)  # Owner of the business account
+    can_reply = mapped_column(Boolean, nullable=False, default=False)
+    is_enabled = mapped_column(Boolean, nullable=False, default=True)
+    data = mapped_column(Text, nullable=False)  # BusinessConnection as JSON
+    updated_at = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_business_connections_user_id', 'user_id'),
+        Index('idx_business_connections_updated_at', 'updated_at'),
+    )
+
+
+class BroadcastJob(Base):
+    """A broadcast that survives restarts, its recipients are in broadcast_deliveries."""
+    __tablename__ = "broadcast_jobs"
+
+    id = mapped_column(Integer, primary_key=True, autoincrement=True)
+    admin_id = mapped_column(BigInteger, nullable=False)
+    target = mapped_column(String(20), nullable=False)  # "users" (main bot) or "mirrors"
+    payload = mapped_column(Text, nullable=False)  # BroadcastPayload.to_state() as JSON
+    status = mapped_column(String(20), nullable=False, default="running")  # running, paused, cancelled, done
+    total = mapped_column(Integer, nullable=False, default=0)
+    sent = mapped_column(Integer, nullable=False, default=0)
+    failed = mapped_column(Integer, nullable=False, default=0)
+    blocked = mapped_column(Integer, nullable=False, default=0)
+    status_chat_id = mapped_column(BigInteger, nullable=True)  # Admin's progress message
+    status_message_id = mapped_column(BigInteger, nullable=True)
+    created_at = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('idx_broadcast_jobs_status', 'status'),
+    )
+
+
+class BroadcastDelivery(Base):
+    """One recipient of a broadcast job through one bot, the job's cursor.
+
+    Rows go from pending to claimed (by a worker process, for lease seconds)
+    to sent, failed or blocked. Claims that were never acknowledged, e.g.
+    after a crash, become pending again once the lease expires.
+    """
+    __tablename__ = "broadcast_deliveries"
+
+    job_id = mapped_column(Integer, primary_key=True)
+    bot_id = mapped_column(BigInteger, primary_key=True)
+    user_id = mapped_column(BigInteger, primary_key=True)
+    status = mapped_column(String(16), nullable=False, default="pending")
+    claimed_by = mapped_column(String(64), nullable=True)
+    claimed_at = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('idx_broadcast_deliveries_job_status', 'job_id', 'status', 'bot_id'),
+    )
@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from sqlalchemy import delete, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from .migrations import delete_superseded_messages
+from .model import MessageCache
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PERIODS = {
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+DEFAULT_PARTITION = f"{MessageCache.__tablename__}_default"
+
+_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def partition_start(moment: datetime, period: str) -> datetime:
+    """Return the start of the day or week (Monday) containing moment."""
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "week":
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def list_message_cache_partitions(connection) -> List[Tuple[str, Optional[datetime], Optional[datetime]]]:
+    """Return (name, from, to) of every message_cache partition, None bounds for the default one."""
+    rows = connection.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+        "FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :table"
+    ), {"table": MessageCache.__tablename__}).all()
+
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND.search(bound or "")
+        if match is None:
+            partitions.append((name, None, None))
+        else:
+            partitions.append((name, datetime.fromisoformat(match.group(1)), datetime.fromisoformat(match.group(2))))
+    return partitions
+
+
+def ensure_message_cache_partitions(connection, period: str = "day", ahead: int = 3) -> int:
+    """Create the partitions for the current period and the next ones, plus the default partition.
+
+    The default partition takes rows outside the created ranges, e.g. edits
+    of messages sent before the first partition existed. Every partition gets
+    a unique index on (user_id, chat_id, message_id), see
+    ensure_message_key_indexes. Only PostgreSQL tables are partitioned,
+    other dialects are left alone.
+    """
+    if connection.dialect.name != "postgresql":
+        return 0
+
+    table = MessageCache.__tablename__
+    existing = {name for name, _, _ in list_message_cache_partitions(connection)}
+    if DEFAULT_PARTITION not in existing:
+        connection.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {table} DEFAULT"))
+
+    created = 0
+    start = partition_start(datetime.utcnow(), period)
+    for _ in range(ahead + 1):
+        end = start + PARTITION_PERIODS[period]
+        name = f"{table}_p{start:%Y%m%d}"
+        if name not in existing:
+            try:
+                # Savepoint, an overlap with partitions of another period must not abort the transaction
+                with connection.begin_nested():
+                    connection.execute(text(
+                        f"CREATE TABLE {name} PARTITION OF {table} "
+                        f"FOR VALUES FROM ('{start:%Y-%m-%d %H:%M:%S}') TO ('{end:%Y-%m-%d %H:%M:%S}')"
+                    ))
+                created += 1
+                logger.info(f"Created partition {name}")
+            except Exception as e:
+                logger.error(f"Error creating partition {name}: {e}")
+        start = end
+    ensure_message_key_indexes(connection)
+    return created
+
+
+def ensure_message_key_indexes(connection) -> List[str]:
+    """Create the unique (user_id, chat_id, message_id) index on partitions that lack it.
+
+    A unique index on the partitioned table would have to include
+    created_at, so the logical key is enforced per partition. Duplicates
+    left in a partition are deleted first, keeping the newest row.
+    """
+    indexed = set(connection.execute(text(
+        "SELECT tablename FROM pg_indexes WHERE indexname = tablename || '_message_key'"
+    )).scalars())
+    created = []
+    for name, _, _ in list_message_cache_partitions(connection):
+        if name in indexed:
+            continue
+        try:
+            with connection.begin_nested():
+                delete_superseded_messages(connection, name)
+                connection.execute(text(
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_message_key ON {name} (user_id, chat_id, message_id)"
+                ))
+            created.append(name)
+            logger.info(f"Created unique message key index on {name}")
+        except Exception as e:
+            logger.error(f"Error creating unique message key index on {name}: {e}")
+    return created
+
+
+def drop_expired_message_cache_partitions(connection, retention: timedelta) -> List[str]:
+    """Drop the partitions whose whole range is older than the retention period."""
+    if connection.dialect.name != "postgresql":
+        return []
+
+    cutoff = datetime.utcnow() - retention
+    dropped = []
+    for name, _, end in list_message_cache_partitions(connection):
+        if end is not None and end <= cutoff:
+            connection.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            dropped.append(name)
+            logger.info(f"Dropped expired partition {name}")
+    return dropped
+
+
+class MessageCacheRetention:
+    """Background task that keeps message_cache partitions ahead and purges expired data.
+
+    On PostgreSQL expired partitions are dropped as a whole, only the default
+    partition is cleaned with batched DELETEs. Other databases have no
+    partitions and get a plain DELETE.
+    """
+
+    def __init__(
+        self,
+        session_pool: async_sessionmaker,
+        retention_days: float = 30,
+        period: str = "day",
+        ahead: int = 3,
+        interval: float = 3600,
+        batch_size: int = 10000,
+    ) -> None:
+        """Initialize with session pool, retention, partition period, periods created ahead and run interval."""
+        if period not in PARTITION_PERIODS:
+            raise ValueError(f"Unknown partition period {period!r}, expected one of {list(PARTITION_PERIODS)}")
+        self._session_pool = session_pool
+        self.retention = timedelta(days=retention_days)
+        self.period = period
+        self.ahead = ahead
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+        # Counters exported through stats()
+        self.partitions_created = 0
+        self.partitions_dropped = 0
+        self.rows_deleted = 0
+        self.last_run: Optional[datetime] = None
+
+    def register(self, app: web.Application) -> None:
+        """Run maintenance on startup and then every interval while the app runs."""
+        app.on_startup.append(self._on_startup)
+        app.on_shutdown.append(self._on_shutdown)
+
+    async def _on_startup(self, app: web.Application) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def _on_shutdown(self, app: web.Application) -> None:
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.exception(f"Error in message cache retention: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> None:
+        """Create upcoming partitions and purge data older than the retention period."""
+        async with self._session_pool() as session:
+            connection = await session.connection()
+            postgres = connection.dialect.name == "postgresql"
+            if postgres:
+                self.partitions_created += await connection.run_sync(
+                    ensure_message_cache_partitions, self.period, self.ahead
+                )
+                dropped = await connection.run_sync(drop_expired_message_cache_partitions, self.retention)
+                self.partitions_dropped += len(dropped)
+            await session.commit()
+
+        cutoff = datetime.utcnow() - self.retention
+        if postgres:
+            # Only rows outside the date ranges live in the default partition, delete them in batches
+            purge = text(
+                f"DELETE FROM {DEFAULT_PARTITION} WHERE ctid IN ("
+                f"SELECT ctid FROM {DEFAULT_PARTITION} WHERE created_at < :cutoff LIMIT :limit)"
+            )
+            while True:
+                async with self._session_pool() as session:
+                    result = await session.execute(purge, {"cutoff": cutoff, "limit": self.batch_size})
+                    await session.commit()
+                self.rows_deleted += result.rowcount
+                if result.rowcount < self.batch_size:
+                    break
+        else:
+            # No partitions without PostgreSQL, fall back to a plain DELETE
+            async with self._session_pool() as session:
+                result = await session.execute(delete(MessageCache).where(MessageCache.created_at < cutoff))
+                await session.commit()
+            self.rows_deleted += result.rowcount
+        self.last_run = datetime.utcnow()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return maintenance counters."""
+        return {
+            "retention_days": self.retention.days,
+            "period": self.period,
+            "partitions_created": self.partitions_created,
+            "partitions_dropped": self.partitions_dropped,
+            "rows_deleted": self.rows_deleted,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+        }
@@ -1,13 +1,17 @@
+import argparse
 import asyncio
 import logging
+import multiprocessing
+import signal
 import sys
+from typing import List, Tuple
 import aiohttp  # Add missing import
 from aiohttp import web
-from aiogram.types import Update
 from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler, TokenBasedRequestHandler, setup_application
+from aiogram.webhook.aiohttp_server import setup_application
 
 # Configure logging - increase level to debug for more information
 logging.basicConfig(
@@ -24,15 +28,48 @@ from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy import select
 
 from bot.hendlers import setup_routers
+from bot.broadcast import BroadcastJobs
+from bot.utils import DeletionNotifier, MessageCacheBuffer, RecentMessages
 from bot.callback import call_router
-from bot.middlewares import DbSessionMiddleware
+from bot.middlewares import (
+    BotIdentityMiddleware,
+    BusinessConnectionCache,
+    BusinessConnectionMiddleware,
+    DbSessionMiddleware,
+)
+from bot.webhook import (
+    PRIORITY_ANIMATION,
+    PRIORITY_COMMAND,
+    BotPool,
+    BotRegistry,
+    TunedAiohttpSession,
+    UpdateDeduplicator,
+    InlineSimpleRequestHandler,
+    InlineTokenBasedRequestHandler,
+    UpdateQueue,
+    QueuedSimpleRequestHandler,
+    QueuedTokenBasedRequestHandler,
+    max_connections_for,
+    reconcile_mirror_webhooks,
+)
 
-from db import Base, Webhook
+from db import (
+    Base,
+    MessageCacheRetention,
+    Webhook,
+    add_missing_columns,
+    backfill_message_cache,
+    create_missing_indexes,
+    dedupe_message_cache,
+    dedupe_webhooks,
+    ensure_message_cache_partitions,
+    prepare_message_cache_migration,
+)
 from config import *
 
-# Database setup
-_engine = create_async_engine(DATABASE_URL)
-_sessionmaker = async_sessionmaker(_engine, expire_on_commit=False)
+# Database setup - created per process by init_database()
+_engine = None
+_sessionmaker = None
 
 # Define bot variable at module level
 bot = None
@@ -43,6 +80,12 @@ class LoggingMiddleware:
         logger.info(f"Received update: {event}")
         return await handler(event, data)
 
+def init_database():
+    """Create the SQLAlchemy engine and session factory for the current process."""
+    global _engine, _sessionmaker
+    _engine = create_async_engine(DATABASE_URL)
+    _sessionmaker = async_sessionmaker(_engine, expire_on_commit=False)
+
 async def fetch_webhook_urls():
     """Fetch all webhook URLs from the database."""
     async with _sessionmaker() as session:
@@ -73,7 +116,8 @@ async def register_webhook_urls(app):
             except Exception as e:
                 logger.error(f"Error notifying webhook {url}: {e}")
 
-async def on_startup(app) -> None:
+async def on_startup(app, dispatcher: Dispatcher, mirror_allowed_updates: List[str],
+                     bot_pool: BotPool) -> None:
     logger.info("Bot starting up...")
     
     # Set webhook for the main bot only
@@ -85,25 +129,44 @@ async def on_startup(app) -> None:
     logger.info("Previous webhook deleted")
     
     # Then set the new webhook
+    allowed_updates = dispatcher.resolve_used_update_types()
     await bot.set_webhook(
         webhook_url,
-        allowed_updates=Update.model_fields.keys()    
+        allowed_updates=allowed_updates,
+        secret_token=WEBHOOK_SECRET,
+        max_connections=max_connections_for(bot.id)
     )
-    logger.info(f"Webhook set to {webhook_url}")
+    logger.info(f"Webhook set to {webhook_url}, allowed updates: {allowed_updates}")
     
-    # Get bot info to confirm everything is working
-    bot_info = await bot.get_me()
+    # Get bot info to confirm everything is working, this also fills the get_me cache
+    bot_info = await bot_pool.get_me(bot)
     logger.info(f"Bot authorized as @{bot_info.username} (ID: {bot_info.id})")
     
     # Initialize database
     async with _engine.begin() as conn:
+        # Old message_cache tables are renamed and backfilled by the message cache migration
+        await conn.run_sync(prepare_message_cache_migration)
         await conn.run_sync(Base.metadata.create_all)
+        # create_all skips columns and indexes of tables that already exist
+        await conn.run_sync(add_missing_columns)
+        # Unique indexes can only be added once existing duplicates are gone
+        await conn.run_sync(dedupe_message_cache)
+        await conn.run_sync(dedupe_webhooks)
+        await conn.run_sync(create_missing_indexes)
+        # Partitions for today and the next periods must exist before workers insert
+        await conn.run_sync(
+            ensure_message_cache_partitions, MESSAGE_CACHE_PARTITION_PERIOD, MESSAGE_CACHE_PARTITIONS_AHEAD
+        )
     logger.info("Database tables created")
     
     # Register webhooks for mirror bots from the database
     # The actual webhook handling is done through the multibot_dispatcher
     await register_webhook_urls(app)
 
+    # Re-apply allowed updates, secrets and max_connections to existing mirror bots
+    if RECONCILE_WEBHOOKS_ON_STARTUP:
+        await reconcile_mirror_webhooks(_sessionmaker, bot_pool, mirror_allowed_updates)
+
 async def on_shutdown() -> None:
     # Delete webhook before shutdown to avoid getting updates when bot is offline
     await bot.delete_webhook(drop_pending_updates=True)
@@ -114,6 +177,35 @@ async def on_shutdown() -> None:
     await _engine.dispose()
     logger.info("Database connections closed")
 
+async def close_database() -> None:
+    """Close this worker's database connection pool."""
+    await _engine.dispose()
+    logger.info("Database connections closed")
+
+async def leader_startup() -> None:
+    """Run the one-time startup work before worker processes are forked."""
+    global bot
+    init_database()
+    bot_pool = BotPool(AiohttpSession())
+    bot = bot_pool.get(TOKEN)
+    main_dispatcher, _ = setup_dispatchers(bot_pool)
+    try:
+        await on_startup(None, main_dispatcher, main_dispatcher["mirror_allowed_updates"], bot_pool)
+    finally:
+        await bot_pool.close()
+        # Workers create their own pools, no connection may be inherited through fork
+        await _engine.dispose()
+
+async def leader_shutdown() -> None:
+    """Delete the webhook once all worker processes have exited."""
+    global bot
+    init_database()
+    bot = Bot(token=TOKEN, session=AiohttpSession())
+    try:
+        await on_shutdown()
+    finally:
+        await bot.session.close()
+
 # Debug handler to check if updates are being received
 async def debug_update(message: Message):
     logger.debug(f"Received update: {message}")
@@ -124,94 +216,361 @@ async def test_webhook(request):
     logger.info("Test webhook endpoint called")
     return web.json_response({"ok": True, "message": "Webhook endpoint is reachable"})
 
-def main():
-    try:
-        # Basic setup
-        logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+def fsm_storage() -> BaseStorage:
+    """FSM storage, in Redis when REDIS_URL is set so all worker processes share it."""
+    if not REDIS_URL:
+        return MemoryStorage()
+    # Needs the redis package, only imported when configured
+    from aiogram.fsm.storage.redis import RedisStorage
+    return RedisStorage.from_url(REDIS_URL)
+
+def setup_dispatchers(bot_pool: BotPool) -> Tuple[Dispatcher, Dispatcher]:
+    """Create the main and mirror dispatchers with their middlewares and routers."""
+    # Storage for FSM
+    storage = fsm_storage()
+
+    # Business connections shared by both dispatchers, refreshed by business_connection updates
+    business_connection_cache = BusinessConnectionCache(
+        ttl=BUSINESS_CONNECTION_TTL,
+        max_size=BUSINESS_CONNECTION_CACHE_SIZE,
+        session_pool=_sessionmaker,
+        persist_ttl=BUSINESS_CONNECTION_PERSIST_TTL,
+    )
 
-        # Create session for API calls
-        session = AiohttpSession()
-        bot_settings = {"session": session}
+    # Main dispatcher for primary bot
+    main_dispatcher = Dispatcher(storage=storage)
 
-        # Main bot setup - define globally to use in on_startup/on_shutdown
-        global bot
-        bot = Bot(token=TOKEN, **bot_settings)
+    # Resolve the business connection before a database session is opened
+    main_dispatcher.business_message.middleware(BusinessConnectionMiddleware(business_connection_cache))
+    main_dispatcher.edited_business_message.middleware(BusinessConnectionMiddleware(business_connection_cache))
+    main_dispatcher.deleted_business_messages.middleware(BusinessConnectionMiddleware(business_connection_cache))
+    # Cached get_me for handlers that show the bot's name
+    main_dispatcher.message.middleware(BotIdentityMiddleware(bot_pool))
+    main_dispatcher.business_message.middleware(BotIdentityMiddleware(bot_pool))
 
-        # Storage for FSM
-        storage = MemoryStorage()
+    # Apply middleware to all types of updates
+    main_dispatcher.message.middleware(DbSessionMiddleware(_sessionmaker))
+    main_dispatcher.business_message.middleware(DbSessionMiddleware(_sessionmaker))
+    main_dispatcher.deleted_business_messages.middleware(DbSessionMiddleware(_sessionmaker))
+    main_dispatcher.edited_business_message.middleware(DbSessionMiddleware(_sessionmaker))
+    main_dispatcher.callback_query.middleware(DbSessionMiddleware(_sessionmaker))
+    # main_dispatcher.update.middleware(LoggingMiddleware())
 
-        # Main dispatcher for primary bot
-        main_dispatcher = Dispatcher(storage=storage)
+    # Add debug handler to check if updates are being received
+    main_dispatcher.message.register(debug_update, F.text == "/debug")
 
-        # Apply middleware to all types of updates
-        main_dispatcher.message.middleware(DbSessionMiddleware(_sessionmaker))
-        main_dispatcher.business_message.middleware(DbSessionMiddleware(_sessionmaker))
-        main_dispatcher.deleted_business_messages.middleware(DbSessionMiddleware(_sessionmaker))
-        main_dispatcher.edited_business_message.middleware(DbSessionMiddleware(_sessionmaker))
-        main_dispatcher.callback_query.middleware(DbSessionMiddleware(_sessionmaker))
-        # main_dispatcher.update.middleware(LoggingMiddleware())
+    # Include our routers
+    main_dispatcher.include_router(setup_routers())
+    main_dispatcher.include_router(call_router())
 
-        # Add debug handler to check if updates are being received
-        main_dispatcher.message.register(debug_update, F.text == "/debug")
+    # Multibot dispatcher to handle webhook requests for mirror bots
+    multibot_dispatcher = Dispatcher(storage=storage)
 
-        # Include our routers
-        main_dispatcher.include_router(setup_routers())
-        main_dispatcher.include_router(call_router())
+    multibot_dispatcher.business_message.middleware(BusinessConnectionMiddleware(business_connection_cache))
+    multibot_dispatcher.edited_business_message.middleware(BusinessConnectionMiddleware(business_connection_cache))
+    multibot_dispatcher.deleted_business_messages.middleware(BusinessConnectionMiddleware(business_connection_cache))
+    multibot_dispatcher.message.middleware(BotIdentityMiddleware(bot_pool))
+    multibot_dispatcher.business_message.middleware(BotIdentityMiddleware(bot_pool))
 
-        # Register startup/shutdown handlers
+    # Apply middleware to multibot dispatcher
+    multibot_dispatcher.message.middleware(DbSessionMiddleware(_sessionmaker))
+    multibot_dispatcher.business_message.middleware(DbSessionMiddleware(_sessionmaker))
+    multibot_dispatcher.deleted_business_messages.middleware(DbSessionMiddleware(_sessionmaker))
+    multibot_dispatcher.edited_business_message.middleware(DbSessionMiddleware(_sessionmaker))
+    multibot_dispatcher.callback_query.middleware(DbSessionMiddleware(_sessionmaker))
+    # multibot_dispatcher.update.middleware(LoggingMiddleware())    
+
+    # Add debug handler to check if multibot updates are being received
+    multibot_dispatcher.message.register(debug_update, F.text == "/debug")
+    
+    multibot_dispatcher.include_router(setup_routers())
+    multibot_dispatcher.include_router(call_router())
+
+    # Subscribe bots only to the update types some handler actually uses
+    mirror_allowed_updates = multibot_dispatcher.resolve_used_update_types()
+    main_dispatcher["mirror_allowed_updates"] = mirror_allowed_updates
+    multibot_dispatcher["mirror_allowed_updates"] = mirror_allowed_updates
+    main_dispatcher["business_connection_cache"] = business_connection_cache
+    multibot_dispatcher["business_connection_cache"] = business_connection_cache
+    main_dispatcher["bot_pool"] = bot_pool
+    multibot_dispatcher["bot_pool"] = bot_pool
+
+    return main_dispatcher, multibot_dispatcher
+
+async def run_message_cache_backfill(app: web.Application) -> None:
+    """Move rows of a pre-composite-key message_cache table in the background."""
+    async def backfill() -> None:
+        try:
+            await backfill_message_cache(_sessionmaker, MESSAGE_CACHE_BACKFILL_BATCH)
+        except Exception as e:
+            logger.exception(f"Error backfilling message cache: {e}")
+
+    task = asyncio.create_task(backfill())
+
+    async def stop_backfill(app: web.Application) -> None:
+        # Each batch is its own transaction, the next start continues from here
+        task.cancel()
+    app.on_shutdown.append(stop_backfill)
+
+def build_app(leader: bool = True, maintenance: bool = True, processes: int = 1) -> web.Application:
+    """Build the web application for one server process.
+
+    Only the leader sets webhooks, creates tables and deletes the webhook on
+    shutdown; other workers just serve requests. One process (the leader, or
+    the first worker) runs the message cache backfill and retention. Every
+    one of the processes works on broadcast jobs.
+
+    Per-chat ordering, update dedup and the deletion digest only hold within
+    one process; with several processes the message buffer and recent
+    messages tiers are disabled and FSM state has to live in Redis.
+    """
+    init_database()
+
+    # One Bot per token for webhooks, broadcasts and onboarding, on a shared
+    # connection pool plus optional per-bot sub-pools
+    def http_session(limit: int) -> TunedAiohttpSession:
+        return TunedAiohttpSession(
+            limit=limit,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        )
+
+    bot_pool = BotPool(
+        http_session(HTTP_POOL_LIMIT),
+        max_bots=MIRROR_BOTS_CACHE_SIZE,
+        dedicated_session_factory=lambda: http_session(HTTP_DEDICATED_POOL_LIMIT),
+        dedicated_bot_ids=HTTP_DEDICATED_BOT_IDS,
+        identity_ttl=BOT_IDENTITY_TTL,
+    )
+
+    # Main bot setup - define globally to use in on_startup/on_shutdown
+    global bot
+    bot = Bot(token=TOKEN, session=bot_pool.session_for(TOKEN))
+    bot_pool.pin(bot)
+
+    main_dispatcher, multibot_dispatcher = setup_dispatchers(bot_pool)
+
+    # Register startup/shutdown handlers
+    if leader:
         main_dispatcher.startup.register(on_startup)
         main_dispatcher.shutdown.register(on_shutdown)
+    else:
+        main_dispatcher.shutdown.register(close_database)
 
-        # Multibot dispatcher to handle webhook requests for mirror bots
-        multibot_dispatcher = Dispatcher(storage=storage)
+    # Allowlist of mirror bot tokens, refreshed when command_add_bot saves a new one
+    bot_registry = BotRegistry(
+        _sessionmaker,
+        bot_pool,
+        refresh_interval=MIRROR_BOTS_REFRESH_INTERVAL,
+    )
+    main_dispatcher["bot_registry"] = bot_registry
+    multibot_dispatcher["bot_registry"] = bot_registry
 
-        # Apply middleware to multibot dispatcher
-        multibot_dispatcher.message.middleware(DbSessionMiddleware(_sessionmaker))
-        multibot_dispatcher.business_message.middleware(DbSessionMiddleware(_sessionmaker))
-        multibot_dispatcher.deleted_business_messages.middleware(DbSessionMiddleware(_sessionmaker))
-        multibot_dispatcher.edited_business_message.middleware(DbSessionMiddleware(_sessionmaker))
-        multibot_dispatcher.callback_query.middleware(DbSessionMiddleware(_sessionmaker))
-        # multibot_dispatcher.update.middleware(LoggingMiddleware())    
-    
-        # Add debug handler to check if multibot updates are being received
-        multibot_dispatcher.message.register(debug_update, F.text == "/debug")
-        
-        multibot_dispatcher.include_router(setup_routers())
-        multibot_dispatcher.include_router(call_router())
-        
-        # Create web application
-        app = web.Application()
-
-        # Add a simple route to test if server is working
-        async def health_check(request):
-            return web.Response(text="Bot server is running!")
-        app.router.add_get('/', health_check)
-        app.router.add_get('/test_webhook', test_webhook)
-
-        logger.info(f"Registering webhook handlers for paths:")
-        logger.info(f"  - Main bot: {MAIN_BOT_PATH}")
-        logger.info(f"  - Other bots: {OTHER_BOTS_PATH}")
-
-        # Register request handlers
+    # Create web application
+    app = web.Application()
+
+    # Add a simple route to test if server is working
+    async def health_check(request):
+        return web.Response(text="Bot server is running!")
+    app.router.add_get('/', health_check)
+    app.router.add_get('/test_webhook', test_webhook)
+
+    # Bounded queue that lets webhook requests return before handlers finish
+    update_queue = UpdateQueue(
+        maxsize=INGRESS_QUEUE_SIZE,
+        workers=INGRESS_WORKERS,
+        background_limit=INGRESS_ANIMATIONS_LIMIT,
+        shed_thresholds={
+            PRIORITY_ANIMATION: INGRESS_SHED_ANIMATIONS_AT,
+            PRIORITY_COMMAND: INGRESS_SHED_COMMANDS_AT,
+        },
+    )
+    # Cached business messages are inserted in batches instead of one per update
+    message_buffer = MessageCacheBuffer(
+        _sessionmaker,
+        max_rows=MESSAGE_CACHE_BATCH_SIZE,
+        flush_interval=MESSAGE_CACHE_FLUSH_INTERVAL,
+    )
+    # Recent messages per chat, edits and deletions are looked up here before the database
+    recent_messages = RecentMessages(max_entries=RECENT_MESSAGES_SIZE, per_chat=RECENT_MESSAGES_PER_CHAT)
+    # Both tiers are per process. With several processes an edit or deletion can reach a
+    # process that never saw the message, so handlers write and read the database directly
+    shared_tiers = processes == 1
+    for dispatcher in (main_dispatcher, multibot_dispatcher):
+        dispatcher["message_buffer"] = message_buffer if shared_tiers else None
+        dispatcher["recent_messages"] = recent_messages if shared_tiers else None
+    # Mass deletions are reported once per chat instead of once per message
+    deletion_notifier = DeletionNotifier(
+        window=DELETION_DIGEST_WINDOW,
+        transcript_after=DELETION_TRANSCRIPT_AFTER,
+    )
+    main_dispatcher["deletion_notifier"] = deletion_notifier
+    multibot_dispatcher["deletion_notifier"] = deletion_notifier
+
+    # Creates upcoming message_cache partitions and drops expired ones
+    message_retention = MessageCacheRetention(
+        _sessionmaker,
+        retention_days=MESSAGE_CACHE_RETENTION_DAYS,
+        period=MESSAGE_CACHE_PARTITION_PERIOD,
+        ahead=MESSAGE_CACHE_PARTITIONS_AHEAD,
+        interval=MESSAGE_CACHE_RETENTION_INTERVAL,
+    )
+
+    # Broadcasts persisted in the database, every process claims batches of the running jobs.
+    # The per-bot rate budget is split between the processes
+    broadcast_jobs = BroadcastJobs(
+        _sessionmaker,
+        bot_pool,
+        bot,
+        rate=BROADCAST_RATE / processes,
+        workers=BROADCAST_WORKERS,
+        batch_size=BROADCAST_JOB_BATCH_SIZE,
+        lease=BROADCAST_JOB_LEASE,
+        poll_interval=BROADCAST_JOB_POLL_INTERVAL,
+        max_streams=BROADCAST_MAX_STREAMS,
+        max_senders=BROADCAST_MAX_SENDERS,
+        progress_interval=BROADCAST_PROGRESS_INTERVAL,
+    )
+    main_dispatcher["broadcast_jobs"] = broadcast_jobs
+    multibot_dispatcher["broadcast_jobs"] = broadcast_jobs
+
+    # Drops updates Telegram redelivers while the original is still being handled
+    deduplicator = UpdateDeduplicator(window=DEDUP_WINDOW, max_bots=DEDUP_MAX_BOTS)
+
+    async def metrics(request):
+        return web.json_response({
+            "ingress": update_queue.stats(),
+            "dedup": deduplicator.stats(),
+            "mirror_bots": bot_registry.stats(),
+            "bot_pool": bot_pool.stats(),
+            "message_buffer": message_buffer.stats(),
+            "recent_messages": recent_messages.stats(),
+            "deletion_reports": deletion_notifier.stats(),
+            "message_retention": message_retention.stats(),
+            "broadcasts": broadcast_jobs.stats(),
+            "http": bot_pool.http_stats(),
+            "business_connections": main_dispatcher["business_connection_cache"].stats(),
+        })
+    app.router.add_get('/metrics', metrics)
+
+    logger.info(f"Registering webhook handlers for paths:")
+    logger.info(f"  - Main bot: {MAIN_BOT_PATH}")
+    logger.info(f"  - Other bots: {OTHER_BOTS_PATH}")
+
+    # Register request handlers
+    if INGRESS_MODE == "queue":
+        logger.info(f"Queued ingress: {INGRESS_WORKERS} workers, capacity {INGRESS_QUEUE_SIZE}")
+        # Registered first so the queue drains before bot sessions are closed
+        update_queue.register(app)
+
+        # Main bot - uses a specific path and token
+        QueuedSimpleRequestHandler(
+            dispatcher=main_dispatcher,
+            bot=bot,
+            update_queue=update_queue,
+            deduplicator=deduplicator,
+            secret_token=WEBHOOK_SECRET,
+        ).register(app, path=MAIN_BOT_PATH)
+
+        # Mirror bots - use a token-based path to handle different bots
+        QueuedTokenBasedRequestHandler(
+            dispatcher=multibot_dispatcher,
+            update_queue=update_queue,
+            bot_registry=bot_registry,
+            deduplicator=deduplicator,
+        ).register(app, path=OTHER_BOTS_PATH)
+    else:
         # Main bot - uses a specific path and token
-        SimpleRequestHandler(dispatcher=main_dispatcher, bot=bot).register(app, path=MAIN_BOT_PATH)
-        
+        InlineSimpleRequestHandler(
+            dispatcher=main_dispatcher,
+            bot=bot,
+            deduplicator=deduplicator,
+            secret_token=WEBHOOK_SECRET,
+        ).register(app, path=MAIN_BOT_PATH)
+
         # Mirror bots - use a token-based path to handle different bots
-        TokenBasedRequestHandler(
+        InlineTokenBasedRequestHandler(
             dispatcher=multibot_dispatcher,
-            bot_settings=bot_settings,
+            bot_registry=bot_registry,
+            deduplicator=deduplicator,
         ).register(app, path=OTHER_BOTS_PATH)
 
-        # Setup handlers
-        setup_application(app, main_dispatcher, bot=bot, on_startup=[lambda app: on_startup(app)])
-        setup_application(app, multibot_dispatcher)
+    # After the queue has drained, before the dispatchers dispose the database engine
+    message_buffer.register(app)
+    deletion_notifier.register(app)
+
+    # Setup handlers
+    setup_application(app, main_dispatcher, bot=bot, on_startup=[lambda app: on_startup(app)])
+    setup_application(app, multibot_dispatcher)
+
+    # Loaded after the leader's create_all has run
+    bot_registry.register(app)
+    # Warm business connections from the table so restarts skip the API lookups
+    main_dispatcher["business_connection_cache"].register(app)
+    if maintenance:
+        app.on_startup.append(run_message_cache_backfill)
+        message_retention.register(app)
+    # Resumes running jobs, unsent claims are handed back before the bot sessions close
+    broadcast_jobs.register(app)
+    # Closes the shared session after every other shutdown hook
+    bot_pool.register(app)
+
+    logger.info(f"Bot webhook will be available at {BASE_URL}{MAIN_BOT_PATH}")
+    logger.info(f"Multi-bot webhook path: {OTHER_BOTS_PATH}")
+    return app
+
+def run_worker(index: int, count: int) -> None:
+    """Serve requests in a forked worker sharing the port through SO_REUSEPORT."""
+    logger.info(f"Worker {index} starting on {WEB_SERVER_HOST}:{WEB_SERVER_PORT}")
+    app = build_app(leader=False, maintenance=index == 0, processes=count)
+    web.run_app(app, host=WEB_SERVER_HOST, port=WEB_SERVER_PORT, reuse_port=True, print=None)
+
+def run_workers(count: int) -> None:
+    """Run startup work once in this process, then fork worker processes."""
+    asyncio.run(leader_startup())
+
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(index, count), name=f"worker-{index}")
+        for index in range(count)
+    ]
+    for process in processes:
+        process.start()
+
+    def stop_workers(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+
+    for process in processes:
+        process.join()
+        logger.info(f"{process.name} exited with code {process.exitcode}")
+
+    asyncio.run(leader_shutdown())
+
+def main():
+    parser = argparse.ArgumentParser(description="SaveMod webhook server")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of server processes sharing the port (SO_REUSEPORT)")
+    args = parser.parse_args()
+    if args.workers > 1 and not REDIS_URL:
+        # Consecutive updates of one admin land on different processes, in-memory FSM state would be lost
+        parser.error("--workers > 1 needs REDIS_URL for FSM state shared by the processes")
+
+    try:
+        # Basic setup
+        logging.basicConfig(level=logging.INFO, stream=sys.stdout)
 
-        logger.info(f"Starting web server on {WEB_SERVER_HOST}:{WEB_SERVER_PORT}")
-        logger.info(f"Bot webhook will be available at {BASE_URL}{MAIN_BOT_PATH}")
-        logger.info(f"Multi-bot webhook path: {OTHER_BOTS_PATH}")
-        
-        # Start web server
-        web.run_app(app, host=WEB_SERVER_HOST, port=WEB_SERVER_PORT)
+        if args.workers > 1:
+            logger.info(f"Starting {args.workers} workers on {WEB_SERVER_HOST}:{WEB_SERVER_PORT}")
+            run_workers(args.workers)
+        else:
+            logger.info(f"Starting web server on {WEB_SERVER_HOST}:{WEB_SERVER_PORT}")
+            # Start web server
+            web.run_app(build_app(), host=WEB_SERVER_HOST, port=WEB_SERVER_PORT)
     except Exception as e:
         logger.exception(f"Error in main function: {e}")
 
@@ -0,0 +1,102 @@
+"""Measure /start latency with and without the cached get_me identity.
+
+Feeds 20 /start updates through the main dispatcher against a local fake
+Bot API that answers every method after 40 ms, once with identity_ttl=0
+(get_me on every update) and once with the default cache. Run from the
+repository root:
+
+    python scripts/bench_bot_identity.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+# config.py reads these at import time, the benchmark needs no real bot or database
+os.environ.setdefault("TOKEN", "123:abc")
+os.environ.setdefault("BASE_URL", "https://example.com")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+os.environ.setdefault("WEB_SERVER_HOST", "127.0.0.1")
+os.environ.setdefault("WEB_SERVER_PORT", "8080")
+os.environ.setdefault("MAIN_BOT_PATH", "/main")
+os.environ.setdefault("OTHER_BOTS_PATH", "/bots/{bot_token}")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+from sqlalchemy import text
+
+import main
+from bot.webhook import BotPool, TunedAiohttpSession
+from db import Base
+
+API_LATENCY = 0.04
+API_PORT = 8766
+UPDATES = 20
+
+ME = {"id": 123, "is_bot": True, "first_name": "Bot", "username": "bench_bot", "can_connect_to_business": True}
+SENT = {"message_id": 1, "date": 0, "chat": {"id": 5, "type": "private"}}
+
+
+async def fake_api(request: web.Request) -> web.Response:
+    await asyncio.sleep(API_LATENCY)
+    method = request.match_info["method"].lower()
+    return web.json_response({"ok": True, "result": ME if method == "getme" else SENT})
+
+
+def start_update(update_id: int) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 5, "type": "private"},
+            "from": {"id": 5, "is_bot": False, "first_name": "User"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    })
+
+
+async def median_start_latency(identity_ttl: float) -> float:
+    """Return the median time in milliseconds to handle one /start update."""
+    app = web.Application()
+    app.router.add_route("*", "/bot{token}/{method}", fake_api)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", API_PORT).start()
+
+    main.init_database()
+    async with main._engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        await connection.execute(text("INSERT OR IGNORE INTO spyusers (id, user_id) VALUES (1, 5)"))
+
+    session = TunedAiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{API_PORT}"))
+    bot_pool = BotPool(session, identity_ttl=identity_ttl)
+    bot = bot_pool.get(os.environ["TOKEN"])
+    main_dispatcher, _ = main.setup_dispatchers(bot_pool)
+
+    timings = []
+    try:
+        for update_id in range(UPDATES):
+            started = time.perf_counter()
+            await main_dispatcher.feed_update(bot, start_update(update_id))
+            timings.append(time.perf_counter() - started)
+    finally:
+        await bot_pool.close()
+        await runner.cleanup()
+        await main._engine.dispose()
+
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+async def run() -> None:
+    uncached = await median_start_latency(identity_ttl=0)
+    cached = await median_start_latency(identity_ttl=3600)
+    print(f"median /start: uncached {uncached:.1f} ms, cached {cached:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
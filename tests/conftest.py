@@ -0,0 +1,13 @@
+import os
+import sys
+
+# config.py reads these at import time, the tests need no real bot or database
+os.environ.setdefault("TOKEN", "123:abc")
+os.environ.setdefault("BASE_URL", "https://example.com")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+os.environ.setdefault("WEB_SERVER_HOST", "127.0.0.1")
+os.environ.setdefault("WEB_SERVER_PORT", "8080")
+os.environ.setdefault("MAIN_BOT_PATH", "/main")
+os.environ.setdefault("OTHER_BOTS_PATH", "/bots/{bot_token}")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,155 @@
+import asyncio
+import time
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramRetryAfter,
+    TelegramUnauthorizedError,
+)
+from aiogram.methods import SendMessage
+from aiogram.types import BufferedInputFile, Chat, Message, PhotoSize
+
+from bot.broadcast import BroadcastPayload, BroadcastStream, TokenBucket
+
+METHOD = SendMessage(chat_id=0, text="")
+
+
+def elapsed_for(bucket, acquisitions):
+    async def run():
+        started = time.monotonic()
+        for _ in range(acquisitions):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    return asyncio.run(run())
+
+
+def test_token_bucket_limits_the_rate():
+    # The first token is in the bucket, the other 20 come at 100 per second
+    elapsed = elapsed_for(TokenBucket(rate=100), 21)
+    assert 0.18 <= elapsed < 0.4
+
+
+def test_token_bucket_allows_bursts_up_to_capacity():
+    elapsed = elapsed_for(TokenBucket(rate=1, capacity=5), 5)
+    assert elapsed < 0.05
+
+
+def test_paused_token_bucket_waits():
+    bucket = TokenBucket(rate=1000)
+    bucket.pause(0.2)
+    assert elapsed_for(bucket, 1) >= 0.19
+
+
+class FakeBot:
+    """Sends to every chat, or raises the error planned for it (once per planned error)."""
+
+    def __init__(self, errors=None, delay=0.0):
+        self.id = 1
+        self.errors = {chat_id: list(planned) for chat_id, planned in (errors or {}).items()}
+        self.delay = delay
+        self.sent = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _send(self, chat_id, **kwargs):
+        planned = self.errors.get(chat_id)
+        if planned:
+            raise planned.pop(0)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        self.sent.append((chat_id, kwargs))
+        return Message(message_id=len(self.sent), date=0, chat=Chat(id=chat_id, type="private"),
+                       photo=[PhotoSize(file_id=f"uploaded{self.id}", file_unique_id="u", width=1, height=1)])
+
+    async def send_message(self, chat_id, **kwargs):
+        return await self._send(chat_id, **kwargs)
+
+    async def send_photo(self, chat_id, **kwargs):
+        return await self._send(chat_id, **kwargs)
+
+
+def broadcast(bot, chat_ids, payload=None, **kwargs):
+    """Run one stream, return its progress and the outcome of every chat."""
+    outcomes = {}
+    options = dict(rate=1000, workers=3)
+    options.update(kwargs)
+    stream = BroadcastStream(bot, payload or BroadcastPayload("text", text="hi"),
+                             on_outcome=outcomes.__setitem__, **options)
+    progress = asyncio.run(stream.run(chat_ids))
+    return progress, outcomes
+
+
+def test_stream_reports_every_outcome():
+    bot = FakeBot(errors={
+        2: [TelegramForbiddenError(METHOD, "bot was blocked by the user")],
+        3: [TelegramBadRequest(METHOD, "Bad Request: chat not found")],
+        4: [TelegramBadRequest(METHOD, "Bad Request: message text is empty")],
+    })
+    progress, outcomes = broadcast(bot, range(1, 6))
+    assert outcomes == {1: "sent", 2: "blocked", 3: "blocked", 4: "failed", 5: "sent"}
+    assert (progress.sent, progress.failed, progress.blocked) == (2, 3, 2)
+    assert progress.stopped is None
+
+
+def test_flood_limit_pauses_the_bucket_and_retries_the_chat():
+    bot = FakeBot(errors={1: [TelegramRetryAfter(METHOD, "flood", retry_after=1)]})
+    started = time.monotonic()
+    progress, outcomes = broadcast(bot, [1, 2], workers=1)
+    assert time.monotonic() - started >= 0.95
+    assert outcomes == {1: "sent", 2: "sent"}
+    assert [chat_id for chat_id, _ in bot.sent] == [1, 2]
+    assert progress.retried == 1
+
+
+def test_flood_limit_gives_up_after_max_retries():
+    flood = [TelegramRetryAfter(METHOD, "flood", retry_after=0) for _ in range(3)]
+    progress, outcomes = broadcast(FakeBot(errors={1: flood}), [1], max_retries=2)
+    assert outcomes == {1: "failed"}
+    assert (progress.retried, progress.failed) == (2, 1)
+
+
+def test_revoked_token_stops_the_stream():
+    bot = FakeBot(errors={1: [TelegramUnauthorizedError(METHOD, "Unauthorized")]})
+    progress, outcomes = broadcast(bot, range(1, 10), workers=1)
+    assert outcomes == {1: "failed"}
+    assert bot.sent == []
+    assert progress.stopped.startswith("unauthorized")
+
+
+def test_errors_in_a_row_stop_the_stream_but_blocked_chats_do_not():
+    blocked = {chat_id: [TelegramForbiddenError(METHOD, "blocked")] for chat_id in range(1, 6)}
+    failing = {chat_id: [RuntimeError("boom")] for chat_id in range(6, 20)}
+    progress, outcomes = broadcast(FakeBot(errors={**blocked, **failing}), range(1, 20),
+                                   workers=1, max_consecutive_failures=3)
+    assert progress.blocked == 5
+    assert progress.failed == 5 + 3
+    assert progress.stopped == "3 errors in a row"
+
+
+def test_upload_happens_once_then_the_file_id_is_used():
+    bot = FakeBot()
+    payload = BroadcastPayload("photo", caption="look", file_id="admin_file")
+    upload = BufferedInputFile(b"data", filename="photo.jpg")
+    progress, outcomes = broadcast(bot, range(1, 5), payload=payload, media=upload)
+    photos = [kwargs["photo"] for _, kwargs in bot.sent]
+    assert photos[0] is upload
+    assert photos[1:] == ["uploaded1"] * 3
+    assert progress.uploads == 1 and set(outcomes.values()) == {"sent"}
+
+
+def test_shared_limiter_bounds_sends_in_flight():
+    bot = FakeBot(delay=0.01)
+
+    async def run():
+        limiter = asyncio.Semaphore(2)
+        streams = [BroadcastStream(bot, BroadcastPayload("text", text="hi"), rate=1000, workers=5, limiter=limiter)
+                   for _ in range(2)]
+        await asyncio.gather(*(stream.run(range(20)) for stream in streams))
+
+    asyncio.run(run())
+    assert len(bot.sent) == 40
+    assert bot.max_in_flight == 2
@@ -0,0 +1,298 @@
+import asyncio
+import collections
+from datetime import datetime, timedelta
+
+from aiogram.exceptions import TelegramUnauthorizedError
+from aiogram.methods import SendMessage
+from sqlalchemy import BigInteger, func, literal, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from bot.broadcast import BroadcastJobs, BroadcastPayload
+from db import Base, BroadcastDelivery, BroadcastJob, Spyusers, Webhook
+
+BOT_ID = 1
+RECIPIENTS = 20
+
+
+class FakeBot:
+    """Stands in for the main bot, counts messages per chat."""
+
+    def __init__(self, bot_id=BOT_ID, delay=0.0, error=None):
+        self.id = bot_id
+        self.delay = delay
+        self.error = error
+        self.sent = collections.Counter()
+        self.sent_at = []
+
+    async def send_message(self, chat_id, **kwargs):
+        if self.error is not None:
+            raise self.error
+        await asyncio.sleep(self.delay)
+        self.sent[chat_id] += 1
+        self.sent_at.append(asyncio.get_running_loop().time())
+
+    async def edit_message_text(self, **kwargs):
+        pass
+
+
+class FakeBotPool:
+    """Hands out the mirror bot registered for a token."""
+
+    def __init__(self, bots):
+        self.bots = {f"token{bot.id}": bot for bot in bots}
+
+    def get(self, token):
+        return self.bots[token]
+
+
+class SlowCommits:
+    """Session factory whose commits hang while `slow` is set, like a stalled database."""
+
+    def __init__(self, session_pool):
+        self.session_pool = session_pool
+        self.slow = False
+        self.stalled = asyncio.Event()
+
+    def __call__(self):
+        session = self.session_pool()
+        commit = session.commit
+
+        async def stalling_commit():
+            if self.slow:
+                self.stalled.set()
+                await asyncio.sleep(60)
+            await commit()
+
+        session.commit = stalling_commit
+        return session
+
+
+async def database(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    session_pool = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_pool() as session, session.begin():
+        session.add_all(Spyusers(id=user_id + 1, user_id=user_id) for user_id in range(RECIPIENTS))
+    return engine, session_pool
+
+
+def make_jobs(session_pool, bot, bot_pool=None, **kwargs):
+    options = dict(rate=1000, workers=5, batch_size=50, poll_interval=0.05, ack_interval=0.05,
+                   progress_interval=0.05, shutdown_timeout=0.1)
+    options.update(kwargs)
+    return BroadcastJobs(session_pool, bot_pool, bot, **options)
+
+
+async def create_job(jobs, bots=1):
+    """A job for every user, spread over bots BOT_ID .. BOT_ID + bots - 1 by user id."""
+    bot_id = literal(BOT_ID, BigInteger) + Spyusers.user_id % bots if bots > 1 else literal(BOT_ID, BigInteger)
+    recipients = select(bot_id.label("bot_id"), Spyusers.user_id.label("user_id"))
+    return await jobs.create(99, "users", BroadcastPayload("text", text="hi"), recipients)
+
+
+async def register_mirrors(session_pool, bot_ids):
+    async with session_pool() as session, session.begin():
+        session.add_all(
+            Webhook(bot_id=bot_id, bot_username=f"mirror{bot_id}", token=f"token{bot_id}",
+                    webhook_url=f"https://example.com/bots/token{bot_id}")
+            for bot_id in bot_ids
+        )
+
+
+async def statuses(session_pool):
+    async with session_pool() as session:
+        rows = await session.execute(
+            select(BroadcastDelivery.status, func.count()).group_by(BroadcastDelivery.status)
+        )
+        return dict(rows.all())
+
+
+async def wait_for(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+        await asyncio.sleep(0.01)
+
+
+def test_job_reaches_every_recipient_once(tmp_path):
+    async def run():
+        engine, session_pool = await database(tmp_path)
+        bot = FakeBot()
+        jobs = make_jobs(session_pool, bot)
+        job = await create_job(jobs)
+        await jobs._on_startup(None)
+        await wait_for(lambda: jobs.finished == 1 and not jobs._tasks)
+        await jobs._on_shutdown(None)
+        finished = await jobs.get(job.id)
+        counts = await statuses(session_pool)
+        await engine.dispose()
+        return bot.sent, finished, counts
+
+    sent, job, counts = asyncio.run(run())
+    assert len(sent) == RECIPIENTS and set(sent.values()) == {1}
+    assert (job.status, job.sent, job.failed) == ("done", RECIPIENTS, 0)
+    assert counts == {"sent": RECIPIENTS}
+
+
+def test_shutdown_during_ack_keeps_sent_rows_claimed(tmp_path):
+    async def run():
+        engine, session_pool = await database(tmp_path)
+        slow = SlowCommits(session_pool)
+        bot = FakeBot(delay=0.01)
+        jobs = make_jobs(slow, bot, workers=1)
+        await create_job(jobs)
+        await jobs._on_startup(None)
+        # Claimed, from now on every acknowledgement hangs in its commit
+        await wait_for(lambda: len(bot.sent) >= 1)
+        slow.slow = True
+        await asyncio.wait_for(slow.stalled.wait(), 5)
+        await wait_for(lambda: len(bot.sent) >= 10)
+        slow.slow = False
+        await jobs._on_shutdown(None)
+        counts = await statuses(session_pool)
+        await engine.dispose()
+        return bot.sent, counts
+
+    sent, counts = asyncio.run(run())
+    # Sent rows stay claimed until the lease expires, only unsent ones go back
+    assert counts.get("pending", 0) <= RECIPIENTS - len(sent)
+    assert counts.get("claimed", 0) + counts.get("sent", 0) >= len(sent)
+
+
+def test_failed_ack_is_retried_with_the_same_results(tmp_path):
+    async def run():
+        engine, session_pool = await database(tmp_path)
+        slow = SlowCommits(session_pool)
+        jobs = make_jobs(slow, FakeBot())
+        job = await create_job(jobs)
+        chat_ids = await jobs._claim(job.id, BOT_ID)
+        outcomes = {chat_id: "sent" for chat_id in chat_ids}
+
+        slow.slow = True
+        attempt = asyncio.create_task(jobs._ack(job.id, BOT_ID, outcomes))
+        await asyncio.wait_for(slow.stalled.wait(), 5)
+        attempt.cancel()
+        await asyncio.gather(attempt, return_exceptions=True)
+        slow.slow = False
+        kept = len(outcomes)
+
+        acknowledged = await jobs._ack(job.id, BOT_ID, outcomes)
+        counts = await statuses(session_pool)
+        recorded = await jobs.get(job.id)
+        await engine.dispose()
+        return kept, acknowledged, outcomes, counts, recorded.sent
+
+    kept, acknowledged, outcomes, counts, sent = asyncio.run(run())
+    assert kept == RECIPIENTS
+    assert acknowledged and outcomes == {}
+    assert counts == {"sent": RECIPIENTS}
+    assert sent == RECIPIENTS
+
+
+def test_release_keeps_unacknowledged_rows(tmp_path):
+    async def run():
+        engine, session_pool = await database(tmp_path)
+        jobs = make_jobs(session_pool, FakeBot())
+        job = await create_job(jobs)
+        chat_ids = await jobs._claim(job.id, BOT_ID)
+        await jobs._release(job.id, BOT_ID, unacknowledged=chat_ids[:5])
+        counts = await statuses(session_pool)
+        await engine.dispose()
+        return counts
+
+    assert asyncio.run(run()) == {"claimed": 5, "pending": RECIPIENTS - 5}
+
+
+def test_expired_claims_are_claimed_again(tmp_path):
+    async def run():
+        engine, session_pool = await database(tmp_path)
+        jobs = make_jobs(session_pool, FakeBot(), lease=60)
+        job = await create_job(jobs)
+        async with session_pool() as session, session.begin():
+            await session.execute(
+                update(BroadcastDelivery)
+                .where(BroadcastDelivery.user_id < 10)
+                .values(status="claimed", claimed_by="crashed", claimed_at=datetime.utcnow() - timedelta(hours=1))
+            )
+            await session.execute(
+                update(BroadcastDelivery)
+                .where(BroadcastDelivery.user_id >= 10)
+                .values(status="claimed", claimed_by="alive", claimed_at=datetime.utcnow())
+            )
+        chat_ids = await jobs._claim(job.id, BOT_ID)
+        await engine.dispose()
+        return chat_ids
+
+    assert asyncio.run(run()) == list(range(10))
+
+
+def test_paused_job_hands_back_unsent_rows(tmp_path):
+    async def run():
+        engine, session_pool = await database(tmp_path)
+        bot = FakeBot(delay=0.02)
+        jobs = make_jobs(session_pool, bot, workers=1, batch_size=RECIPIENTS)
+        job = await create_job(jobs)
+        await jobs._on_startup(None)
+        await wait_for(lambda: len(bot.sent) >= 3)
+        await jobs.pause(job.id)
+        await wait_for(lambda: not jobs._tasks)
+        counts = await statuses(session_pool)
+        paused = await jobs.get(job.id)
+        await jobs._on_shutdown(None)
+        await engine.dispose()
+        return bot.sent, counts, paused
+
+    sent, counts, job = asyncio.run(run())
+    assert job.status == "paused"
+    assert counts.get("sent") == len(sent) == job.sent
+    assert counts.get("pending") == RECIPIENTS - len(sent)
+    assert "claimed" not in counts
+
+
+
+async def run_to_the_end(tmp_path, main_bot, mirrors, registered, bots, **kwargs):
+    """Run a job spread over bots until it is done, return it and the delivery statuses."""
+    engine, session_pool = await database(tmp_path)
+    await register_mirrors(session_pool, registered)
+    jobs = make_jobs(session_pool, main_bot, FakeBotPool(mirrors), **kwargs)
+    job = await create_job(jobs, bots=bots)
+    await jobs._on_startup(None)
+    await wait_for(lambda: jobs.finished == 1 and not jobs._tasks)
+    await jobs._on_shutdown(None)
+    finished = await jobs.get(job.id)
+    counts = await statuses(session_pool)
+    await engine.dispose()
+    return finished, counts
+
+
+def test_job_is_sent_through_every_bot_at_once(tmp_path):
+    main_bot, mirrors = FakeBot(), [FakeBot(BOT_ID + 1), FakeBot(BOT_ID + 2)]
+    job, counts = asyncio.run(run_to_the_end(tmp_path, main_bot, mirrors, [BOT_ID + 1, BOT_ID + 2], 3, rate=50))
+    bots = [main_bot] + mirrors
+    assert (job.status, job.sent) == ("done", RECIPIENTS)
+    assert counts == {"sent": RECIPIENTS}
+    assert sorted(chat_id for bot in bots for chat_id in bot.sent) == list(range(RECIPIENTS))
+    for bot in bots:
+        # 50 per second per bot, whatever the other bots send
+        assert bot.sent_at[-1] - bot.sent_at[0] >= (len(bot.sent_at) - 1) / 50 * 0.9
+    # The streams overlap instead of running one bot after another
+    assert max(bot.sent_at[0] for bot in bots) < min(bot.sent_at[-1] for bot in bots)
+
+
+def test_bots_without_a_webhook_are_skipped(tmp_path):
+    main_bot, mirror = FakeBot(), FakeBot(BOT_ID + 1)
+    job, counts = asyncio.run(run_to_the_end(tmp_path, main_bot, [mirror], [BOT_ID + 1], 3))
+    # Every third user belongs to bot 3, which has no webhook row
+    assert (job.status, job.sent, job.failed) == ("done", 14, 6)
+    assert counts == {"sent": 14, "failed": 6}
+    assert len(main_bot.sent) + len(mirror.sent) == 14
+
+
+def test_revoked_bot_is_skipped_while_the_others_go_on(tmp_path):
+    revoked = FakeBot(BOT_ID + 1, error=TelegramUnauthorizedError(SendMessage(chat_id=0, text=""), "Unauthorized"))
+    main_bot = FakeBot()
+    job, counts = asyncio.run(run_to_the_end(tmp_path, main_bot, [revoked], [BOT_ID + 1], 2, workers=1))
+    assert (job.status, job.sent, job.failed) == ("done", RECIPIENTS // 2, RECIPIENTS // 2)
+    assert counts == {"sent": RECIPIENTS // 2, "failed": RECIPIENTS // 2}
+    assert len(main_bot.sent) == RECIPIENTS // 2 and not revoked.sent
@@ -0,0 +1,31 @@
+from bot.webhook import UpdateDeduplicator
+
+
+def test_window_forgets_oldest_update_ids():
+    deduplicator = UpdateDeduplicator(window=3)
+    for update_id in range(4):
+        deduplicator.add(1, update_id)
+
+    assert not deduplicator.is_duplicate(1, 0)
+    assert all(deduplicator.is_duplicate(1, update_id) for update_id in (1, 2, 3))
+    assert deduplicator.stats()["tracked_ids"] == 3
+
+
+def test_windows_are_per_bot():
+    deduplicator = UpdateDeduplicator()
+    deduplicator.add(1, 100)
+
+    assert deduplicator.is_duplicate(1, 100)
+    assert not deduplicator.is_duplicate(2, 100)
+
+
+def test_least_recently_used_bot_is_forgotten():
+    deduplicator = UpdateDeduplicator(max_bots=2)
+    deduplicator.add(1, 10)
+    deduplicator.add(2, 20)
+    deduplicator.add(1, 11)
+    deduplicator.add(3, 30)
+
+    assert deduplicator.is_duplicate(1, 10)
+    assert not deduplicator.is_duplicate(2, 20)
+    assert deduplicator.stats()["bots"] == 2
@@ -0,0 +1,161 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from bot.utils import DeletionNotifier
+from bot.utils.deletion_notifier import MESSAGE_LIMIT
+
+OWNER = 10
+OWNER_NAME = "Owner"
+PARTNER = 20
+PARTNER_NAME = "Partner"
+
+
+class FakeBot:
+    """Records every send with the time it started and the time it ended."""
+
+    def __init__(self, delay=0.0, flood_once=False):
+        self.id = 1
+        self.delay = delay
+        self.flood_once = flood_once
+        self.calls = []
+
+    async def _record(self, method, chat_id, **kwargs):
+        if self.flood_once:
+            self.flood_once = False
+            raise TelegramRetryAfter(method=SendMessage(chat_id=chat_id, text=""), message="flood", retry_after=0)
+        started = asyncio.get_running_loop().time()
+        await asyncio.sleep(self.delay)
+        self.calls.append((method, chat_id, kwargs, started, asyncio.get_running_loop().time()))
+
+    async def send_message(self, chat_id, **kwargs):
+        await self._record("send_message", chat_id, **kwargs)
+
+    async def send_photo(self, chat_id, **kwargs):
+        await self._record("send_photo", chat_id, **kwargs)
+
+    async def send_video(self, chat_id, **kwargs):
+        await self._record("send_video", chat_id, **kwargs)
+
+    async def send_voice(self, chat_id, **kwargs):
+        await self._record("send_voice", chat_id, **kwargs)
+
+    async def send_document(self, chat_id, **kwargs):
+        await self._record("send_document", chat_id, **kwargs)
+
+    async def send_media_group(self, chat_id, **kwargs):
+        await self._record("send_media_group", chat_id, **kwargs)
+
+    def methods(self):
+        return [call[0] for call in self.calls]
+
+
+def cached(message_id, text="hi", message_type="text", author=PARTNER_NAME, chat_id=PARTNER):
+    return SimpleNamespace(user_id=OWNER, chat_id=chat_id, message_id=message_id, user_full_name=author,
+                           text=text, message_type=message_type, additional_info=None, created_at=None)
+
+
+def report(bot, batches, chat_id=PARTNER, **kwargs):
+    """Add every batch of deleted messages to one notifier and wait for the reports."""
+    options = dict(window=0.05, send_interval=0)
+    options.update(kwargs)
+
+    async def run():
+        notifier = DeletionNotifier(**options)
+        for messages in batches:
+            notifier.add(bot, OWNER, chat_id, messages, owner_name=OWNER_NAME, chat_name=PARTNER_NAME)
+        await asyncio.sleep(options["window"] + 0.1)
+        return notifier
+
+    return asyncio.run(run())
+
+
+def test_deletions_in_one_window_become_one_report():
+    bot = FakeBot()
+    notifier = report(bot, [[cached(1)], [cached(2), cached(3)]])
+    assert bot.methods() == ["send_message"]
+    assert "Удалено сообщений: 3" in bot.calls[0][2]["text"]
+    assert (notifier.reports, notifier.api_calls, notifier.failed) == (1, 1, 0)
+
+
+def test_single_deletion_keeps_the_usual_notification():
+    bot = FakeBot()
+    report(bot, [[cached(1, text="only")]])
+    assert bot.methods() == ["send_message"]
+    assert "Это сообщение было удалено" in bot.calls[0][2]["text"]
+
+
+def test_long_reports_are_paged():
+    bot = FakeBot()
+    report(bot, [[cached(message_id, text="x" * 1000) for message_id in range(10)]])
+    pages = [call[2]["text"] for call in bot.calls]
+    assert len(pages) > 1
+    assert all(len(page) <= MESSAGE_LIMIT for page in pages)
+    assert sum(page.count("<blockquote>") for page in pages) == 10
+
+
+def test_many_texts_become_a_transcript():
+    bot = FakeBot()
+    notifier = report(bot, [[cached(message_id) for message_id in range(5)]], transcript_after=3)
+    assert bot.methods() == ["send_document"]
+    assert notifier.transcripts == 1
+
+
+def test_photos_and_videos_are_sent_as_media_groups():
+    bot = FakeBot()
+    media = [cached(message_id, text=f"file{message_id}", message_type="photo") for message_id in range(12)]
+    notifier = report(bot, [media + [cached(100, message_type="voice")]])
+    # 10 in a group, 2 in another, the voice message on its own
+    assert bot.methods() == ["send_media_group", "send_media_group", "send_voice"]
+    assert [len(call[2]["media"]) for call in bot.calls[:2]] == [10, 2]
+    assert notifier.media_groups == 2
+
+
+def test_flood_limit_on_a_single_deletion_is_waited_out():
+    bot = FakeBot(flood_once=True)
+    notifier = report(bot, [[cached(1)]])
+    assert bot.methods() == ["send_message"]
+    assert (notifier.api_calls, notifier.failed) == (1, 0)
+
+
+def test_flood_limit_in_a_report_is_waited_out():
+    bot = FakeBot(flood_once=True)
+    notifier = report(bot, [[cached(1), cached(2, message_type="voice")]])
+    assert bot.methods() == ["send_message", "send_voice"]
+    assert notifier.failed == 0
+
+
+def test_reports_to_one_owner_are_sent_one_at_a_time():
+    bot = FakeBot(delay=0.02)
+
+    async def run():
+        notifier = DeletionNotifier(window=0.05, send_interval=0.05)
+        for chat_id in (PARTNER, PARTNER + 1, PARTNER + 2):
+            notifier.add(bot, OWNER, chat_id, [cached(1, chat_id=chat_id), cached(2, chat_id=chat_id)],
+                         owner_name=OWNER_NAME)
+        await asyncio.sleep(1.0)
+        return notifier
+
+    notifier = asyncio.run(run())
+    calls = sorted(bot.calls, key=lambda call: call[3])
+    assert sorted(call[1] for call in calls) == [OWNER] * 3
+    # Each send starts send_interval after the previous one ended
+    for previous, call in zip(calls, calls[1:]):
+        assert call[3] - previous[4] >= 0.045
+    assert notifier._owner_locks == {}
+
+
+def test_report_names_the_chat_partner():
+    bot = FakeBot()
+    report(bot, [[cached(1, author=OWNER_NAME), cached(2, author=PARTNER_NAME)]])
+    header = bot.calls[0][2]["text"].split("\n\n")[0]
+    assert PARTNER_NAME in header and OWNER_NAME not in header
+
+
+def test_report_of_owner_messages_names_the_chat():
+    bot = FakeBot()
+    report(bot, [[cached(1, author=OWNER_NAME), cached(2, author=OWNER_NAME)]])
+    header = bot.calls[0][2]["text"].split("\n\n")[0]
+    assert PARTNER_NAME in header and OWNER_NAME not in header
@@ -0,0 +1,163 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from bot.webhook import PRIORITY_ANIMATION, PRIORITY_CACHE, PRIORITY_CAPTURE, PRIORITY_COMMAND, UpdateQueue
+from bot.webhook.ingress import update_priority
+
+
+class RecordingDispatcher:
+    """Stands in for a Dispatcher, records handled update ids."""
+
+    def __init__(self, delays=None):
+        self.delays = delays or {}
+        self.handled = []
+
+    async def feed_raw_update(self, bot, update, **data):
+        await asyncio.sleep(self.delays.get(update["update_id"], 0))
+        self.handled.append(update["update_id"])
+
+
+BOT = SimpleNamespace(id=1)
+
+
+def message(update_id, chat_id, text="hello"):
+    return {
+        "update_id": update_id,
+        "business_message": {
+            "message_id": update_id,
+            "business_connection_id": "connection",
+            "chat": {"id": chat_id},
+            "text": text,
+        },
+    }
+
+
+def deleted(update_id, chat_id):
+    return {
+        "update_id": update_id,
+        "deleted_business_messages": {
+            "business_connection_id": "connection",
+            "chat": {"id": chat_id},
+            "message_ids": [1],
+        },
+    }
+
+
+def test_updates_of_one_chat_keep_their_order():
+    async def run():
+        dispatcher = RecordingDispatcher(delays={0: 0.05, 1: 0.02})
+        queue = UpdateQueue(workers=4)
+        await queue.start()
+        for update_id in range(5):
+            assert queue.offer(dispatcher, BOT, message(update_id, chat_id=10), {})
+        await queue.stop()
+        return dispatcher.handled
+
+    assert asyncio.run(run()) == [0, 1, 2, 3, 4]
+
+
+def test_slow_chat_does_not_hold_other_chats():
+    async def run():
+        dispatcher = RecordingDispatcher(delays={0: 0.5})
+        queue = UpdateQueue(workers=2)
+        await queue.start()
+        queue.offer(dispatcher, BOT, message(0, chat_id=10), {})
+        queue.offer(dispatcher, BOT, message(1, chat_id=10), {})
+        for update_id in range(2, 6):
+            queue.offer(dispatcher, BOT, message(update_id, chat_id=20 + update_id), {})
+        await asyncio.sleep(0.1)
+        handled_early = list(dispatcher.handled)
+        await queue.stop()
+        return handled_early, dispatcher.handled
+
+    handled_early, handled = asyncio.run(run())
+    assert handled_early == [2, 3, 4, 5]
+    assert handled.index(0) < handled.index(1)
+
+
+def test_shed_animations_are_dropped_and_commands_deferred():
+    async def run():
+        dispatcher = RecordingDispatcher(delays={0: 0.05})
+        queue = UpdateQueue(workers=1, shed_thresholds={PRIORITY_ANIMATION: 1, PRIORITY_COMMAND: 1})
+        await queue.start()
+        assert queue.offer(dispatcher, BOT, message(0, chat_id=10), {})
+        assert queue.offer(dispatcher, BOT, message(1, chat_id=20, text=".love"), {})
+        assert queue.offer(dispatcher, BOT, message(2, chat_id=30, text=".help"), {})
+        # Behind its deferred command, although capture updates are never shed
+        assert queue.offer(dispatcher, BOT, deleted(3, chat_id=30), {})
+        stats = queue.stats()
+        await queue.stop()
+        return dispatcher.handled, stats
+
+    handled, stats = asyncio.run(run())
+    assert stats["shed"] == {"capture": 0, "cache": 0, "command": 1, "animation": 1}
+    assert stats["deferred_depth"] == 2
+    assert handled == [0, 2, 3]
+
+
+@pytest.mark.parametrize("text, priority", [
+    ("hello", PRIORITY_CACHE),
+    ("...", PRIORITY_CACHE),
+    ("./run.sh", PRIORITY_CACHE),
+    ("/shrug", PRIORITY_CACHE),
+    (".help", PRIORITY_COMMAND),
+    (".info", PRIORITY_COMMAND),
+    (".love", PRIORITY_ANIMATION),
+    ("/p hello", PRIORITY_ANIMATION),
+])
+def test_business_messages_are_commands_only_when_registered(text, priority):
+    assert update_priority(message(1, chat_id=10, text=text)) == priority
+
+
+def test_other_updates_are_classified():
+    assert update_priority(deleted(1, chat_id=10)) == PRIORITY_CAPTURE
+    assert update_priority({"update_id": 1, "message": {"text": "hello"}}) == PRIORITY_COMMAND
+
+
+def test_non_positive_defer_threshold_is_rejected():
+    with pytest.raises(ValueError):
+        UpdateQueue(shed_thresholds={PRIORITY_COMMAND: 0})
+
+
+def test_full_deferred_queue_refuses_updates():
+    queue = UpdateQueue(workers=1, shed_thresholds={PRIORITY_COMMAND: 1}, deferred_size=1)
+    dispatcher = RecordingDispatcher()
+    assert queue.offer(dispatcher, BOT, message(0, chat_id=10), {})
+    assert queue.offer(dispatcher, BOT, message(1, chat_id=20, text=".help"), {})
+    # Behind the deferred command, with no room left it has to be redelivered
+    assert not queue.offer(dispatcher, BOT, deleted(2, chat_id=20), {})
+    assert queue.stats()["dropped"] == 1
+
+
+def test_held_deferred_command_does_not_block_other_chats():
+    async def run():
+        dispatcher = RecordingDispatcher(delays={1: 0.3})
+        queue = UpdateQueue(workers=1, shed_thresholds={PRIORITY_COMMAND: 1, PRIORITY_CACHE: 3})
+        for update_id in range(3):
+            queue.offer(dispatcher, BOT, deleted(update_id, chat_id=10 + update_id), {})
+        queue.offer(dispatcher, BOT, message(3, chat_id=20, text=".help"), {})
+        queue.offer(dispatcher, BOT, message(4, chat_id=30), {})
+        await queue.start()
+        # Update 0 is done, the depth allows cache updates again but not commands
+        await asyncio.sleep(0.1)
+        deferred_depth = queue.stats()["deferred_depth"]
+        await queue.stop()
+        return deferred_depth, dispatcher.handled
+
+    deferred_depth, handled = asyncio.run(run())
+    assert deferred_depth == 1
+    assert sorted(handled) == [0, 1, 2, 3, 4]
+
+
+def test_full_queue_refuses_updates():
+    async def run():
+        dispatcher = RecordingDispatcher()
+        queue = UpdateQueue(maxsize=2, workers=1)
+        accepted = [queue.offer(dispatcher, BOT, message(update_id, chat_id=10), {}) for update_id in range(3)]
+        await queue.start()
+        await queue.stop()
+        return accepted, queue.stats()["dropped"]
+
+    assert asyncio.run(run()) == ([True, True, False], 1)
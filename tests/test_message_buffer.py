@@ -0,0 +1,204 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from bot.utils import MessageCacheBuffer, upsert_edited_message
+from db import Base, MessageCache, content_hash
+
+OWNER = 1
+CHAT = 2
+SENT_AT = datetime(2024, 5, 15, 12, 0)
+
+
+class GatedSessions:
+    """Session factory that can hold the first statement of its n-th session until released."""
+
+    def __init__(self, session_pool, gated=0, fail=False):
+        self.session_pool = session_pool
+        self.gated = gated
+        self.fail = fail
+        self.opened = 0
+        self.stalled = asyncio.Event()
+        self.release = asyncio.Event()
+
+    def __call__(self):
+        session = self.session_pool()
+        if self.opened == self.gated:
+            execute = session.execute
+
+            async def gated_execute(*args, **kwargs):
+                self.stalled.set()
+                await self.release.wait()
+                if self.fail:
+                    raise RuntimeError("database went away")
+                return await execute(*args, **kwargs)
+
+            session.execute = gated_execute
+        self.opened += 1
+        return session
+
+
+async def database(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'cache.db'}")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    return engine, async_sessionmaker(engine, expire_on_commit=False)
+
+
+def cached(message_id, text="v1", created_at=SENT_AT):
+    return MessageCache(user_id=OWNER, chat_id=CHAT, message_id=message_id, created_at=created_at,
+                        user_full_name="Partner", text=text, message_type="text",
+                        content_hash=content_hash(text))
+
+
+async def stored(session_pool):
+    async with session_pool() as session:
+        rows = await session.execute(
+            select(MessageCache.message_id, MessageCache.text, MessageCache.content_hash)
+            .order_by(MessageCache.message_id, MessageCache.created_at)
+        )
+        return [tuple(row) for row in rows]
+
+
+async def edit_stored(session_pool, message_id, text, created_at=SENT_AT):
+    async with session_pool() as session:
+        result = await upsert_edited_message(session, cached(message_id, text, created_at))
+        await session.commit()
+        return result
+
+
+def test_pending_rows_are_written_in_one_batch(tmp_path):
+    async def run():
+        engine, session_pool = await database(tmp_path)
+        buffer = MessageCacheBuffer(session_pool)
+        for message_id in range(3):
+            buffer.add(cached(message_id))
+        buffer.edit(OWNER, CHAT, 1, "v2")
+        buffer.discard(OWNER, CHAT, 2)
+        flushed = await buffer.flush()
+        rows = await stored(session_pool)
+        await engine.dispose()
+        return flushed, buffer.flushes, rows
+
+    flushed, flushes, rows = asyncio.run(run())
+    assert flushed and flushes == 1
+    assert rows == [(0, "v1", content_hash("v1")), (1, "v2", content_hash("v2"))]
+
+
+def test_edit_and_delete_during_flush_are_applied_after_it(tmp_path):
+    async def run():
+        engine, session_pool = await database(tmp_path)
+        gated = GatedSessions(session_pool)
+        buffer = MessageCacheBuffer(gated)
+        buffer.add(cached(1))
+        buffer.add(cached(2))
+        flush = asyncio.create_task(buffer.flush())
+        await asyncio.wait_for(gated.stalled.wait(), 5)
+        # The INSERT is on its way, both changes become followups
+        edited = buffer.edit(OWNER, CHAT, 1, "v2")
+        discarded = buffer.discard(OWNER, CHAT, 2)
+        gated.release.set()
+        flushed = await flush
+        rows = await stored(session_pool)
+        await engine.dispose()
+        return edited, discarded, flushed, buffer._followups, rows
+
+    edited, discarded, flushed, followups, rows = asyncio.run(run())
+    assert edited is not None and discarded is not None
+    assert flushed and followups == {}
+    assert rows == [(1, "v2", content_hash("v2"))]
+
+
+def test_followup_does_not_overwrite_a_newer_edit(tmp_path):
+    async def run():
+        engine, session_pool = await database(tmp_path)
+        # Hold the INSERT to queue the edit, then the followups to edit the row in between
+        inserting = GatedSessions(session_pool, gated=0)
+        following = GatedSessions(inserting, gated=1)
+        buffer = MessageCacheBuffer(following)
+        buffer.add(cached(1))
+        flush = asyncio.create_task(buffer.flush())
+        await asyncio.wait_for(inserting.stalled.wait(), 5)
+        buffer.edit(OWNER, CHAT, 1, "v2")
+        inserting.release.set()
+        await asyncio.wait_for(following.stalled.wait(), 5)
+        await edit_stored(session_pool, 1, "v3")
+        following.release.set()
+        flushed = await flush
+        rows = await stored(session_pool)
+        await engine.dispose()
+        return flushed, rows
+
+    flushed, rows = asyncio.run(run())
+    assert flushed
+    assert rows == [(1, "v3", content_hash("v3"))]
+
+
+def test_failed_flush_keeps_edits_and_drops_deleted_rows(tmp_path):
+    async def run():
+        engine, session_pool = await database(tmp_path)
+        gated = GatedSessions(session_pool, fail=True)
+        buffer = MessageCacheBuffer(gated)
+        buffer.add(cached(1))
+        buffer.add(cached(2))
+        flush = asyncio.create_task(buffer.flush())
+        await asyncio.wait_for(gated.stalled.wait(), 5)
+        buffer.edit(OWNER, CHAT, 1, "v2")
+        buffer.discard(OWNER, CHAT, 2)
+        gated.release.set()
+        failed = not await flush
+        pending = {key: message.text for key, message in buffer._pending.items()}
+        followups = dict(buffer._followups)
+        retried = await buffer.flush()
+        rows = await stored(session_pool)
+        await engine.dispose()
+        return failed, pending, followups, retried, rows
+
+    failed, pending, followups, retried, rows = asyncio.run(run())
+    assert failed and followups == {}
+    assert pending == {(OWNER, CHAT, 1): "v2"}
+    assert retried and rows == [(1, "v2", content_hash("v2"))]
+
+
+def test_upsert_inserts_a_message_that_is_not_cached(tmp_path):
+    async def run():
+        engine, session_pool = await database(tmp_path)
+        result = await edit_stored(session_pool, 1, "v2")
+        rows = await stored(session_pool)
+        await engine.dispose()
+        return result, rows
+
+    result, rows = asyncio.run(run())
+    assert result == (True, None)
+    assert rows == [(1, "v2", content_hash("v2"))]
+
+
+def test_upsert_skips_an_unchanged_text(tmp_path):
+    async def run():
+        engine, session_pool = await database(tmp_path)
+        await edit_stored(session_pool, 1, "v1")
+        result = await edit_stored(session_pool, 1, "v1")
+        await engine.dispose()
+        return result
+
+    assert asyncio.run(run()) == (False, "v1")
+
+
+def test_upsert_updates_the_newest_row_whatever_its_date(tmp_path):
+    async def run():
+        engine, session_pool = await database(tmp_path)
+        await edit_stored(session_pool, 1, "v1")
+        # The edit carries another date than the stored row, e.g. one the backfill set
+        result = await edit_stored(session_pool, 1, "v2", created_at=SENT_AT + timedelta(hours=1))
+        async with session_pool() as session:
+            dates = (await session.execute(select(MessageCache.created_at))).scalars().all()
+        rows = await stored(session_pool)
+        await engine.dispose()
+        return result, dates, rows
+
+    result, dates, rows = asyncio.run(run())
+    assert result == (True, "v1")
+    assert dates == [SENT_AT]
+    assert rows == [(1, "v2", content_hash("v2"))]
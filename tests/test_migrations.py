@@ -0,0 +1,15 @@
+from db.migrations import decode_legacy_message_id
+
+
+def test_message_id_follows_the_chat_id():
+    assert decode_legacy_message_id(123456789, 12345) == 6789
+    assert decode_legacy_message_id(int("-100123" + "42"), -100123) == 42
+
+
+def test_keys_of_another_chat_are_not_decoded():
+    assert decode_legacy_message_id(999456789, 12345) is None
+
+
+def test_keys_without_a_message_id_are_not_decoded():
+    assert decode_legacy_message_id(12345, 12345) is None
+    assert decode_legacy_message_id(123, 12345) is None
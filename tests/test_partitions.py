@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from db.partitions import DEFAULT_PARTITION, list_message_cache_partitions, partition_start
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeConnection:
+    """Answers the pg_inherits query with fixed (name, bound) rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, statement, parameters=None):
+        return FakeResult(self.rows)
+
+
+def test_partition_start_of_a_day():
+    assert partition_start(datetime(2024, 5, 15, 13, 45, 10, 500), "day") == datetime(2024, 5, 15)
+
+
+def test_partition_start_of_a_week_is_monday():
+    # 2024-05-15 is a Wednesday
+    assert partition_start(datetime(2024, 5, 15, 13, 45), "week") == datetime(2024, 5, 13)
+    assert partition_start(datetime(2024, 5, 13), "week") == datetime(2024, 5, 13)
+
+
+def test_partition_bounds_are_parsed():
+    connection = FakeConnection([
+        ("message_cache_p20240515",
+         "FOR VALUES FROM ('2024-05-15 00:00:00') TO ('2024-05-16 00:00:00')"),
+        (DEFAULT_PARTITION, "DEFAULT"),
+    ])
+
+    assert list_message_cache_partitions(connection) == [
+        ("message_cache_p20240515", datetime(2024, 5, 15), datetime(2024, 5, 16)),
+        (DEFAULT_PARTITION, None, None),
+    ]